@@ -0,0 +1,62 @@
+from django.db.models import Exists, OuterRef
+from django.http import Http404
+
+CREATED = 'created'
+EXISTS = 'exists'
+DELETED = 'deleted'
+NOT_FOUND = 'not_found'
+
+
+def parse_id(pk):
+    """Integer id from the URL, 404 for anything else."""
+    try:
+        return int(pk)
+    except ValueError:
+        raise Http404
+
+
+def add_links(model, user, field, targets, ids):
+    """Link user with the targets of ids, like favorites or follows.
+
+    One query reads the targets with an already linked flag and one
+    INSERT ... ON CONFLICT DO NOTHING inserts the new links, so concurrent
+    requests for the same link do not fail on the unique constraint.
+    Counters change by the links actually inserted.
+    Returns statuses by id and the found targets by id.
+    """
+    found = targets.annotate(linked=Exists(model.objects.filter(
+        user=user, **{field: OuterRef('pk')}))).in_bulk(ids)
+    statuses = {}
+    for pk in ids:
+        if pk not in found:
+            statuses[pk] = NOT_FOUND
+        elif found[pk].linked:
+            statuses[pk] = EXISTS
+        else:
+            statuses[pk] = CREATED
+    links = [
+        model(user=user, **{field: found[pk]})
+        for pk, status in statuses.items() if status == CREATED
+    ]
+    if links:
+        model.objects.insert_missing(links)
+    return statuses, found
+
+
+def remove_links(model, user, field, ids):
+    """Unlink user from the targets of ids with one DELETE.
+
+    Returns statuses by id.
+    """
+    attname = model._meta.get_field(field).attname
+    deleted = {
+        row[attname] for row in model.objects.filter(
+            user=user, **{f'{attname}__in': ids}
+        ).delete_returning(attname)
+    }
+    return {pk: DELETED if pk in deleted else NOT_FOUND for pk in ids}
+
+
+def get_statuses_data(statuses):
+    """Response body of bulk actions."""
+    return [{'id': pk, 'status': status} for pk, status in statuses.items()]
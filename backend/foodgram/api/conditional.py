@@ -0,0 +1,68 @@
+import hashlib
+import json
+
+from django.utils.cache import (get_conditional_response, patch_cache_control,
+                                patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+from recipes.versions import get_versions
+
+
+def make_etag(*parts):
+    """Strong ETag from JSON serializable validator parts."""
+    content = json.dumps(parts, default=str, sort_keys=True)
+    return quote_etag(hashlib.sha256(content.encode()).hexdigest()[:32])
+
+
+def query_params(request):
+    """Query params in canonical order for validators and cache keys."""
+    return sorted(
+        (key, sorted(values)) for key, values in request.query_params.lists())
+
+
+def get_table_versions(request):
+    """Table versions read once per request and shared by its consumers."""
+    if not hasattr(request, 'table_versions'):
+        request.table_versions = get_versions()
+    return request.table_versions
+
+
+class ConditionalGetMixin:
+    """Answer If-None-Match and If-Modified-Since before serialization.
+
+    Viewsets return validators from get_validators() for list and retrieve
+    actions: ETag parts and the last modification datetime, or None when
+    the request should be processed as usual. Parts must include everything
+    the representation depends on, including the requesting user for
+    per-user fields.
+    """
+
+    def get_validators(self, request):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, view, request, *args, **kwargs):
+        validators = self.get_validators(request)
+        if validators is None:
+            return view(request, *args, **kwargs)
+        parts, last_modified = validators
+        etag = make_etag(request.user.id, *parts)
+        timestamp = last_modified and int(last_modified.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp:
+                response['Last-Modified'] = http_date(timestamp)
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Authorization',))
+        return response
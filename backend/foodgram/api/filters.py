@@ -1,16 +1,24 @@
+from django.db.models import Q
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
 
-from recipes.models import Recipe, Tag
+from recipes.models import Recipe
+from users.models import User
+
+from .conditional import get_table_versions
+from .reference_data import tags_snapshot
+
+
+def get_tag_choices(request):
+    """Tag slugs from the snapshot, read only when tags are filtered."""
+    return [
+        (tag['slug'], tag['name'])
+        for tag in tags_snapshot.get(get_table_versions(request)).data
+    ]
 
 
 class RecipeFilter(filters.FilterSet):
     """Recipe' filter."""
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all()
-    )
+    tags = filters.MultipleChoiceFilter(field_name='tags__slug')
     is_favorited = filters.BooleanFilter(
         field_name='is_favorited',
         method='filter',
@@ -19,22 +27,58 @@ class RecipeFilter(filters.FilterSet):
         field_name='is_in_shopping_cart',
         method='filter',
     )
+    search = filters.CharFilter(method='filter_search')
+    ordering = filters.ChoiceFilter(
+        choices=(
+            ('popular', 'Популярные'),
+            ('trending', 'Популярные за последнее время'),
+        ),
+        method='filter_ordering',
+    )
 
     class Meta:
         model = Recipe
-        fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.request
+        if request is not None:
+            self.filters['tags'].extra['choices'] = (
+                lambda: get_tag_choices(request))
 
     def filter(self, queryset, name, value):
-        if name == 'is_in_shopping_cart' and value:
-            return queryset.filter(
-                cart__user=self.request.user
-            )
-        if name == 'is_favorited' and value:
-            return queryset.filter(
-                favorites__user=self.request.user
-            )
-
-
-class IngredientSearchFilter(SearchFilter):
-    """Ingredients' filter."""
-    search_param = 'name'
+        """Filtering by flags annotated in RecipeViewSet.get_queryset."""
+        if value:
+            return queryset.filter(**{name: True})
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        """Full-text search ranked by relevance."""
+        return queryset.search(value)
+
+    def filter_ordering(self, queryset, name, value):
+        """Ordering by decayed scores from update_recipe_scores."""
+        return queryset.order_by_score(value)
+
+
+class UserFilter(filters.FilterSet):
+    """User' filter."""
+    search = filters.CharFilter(method='filter_search')
+
+    class Meta:
+        model = User
+        fields = ['search']
+
+    def filter_search(self, queryset, name, value):
+        """Username, email, first name or last name prefix search.
+
+        Case-sensitive startswith is served by the LIKE indexes PostgreSQL
+        gets for the unique username and email columns and the indexed name
+        columns.
+        """
+        return queryset.filter(
+            Q(username__startswith=value) | Q(email__startswith=value)
+            | Q(first_name__startswith=value)
+            | Q(last_name__startswith=value))
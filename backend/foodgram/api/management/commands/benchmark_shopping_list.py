@@ -0,0 +1,75 @@
+import time
+import tracemalloc
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from api.shopping_list import STREAMS, get_purchases, render_pdf
+from recipes.models import Cart, Ingredient, IngredientInRecipe, Recipe
+from users.models import User
+
+
+def render(file_format, user):
+    """Full shopping list in file_format, as the view would send it."""
+    if file_format == 'pdf':
+        return render_pdf(list(get_purchases(user)))
+    stream = STREAMS[file_format][0]
+    return ''.join(stream(get_purchases(user).iterator()))
+
+
+class Command(BaseCommand):
+    """Command for comparing CPU time and memory of shopping list formats."""
+    help = ('Сравнение процессорного времени и пиковой памяти форматов '
+            'списка покупок. Тестовые данные создаются в транзакции, '
+            'которая затем откатывается.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[10, 100, 1000],
+            help='Число разных ингредиентов в списке покупок.')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"ingredients":>11} {"format":>6} {"cpu, ms":>9} '
+            f'{"peak, KiB":>10} {"size, KiB":>10}')
+        for size in options['sizes']:
+            with transaction.atomic():
+                user = self.create_cart(size)
+                for file_format in ('pdf', *STREAMS):
+                    self.measure(file_format, user, size, options['repeat'])
+                transaction.set_rollback(True)
+
+    def create_cart(self, size):
+        user = User.objects.create(
+            username='benchmark_shopping_list',
+            email='benchmark_shopping_list@example.com',
+        )
+        recipe = Recipe.objects.create(
+            author=user, name='Benchmark', text='Benchmark', cooking_time=1)
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(size)
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        Cart.objects.create(user=user, recipe=recipe)
+        return user
+
+    def measure(self, file_format, user, size, repeat):
+        render(file_format, user)
+        started = time.process_time()
+        for _ in range(repeat):
+            document = render(file_format, user)
+        cpu = (time.process_time() - started) / repeat
+        tracemalloc.start()
+        render(file_format, user)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if isinstance(document, str):
+            document = document.encode()
+        self.stdout.write(
+            f'{size:>11} {file_format:>6} {cpu * 1000:>9.2f} '
+            f'{peak / 1024:>10.1f} {len(document) / 1024:>10.1f}')
@@ -0,0 +1,82 @@
+import time
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api.shopping_list import get_digest, get_pdf, get_purchases
+from recipes.models import ShoppingListJob
+
+
+def claim_job():
+    """Mark the oldest pending job as running and return it.
+
+    Locked rows are skipped, so several workers can process the queue
+    concurrently.
+    """
+    with transaction.atomic():
+        job = ShoppingListJob.objects.select_for_update(
+            skip_locked=True
+        ).filter(status=ShoppingListJob.PENDING).order_by('created').first()
+        if job is None:
+            return None
+        job.status = ShoppingListJob.RUNNING
+        job.save(update_fields=('status', 'updated'))
+    return job
+
+
+def process_job(job):
+    """Render the job' shopping list and store it in job' file."""
+    try:
+        purchases = list(get_purchases(job.user))
+        job.digest = get_digest(purchases)
+        pdf = get_pdf(purchases, job.digest)
+        job.file.save(f'{job.id}.pdf', ContentFile(pdf), save=False)
+        job.status = ShoppingListJob.DONE
+    except Exception as error:
+        job.status = ShoppingListJob.FAILED
+        job.error = repr(error)
+    job.save()
+
+
+class Command(BaseCommand):
+    """Command for rendering queued shopping lists."""
+    help = ('Обработка очереди задач формирования списков покупок в PDF. '
+            'Можно запускать несколько экземпляров одновременно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Обработать текущую очередь и завершиться.')
+        parser.add_argument(
+            '--sleep', type=float, default=1,
+            help='Пауза в секундах при пустой очереди.')
+        parser.add_argument(
+            '--stale', type=int, default=300,
+            help='Через сколько секунд зависшая задача возвращается в '
+                 'очередь.')
+
+    def handle(self, *args, **options):
+        while True:
+            self.requeue_stale(options['stale'])
+            processed = 0
+            job = claim_job()
+            while job is not None:
+                process_job(job)
+                processed += 1
+                self.stdout.write(f'{job.id}: {job.get_status_display()}')
+                job = claim_job()
+            if options['once']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'Обработано задач: {processed}.'))
+                return
+            time.sleep(options['sleep'])
+
+    def requeue_stale(self, seconds):
+        """Return jobs of crashed workers to the queue."""
+        ShoppingListJob.objects.filter(
+            status=ShoppingListJob.RUNNING,
+            updated__lt=timezone.now() - timedelta(seconds=seconds),
+        ).update(status=ShoppingListJob.PENDING)
@@ -0,0 +1,23 @@
+from django.core.management import BaseCommand
+
+from api.response_cache import get_stats, reset_stats
+
+
+class Command(BaseCommand):
+    """Command for reporting the anonymous response cache hit rate."""
+    help = ('Число попаданий и промахов кеша ответов анонимным '
+            'пользователям. Учитывается доля запросов '
+            'RESPONSE_CACHE_STATS_RATE.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счетчики после вывода.')
+
+    def handle(self, *args, **options):
+        hits, misses, rate = get_stats()
+        self.stdout.write(
+            f'Попаданий: {hits}, промахов: {misses}, доля попаданий: '
+            f'{rate:.1%}.')
+        if options['reset']:
+            reset_stats()
@@ -1,6 +1,141 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from recipes.models import FeedEntry
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class RecipePagination(LimitPageNumberPagination):
+    """Page numbers by default, keyset pages when ?cursor= is given.
+
+    Keyset pages are ordered by (date, id) and filtered by the last key of
+    the previous page, so any depth costs one index range scan without
+    COUNT(*) and OFFSET. An empty cursor requests the first page. Cursors
+    with parameters that order the list differently are rejected instead
+    of silently reordering the list.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+    ordering_query_params = ('ordering', 'search')
+    ordering_cursor_message = (
+        'Параметр cursor нельзя использовать вместе с ordering и search.')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+        if any(request.query_params.get(param)
+               for param in self.ordering_query_params):
+            raise ValidationError(
+                {self.cursor_query_param: [self.ordering_cursor_message]})
+        self.request = request
+        size = self.get_page_size(request)
+        reverse, key = self.decode_cursor(
+            request.query_params[self.cursor_query_param])
+        if reverse:
+            queryset = queryset.order_by('-date', '-id')
+            if key is not None:
+                queryset = queryset.filter(
+                    Q(date__lt=key[0]) | Q(date=key[0], id__lt=key[1]))
+        else:
+            queryset = queryset.order_by('date', 'id')
+            if key is not None:
+                queryset = queryset.filter(
+                    Q(date__gt=key[0]) | Q(date=key[0], id__gt=key[1]))
+        return self.get_page(list(queryset[:size + 1]), size, reverse, key)
+
+    def get_page(self, rows, size, reverse, key):
+        """Page of rows read in the cursor direction with one extra row.
+
+        The extra row only tells whether there is a next page. Sets the
+        keys of the next and previous pages.
+        """
+        has_more = len(rows) > size
+        page = rows[:size]
+        if reverse:
+            page.reverse()
+        self.next_key = self.previous_key = None
+        if page and (has_more or reverse):
+            self.next_key = self.get_key(page[-1])
+        if page and (has_more or not reverse) and key is not None:
+            self.previous_key = self.get_key(page[0])
+        return page
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        return Response({
+            'next': self.get_cursor_link(self.next_key, False),
+            'previous': self.get_cursor_link(self.previous_key, True),
+            'results': data,
+        })
+
+    @staticmethod
+    def get_key(recipe):
+        return recipe.date, recipe.id
+
+    def get_cursor_link(self, key, reverse):
+        if key is None:
+            return None
+        cursor = '{}{}|{}'.format(
+            '-' if reverse else '', key[0].isoformat(), key[1])
+        url = remove_query_param(
+            self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(
+            url,
+            self.cursor_query_param,
+            urlsafe_b64encode(cursor.encode()).decode(),
+        )
+
+    def decode_cursor(self, cursor):
+        """Direction and (date, id) key of the cursor."""
+        if not cursor:
+            return False, None
+        try:
+            cursor = urlsafe_b64decode(cursor.encode()).decode()
+            reverse = cursor.startswith('-')
+            date, pk = cursor.lstrip('-').rsplit('|', 1)
+            date = parse_datetime(date)
+            pk = int(pk)
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return reverse, (date, pk)
+
+
+class FeedPagination(RecipePagination):
+    """Keyset pages of the following feed, newest first.
+
+    Keys of the page come from the feed table and from recipes of popular
+    authors, then the recipes are read by primary key. Pages are always
+    keyset, an absent cursor requests the first page.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = True
+        self.request = request
+        size = self.get_page_size(request)
+        reverse, key = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param, ''))
+        keys = self.get_page(
+            FeedEntry.objects.get_page_keys(
+                request.user, size + 1, key, newer=reverse),
+            size, reverse, key)
+        recipes = queryset.in_bulk([pk for _, pk in keys])
+        return [recipes[pk] for _, pk in keys if pk in recipes]
+
+    @staticmethod
+    def get_key(key):
+        return key
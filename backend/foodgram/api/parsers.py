@@ -0,0 +1,76 @@
+import json
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError, ValidationError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+from .serializers import IMAGE_TOO_LARGE_MESSAGE
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Stream uploaded files to a temporary file up to a size limit.
+
+    The upload is rejected as soon as the limit is exceeded, without reading
+    the rest of the body.
+    """
+
+    def __init__(self, max_size, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_size = max_size
+        self.received = 0
+
+    def new_file(self, *args, **kwargs):
+        self.received = 0
+        super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            self.file.close()
+            raise ValidationError({self.field_name: [
+                IMAGE_TOO_LARGE_MESSAGE.format(max_size=self.max_size)]})
+        return super().receive_data_chunk(raw_data, start)
+
+
+class JSONPartData(dict):
+    """Parsed JSON part that Request merges files into as single values.
+
+    A plain dict would take MultiValueDict values as lists.
+    """
+
+    def copy(self):
+        return JSONPartData(self)
+
+    def update(self, other=(), **kwargs):
+        if isinstance(other, MultiValueDict):
+            other = other.dict()
+        super().update(other, **kwargs)
+
+
+class RecipeMultiPartParser(MultiPartParser):
+    """multipart/form-data with files streamed to temporary files.
+
+    Files never stay in memory, whatever FILE_UPLOAD_MAX_MEMORY_SIZE is.
+    Other fields are sent either as form fields or as one JSON part named
+    data, which keeps nested ingredients in the shape of the JSON body.
+    Files are then merged into the parsed JSON object by Request.
+    """
+    json_field = 'data'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = parser_context['request']
+        request.upload_handlers = [
+            LimitedTemporaryFileUploadHandler(
+                settings.RECIPE_IMAGE_MAX_SIZE, request)]
+        result = super().parse(stream, media_type, parser_context)
+        if self.json_field not in result.data:
+            return result
+        try:
+            data = json.loads(result.data[self.json_field])
+        except ValueError as error:
+            raise ParseError(f'JSON parse error - {error}')
+        if not isinstance(data, dict):
+            raise ParseError('JSON part must be an object.')
+        return DataAndFiles(JSONPartData(data), result.files)
@@ -0,0 +1,118 @@
+import gzip
+import re
+import threading
+from collections import namedtuple
+
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from recipes.models import Ingredient, Tag
+from recipes.versions import INGREDIENTS, TAGS
+
+from .conditional import ConditionalGetMixin, get_table_versions, query_params
+from .serializers import IngredientSerializer, TagSerializer
+
+ACCEPTS_GZIP = re.compile(r'\bgzip\b')
+
+Snapshot = namedtuple('Snapshot', 'version data items content gzipped')
+
+
+class ReferenceSnapshot:
+    """Serialized reference table held in process memory.
+
+    The snapshot is rebuilt when the table version stored in the database
+    changes, so every process sees the change on its next request. The
+    version date is part of the key because a rolled back transaction can
+    reuse the version number.
+    """
+
+    def __init__(self, name, queryset, serializer_class):
+        self.name = name
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+        self.lock = threading.Lock()
+        self.snapshot = None
+
+    def get(self, table_versions):
+        version = table_versions.get(self.name, (0, None))
+        snapshot = self.snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self.lock:
+            if self.snapshot is None or self.snapshot.version != version:
+                self.snapshot = self.build(version)
+            return self.snapshot
+
+    def build(self, version):
+        data = list(
+            self.serializer_class(self.queryset.all(), many=True).data)
+        content = JSONRenderer().render(data)
+        return Snapshot(
+            version=version,
+            data=data,
+            items={item['id']: item for item in data},
+            content=content,
+            gzipped=gzip.compress(content),
+        )
+
+
+tags_snapshot = ReferenceSnapshot(TAGS, Tag.objects.all(), TagSerializer)
+ingredients_snapshot = ReferenceSnapshot(
+    INGREDIENTS, Ingredient.objects.all(), IngredientSerializer)
+
+
+def accepts_gzip(request):
+    return bool(ACCEPTS_GZIP.search(
+        request.META.get('HTTP_ACCEPT_ENCODING', '')))
+
+
+class ReferenceDataMixin(ConditionalGetMixin):
+    """Serve list and retrieve from a ReferenceSnapshot.
+
+    JSON lists are sent as the precomputed bytes, gzipped when the client
+    accepts it. Other formats, such as the browsable API, render the
+    snapshot data as usual.
+    """
+    snapshot = None
+
+    def get_snapshot(self, request):
+        return self.snapshot.get(get_table_versions(request))
+
+    def get_validators(self, request):
+        version, updated = get_table_versions(request).get(
+            self.snapshot.name, (0, None))
+        parts = (self.snapshot.name, version, updated, self.kwargs.get('pk'),
+                 query_params(request), accepts_gzip(request))
+        return parts, updated
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(self.list_snapshot, request)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.retrieve_snapshot, request, *args, **kwargs)
+
+    def list_snapshot(self, request):
+        snapshot = self.get_snapshot(request)
+        if request.accepted_renderer.format != 'json':
+            return Response(snapshot.data)
+        if accepts_gzip(request):
+            response = HttpResponse(
+                snapshot.gzipped, content_type='application/json')
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = HttpResponse(
+                snapshot.content, content_type='application/json')
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
+
+    def retrieve_snapshot(self, request, pk):
+        try:
+            item = self.get_snapshot(request).items.get(int(pk))
+        except ValueError:
+            item = None
+        if item is None:
+            raise Http404
+        return Response(item)
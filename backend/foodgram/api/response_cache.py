@@ -0,0 +1,108 @@
+import hashlib
+import json
+import random
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+from recipes import catalog
+
+from .conditional import query_params
+
+CACHE_ALIAS = 'responses'
+HITS_KEY = 'response_cache:hits'
+MISSES_KEY = 'response_cache:misses'
+CACHED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control',
+                  'Vary')
+
+
+def record(hit):
+    """Count a cache hit or miss, shared by all processes.
+
+    Only RESPONSE_CACHE_STATS_RATE of requests are counted, so that the
+    statistics do not cost a write to the shared cache per request.
+    """
+    if random.random() >= settings.RESPONSE_CACHE_STATS_RATE:
+        return
+    key = HITS_KEY if hit else MISSES_KEY
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def get_stats():
+    """Hits, misses and hit rate since the last reset."""
+    stats = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = stats.get(HITS_KEY, 0), stats.get(MISSES_KEY, 0)
+    total = hits + misses
+    return hits, misses, hits / total if total else 0
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+class AnonymousCacheMixin:
+    """Serve anonymous list and retrieve responses from the response cache.
+
+    For anonymous users the representation depends only on the query string
+    and the data, so the rendered JSON is cached under a key with the catalog
+    version. A catalog change makes old entries unreachable, they expire or
+    are culled by the cache backend on MAX_ENTRIES.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_cache_key(self, request):
+        content = json.dumps(
+            [self.action, self.kwargs, query_params(request)],
+            sort_keys=True,
+        )
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        return f'recipes:{catalog.get_version()}:{digest}'
+
+    def cached_response(self, view, request, *args, **kwargs):
+        if (not request.user.is_anonymous
+                or request.accepted_renderer.format != 'json'):
+            return view(request, *args, **kwargs)
+        response_cache = caches[CACHE_ALIAS]
+        key = self.get_cache_key(request)
+        cached = response_cache.get(key)
+        record(cached is not None)
+        if cached is None:
+            response = view(request, *args, **kwargs)
+            response['X-Cache'] = 'MISS'
+            if response.status_code == 200:
+                response.add_post_render_callback(
+                    lambda rendered: response_cache.set(key, (
+                        rendered.content,
+                        {header: rendered[header]
+                         for header in CACHED_HEADERS if header in rendered},
+                    ))
+                )
+            return response
+        content, headers = cached
+        response = get_conditional_response(
+            request,
+            etag=headers.get('ETag'),
+            last_modified=parse_http_date_safe(
+                headers.get('Last-Modified', '')),
+        )
+        if response is None:
+            response = HttpResponse(content)
+        else:
+            headers = dict(headers)
+            headers.pop('Content-Type', None)
+        for header, value in headers.items():
+            response[header] = value
+        response['X-Cache'] = 'HIT'
+        return response
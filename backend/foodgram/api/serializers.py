@@ -1,13 +1,24 @@
-from django.shortcuts import get_object_or_404
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 from rest_framework.validators import UniqueTogetherValidator
 from rest_framework.serializers import ValidationError
 
+from recipes import search, similarity
+from recipes.images import SIZES
 from recipes.models import (Follow, Ingredient, IngredientInRecipe, Recipe,
-                            Tag)
+                            ShoppingListJob, Tag)
 from users.models import User
 
+RECIPES_LIMIT_MAX = 50
+BULK_IDS_MAX = 100
+IMAGE_TOO_LARGE_MESSAGE = 'Размер изображения больше {max_size} байт.'
+IMAGE_TOO_WIDE_MESSAGE = 'Сторона изображения больше {max_side} пикселей.'
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Users' serializer."""
@@ -15,12 +26,16 @@ class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
-                  'is_subscribed',)
+                  'is_subscribed', 'recipes_count', 'followers_count',
+                  'following_count')
         model = User
-        read_only_fields = 'is_subscribed',
+        read_only_fields = ('is_subscribed', 'recipes_count',
+                            'followers_count', 'following_count')
 
     def get_is_subscribed(self, obj):
         '''Checking if user is subscribed.'''
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         user = self.context.get('request').user
         if user.is_anonymous or user == obj:
             return False
@@ -60,6 +75,9 @@ class IngredientSerializer(serializers.ModelSerializer):
     class Meta:
         fields = ('id', 'name', 'measurement_unit',)
         model = Ingredient
+        validators = [UniqueTogetherValidator(
+            queryset=Ingredient.objects.all(),
+            fields=['name', 'measurement_unit'])]
 
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
@@ -77,6 +95,78 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
             fields=['ingredient', 'recipe'])]
 
 
+def build_media_url(context, name):
+    """Absolute URL of a media file when the request is in the context."""
+    url = Recipe._meta.get_field('image').storage.url(name)
+    request = context.get('request')
+    if request is None:
+        return url
+    return request.build_absolute_uri(url)
+
+
+class RecipeImageField(Base64ImageField):
+    """Base64 string or uploaded file input, original or resized JPEG URL
+    output.
+
+    Input is limited by RECIPE_IMAGE_MAX_SIZE bytes and RECIPE_IMAGE_MAX_SIDE
+    pixels. ?image_size= with a key of recipes.images.SIZES selects the
+    variant. Recipes without generated variants keep the original URL.
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            image = serializers.ImageField.to_internal_value(self, data)
+        else:
+            image = super().to_internal_value(data)
+        if image is None:
+            return image
+        if image.size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise ValidationError(IMAGE_TOO_LARGE_MESSAGE.format(
+                max_size=settings.RECIPE_IMAGE_MAX_SIZE))
+        if max(image.image.size) > settings.RECIPE_IMAGE_MAX_SIDE:
+            raise ValidationError(IMAGE_TOO_WIDE_MESSAGE.format(
+                max_side=settings.RECIPE_IMAGE_MAX_SIDE))
+        return image
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        size = request and request.query_params.get('image_size')
+        if not value or size not in SIZES:
+            return super().to_representation(value)
+        name = get_image_variants(value.instance).get(size, {}).get('jpeg')
+        if name is None:
+            return super().to_representation(value)
+        return build_media_url(self.context, name)
+
+
+def get_image_variants(recipe):
+    """Variants of the current recipe image, empty until generated."""
+    variants = recipe.image_variants
+    if not recipe.image or variants.get('source') != recipe.image.name:
+        return {}
+    return variants
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URLs of image variants by size and format, null until generated for
+    the current image."""
+
+    def __init__(self, **kwargs):
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, value):
+        variants = get_image_variants(value)
+        if not variants:
+            return None
+        return {
+            size: {
+                fmt: build_media_url(self.context, name)
+                for fmt, name in variants[size].items()
+            }
+            for size in SIZES if size in variants
+        }
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     """Recipe' serializer."""
     tags = TagSerializer(many=True)
@@ -85,27 +175,33 @@ class RecipeSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    image = RecipeImageField()
+    images = ImageVariantsField()
 
     class Meta:
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'images', 'text',
+                  'cooking_time', 'favorites_count', 'in_carts_count')
+        read_only_fields = ('favorites_count', 'in_carts_count')
         model = Recipe
 
     def get_is_favorited(self, obj):
         """Checking if recipe is favorited."""
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
-        return Recipe.objects.filter(favorites__user=user, id=obj.id).exists()
+        return obj.favorites.filter(user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
         """Checking if recipe is in shoping cart. """
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         user = self.context.get('request').user
-        if user.is_anonymous or not user.carts.exists():
+        if user.is_anonymous:
             return False
-        return Recipe.objects.filter(cart__user=user, id=obj.id).exists()
+        return obj.cart.filter(user=user).exists()
 
 
 class IngredientPostSerializer(serializers.ModelSerializer):
@@ -120,7 +216,7 @@ class IngredientPostSerializer(serializers.ModelSerializer):
 
 class RecipePostSerializer(serializers.ModelSerializer):
     """POST/PATCH for Recipes."""
-    image = Base64ImageField()
+    image = RecipeImageField()
     ingredients = IngredientPostSerializer(many=True)
     tags = serializers.ListField(child=serializers.IntegerField(min_value=1))
 
@@ -129,105 +225,185 @@ class RecipePostSerializer(serializers.ModelSerializer):
         fields = ('id', 'tags', 'author', 'ingredients', 'name', 'image',
                   'text', 'cooking_time')
 
-    def check_double_item(self, data):
-        validated_items = []
-        for item in data:
-            if item in validated_items:
-                raise ValidationError('Ошибка оригинальности поля')
-            validated_items.append(item)
-
-    def validate(self, data):
-        tags = data.get('tags')
-        ingredients = data.get('ingredients')
-        ingredients_id = [i['id'] for i in ingredients]
-        self.check_double_item(tags)
-        self.check_double_item(ingredients_id)
-        data['tags'] = tags
-        data['ingredients'] = ingredients
-        return data
-
-    def create_ingredients_in_recipe(self, ingredients, recipe):
-        new_ingredients = [
-            IngredientInRecipe(
-                recipe=recipe,
-                ingredient=get_object_or_404(
-                    Ingredient,
-                    id=ingredient['id'],
-                ),
-                amount=ingredient['amount'],
-            )
+    def check_unique(self, ids):
+        """Error listing ids given more than once."""
+        duplicates = sorted(
+            pk for pk, count in Counter(ids).items() if count > 1)
+        if duplicates:
+            raise ValidationError(
+                f'Повторяющиеся id: {", ".join(map(str, duplicates))}.')
+
+    def check_existing(self, model, ids):
+        """Error listing ids missing in the model, one query for all."""
+        missing = sorted(set(ids) - model.objects.in_bulk(ids).keys())
+        if missing:
+            raise ValidationError(
+                f'Не найдены id: {", ".join(map(str, missing))}.')
+
+    def validate_tags(self, tags):
+        self.check_unique(tags)
+        self.check_existing(Tag, tags)
+        return tags
+
+    def validate_ingredients(self, ingredients):
+        ids = [ingredient['id'] for ingredient in ingredients]
+        self.check_unique(ids)
+        self.check_existing(Ingredient, ids)
+        return ingredients
+
+    def set_ingredients(self, recipe, ingredients, created=False):
+        """Insert, update and delete only the changed ingredient rows.
+
+        Existing rows come from the prefetch of RecipeViewSet.get_queryset.
+        """
+        amounts = {
+            ingredient['id']: ingredient['amount']
             for ingredient in ingredients
-        ]
-        IngredientInRecipe.objects.bulk_create(objs=new_ingredients)
+        }
+        existing = {} if created else {
+            row.ingredient_id: row
+            for row in recipe.ingredientinrecipe_set.all()
+        }
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            IngredientInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        changed = []
+        for pk, row in existing.items():
+            if pk in amounts and row.amount != amounts[pk]:
+                row.amount = amounts[pk]
+                changed.append(row)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        IngredientInRecipe.objects.bulk_create([
+            IngredientInRecipe(
+                recipe=recipe, ingredient_id=pk, amount=amount)
+            for pk, amount in amounts.items() if pk not in existing
+        ])
 
     def create(self, validated_data):
-        """Creating new recipe and relations ingredients in recipe."""
+        """Creating new recipe and relations ingredients in recipe.
+
+        Runs in the transaction of RecipeViewSet.perform_create. The search
+        vector is computed once, after the ingredients are written, and
+        the recipe is queued once for the similar recipes refresh.
+        """
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
-        self.create_ingredients_in_recipe(
-            ingredients=ingredients,
-            recipe=recipe,
-        )
-        recipe.tags.set(tags)
+        with similarity.deferred():
+            with search.deferred():
+                recipe = Recipe.objects.create(**validated_data)
+                self.set_ingredients(recipe, ingredients, created=True)
+            recipe.tags.add(*tags)
         return recipe
 
     def update(self, instance, validated_data):
-        """Updating recipe and relations ingredients in recipe."""
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        instance.tags.clear()
-        IngredientInRecipe.objects.filter(recipe=instance).delete()
-        self.create_ingredients_in_recipe(
-            ingredients=ingredients,
-            recipe=instance,
-        )
-        instance.tags.set(tags)
-        return super().update(instance, validated_data)
+        """Updating recipe and only changed relations.
+
+        Runs in the transaction of RecipeViewSet.perform_update. The search
+        vector is computed once for the recipe and ingredient changes.
+        Changed ingredients or tags queue the similar recipes refresh once.
+        """
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        with similarity.deferred(), search.deferred():
+            if ingredients is not None:
+                self.set_ingredients(instance, ingredients)
+            if tags is not None:
+                instance.tags.set(tags)
+            return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        """Saved recipe read back with the annotations and prefetches of
+        the recipe list."""
+        user = self.context['request'].user
+        instance = Recipe.objects.with_user_flags(user).with_related(
+            user).get(pk=instance.pk)
         return RecipeSerializer(instance, context=self.context).data
 
 
 class CartSerializer(serializers.ModelSerializer):
     """Cart' serializer."""
-    image = Base64ImageField()
+    image = RecipeImageField()
+    images = ImageVariantsField()
 
     class Meta:
-        fields = ('id', 'name', 'image', 'cooking_time',)
+        fields = ('id', 'name', 'image', 'images', 'cooking_time',)
         model = Recipe
 
 
 class FollowSerializer(serializers.ModelSerializer):
-    """Follow' serializer."""
+    """Follow' serializer.
+
+    Expects follows from UserViewSet.get_follows with author' recipes
+    prefetched to recipes_preview.
+    """
     email = serializers.ReadOnlyField(source='author.email')
     id = serializers.ReadOnlyField(source='author.id')
     username = serializers.ReadOnlyField(source='author.username')
     first_name = serializers.ReadOnlyField(source='author.first_name')
     last_name = serializers.ReadOnlyField(source='author.last_name')
-    is_subscribed = serializers.ReadOnlyField(source='author.is_subscribed')
+    is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.ReadOnlyField(source='author.recipes_count')
 
     class Meta:
         model = Follow
         fields = ('id', 'email', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count')
 
+    def get_is_subscribed(self, obj):
+        """Follow exists, so its user is subscribed."""
+        return obj.user_id == self.context.get('request').user.id
+
     def get_recipes(self, obj):
-        """All users' recipes with limit."""
-        request = self.context.get('request')
-        recipes_limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj.author)
-        if recipes_limit:
-            recipes = recipes[:int(recipes_limit)]
-        serializer = CartSerializer(recipes, many=True)
+        """Users' recipes with limit."""
+        serializer = CartSerializer(
+            obj.author.recipes_preview, many=True, context=self.context)
         return serializer.data
 
-    def get_recipes_count(self, obj):
-        """Recipe' count."""
-        return Recipe.objects.filter(author=obj.author).count()
+
+class SubscriptionsParamsSerializer(serializers.Serializer):
+    """Query params of subscriptions."""
+    recipes_limit = serializers.IntegerField(
+        min_value=0,
+        required=False,
+        default=RECIPES_LIMIT_MAX,
+    )
+
+    def validate_recipes_limit(self, value):
+        return min(value, RECIPES_LIMIT_MAX)
+
+
+class BulkIdsSerializer(serializers.Serializer):
+    """Body of bulk favorite, shopping cart and subscribe actions."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=BULK_IDS_MAX,
+    )
+
+    def validate_ids(self, value):
+        return list(dict.fromkeys(value))
+
+
+class ShoppingListJobSerializer(serializers.ModelSerializer):
+    """Shopping list rendering job' serializer."""
+    file = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ShoppingListJob
+        fields = ('id', 'status', 'error', 'created', 'file')
+
+    def get_file(self, obj):
+        """Download link of the rendered PDF."""
+        if obj.status != ShoppingListJob.DONE:
+            return None
+        return reverse(
+            'api:recipes-shopping-cart-job-file',
+            kwargs={'job_id': obj.id},
+            request=self.context.get('request'),
+        )
 
 
 class SetPasswordSerializer(serializers.ModelSerializer):
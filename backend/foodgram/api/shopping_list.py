@@ -0,0 +1,190 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from reportlab.lib import colors
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import IngredientInRecipe
+
+FONT_NAME = 'GOST'
+FONT_PATH = os.path.join(settings.BASE_DIR, 'GOST type A.ttf')
+# Bump when the PDF layout changes to drop previously cached documents.
+RENDER_VERSION = 1
+CACHE_TIMEOUT = 60 * 60 * 24
+RENDER_TIMEOUT = 30
+TOP = 700
+BOTTOM = 50
+LINE_HEIGHT = 25
+
+_fonts_lock = threading.Lock()
+_fonts_registered = False
+# Locks live while some thread holds a reference to them, a caller arriving
+# while others wait gets the same lock.
+_render_locks = weakref.WeakValueDictionary()
+_render_locks_lock = threading.Lock()
+
+
+def register_fonts():
+    """Register fonts once per process."""
+    global _fonts_registered
+    if _fonts_registered:
+        return
+    with _fonts_lock:
+        if not _fonts_registered:
+            pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH, 'UTF-8'))
+            _fonts_registered = True
+
+
+def get_purchases(user):
+    """Ingredients from user' cart summed by name and measurement unit."""
+    return IngredientInRecipe.objects.filter(
+        recipe__cart__user=user
+    ).values(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+    ).annotate(
+        amount_in_cart=Sum('amount')
+    ).order_by('ingredient__name', 'ingredient__measurement_unit')
+
+
+def get_digest(purchases):
+    """Hash of cart content used as ETag and cache key."""
+    rows = [
+        (row['ingredient__name'], row['ingredient__measurement_unit'],
+         row['amount_in_cart'])
+        for row in purchases
+    ]
+    content = json.dumps([RENDER_VERSION, rows], ensure_ascii=False)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def render_pdf(purchases):
+    """Render shopping list to PDF bytes."""
+    register_fonts()
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer)
+    pdf.setFont(FONT_NAME, 40)
+    pdf.setFillColor(colors.black)
+    pdf.drawCentredString(300, 770, 'Список покупок')
+    pdf.setFont(FONT_NAME, 24)
+    height = TOP
+    for row in purchases:
+        if height < BOTTOM:
+            pdf.showPage()
+            pdf.setFont(FONT_NAME, 24)
+            height = TOP
+        pdf.drawString(
+            60,
+            height,
+            f"- {row['ingredient__name']} "
+            f"({row['ingredient__measurement_unit']}) - "
+            f"{row['amount_in_cart']}"
+        )
+        height -= LINE_HEIGHT
+    pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def _render_lock(digest):
+    with _render_locks_lock:
+        return _render_locks.setdefault(digest, threading.Lock())
+
+
+def get_pdf(purchases, digest):
+    """Cached PDF for cart content.
+
+    Identical concurrent requests are coalesced: threads of one process wait
+    on a lock, other processes wait for the document rendered by the process
+    holding the lock in the cache.
+    """
+    key = f'shopping_list:pdf:{digest}'
+    pdf = cache.get(key)
+    if pdf is not None:
+        return pdf
+    with _render_lock(digest):
+        return _render_once(key, purchases)
+
+
+def _render_once(key, purchases):
+    """Render unless the document appeared in the cache meanwhile."""
+    pdf = cache.get(key)
+    if pdf is not None:
+        return pdf
+    lock_key = f'{key}:lock'
+    token = uuid.uuid4().hex
+    acquired = cache.add(lock_key, token, RENDER_TIMEOUT)
+    if not acquired:
+        deadline = time.monotonic() + RENDER_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(0.1)
+            pdf = cache.get(key)
+            if pdf is not None:
+                return pdf
+    try:
+        pdf = render_pdf(purchases)
+        cache.set(key, pdf, CACHE_TIMEOUT)
+    finally:
+        # The lock of another process, or ours taken over after it expired,
+        # is left to its owner.
+        if acquired and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+    return pdf
+
+
+class Echo:
+    """File-like object returning written value for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def stream_txt(purchases):
+    yield 'Список покупок\n\n'
+    for row in purchases:
+        yield (f"- {row['ingredient__name']} "
+               f"({row['ingredient__measurement_unit']}) - "
+               f"{row['amount_in_cart']}\n")
+
+
+def stream_csv(purchases):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for row in purchases:
+        yield writer.writerow((
+            row['ingredient__name'],
+            row['ingredient__measurement_unit'],
+            row['amount_in_cart'],
+        ))
+
+
+def stream_json(purchases):
+    separator = '['
+    for row in purchases:
+        yield separator + json.dumps({
+            'name': row['ingredient__name'],
+            'measurement_unit': row['ingredient__measurement_unit'],
+            'amount': row['amount_in_cart'],
+        }, ensure_ascii=False)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+# Streamed formats: generator, content type and file name.
+STREAMS = {
+    'txt': (stream_txt, 'text/plain; charset=utf-8', 'shoping_list.txt'),
+    'csv': (stream_csv, 'text/csv; charset=utf-8', 'shoping_list.csv'),
+    'json': (stream_json, 'application/json', 'shoping_list.json'),
+}
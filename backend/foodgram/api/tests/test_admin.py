@@ -0,0 +1,69 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import (Cart, Favorite, Follow, Ingredient,
+                            IngredientInRecipe, Recipe, Tag)
+from users.models import User
+
+CHANGELISTS = ('tag', 'ingredient', 'recipe', 'ingredientinrecipe', 'follow',
+               'favorite', 'cart', 'shoppinglistjob')
+# Session, user, the page, its count and list filter choices: changelists must
+# not query once per row or load whole related tables for filters.
+CHANGELIST_QUERIES = 6
+
+
+class AdminChangelistTest(TestCase):
+    """Admin changelists of large tables."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@foodgram.ru', password='admin')
+        users = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@foodgram.ru')
+            for i in range(10)
+        )
+        tag = Tag.objects.create(name='tag', color='#49B64E', slug='tag')
+        ingredient = Ingredient.objects.create(
+            name='ингредиент', measurement_unit='г')
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=user, name=f'Рецепт {i}', text='Текст',
+                   image='recipe.jpg', cooking_time=10)
+            for i, user in enumerate(users)
+        )
+        for recipe in recipes:
+            recipe.tags.add(tag)
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient,
+                               amount=1)
+            for recipe in recipes
+        )
+        for model in (Favorite, Cart):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe)
+                for user, recipe in zip(users, recipes)
+            )
+        Follow.objects.bulk_create(
+            Follow(user=users[0], author=author) for author in users[1:])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelists(self):
+        pages = [f'/admin/recipes/{name}/' for name in CHANGELISTS]
+        pages.append('/admin/users/user/')
+        for page in pages:
+            for url in (page, f'{page}?q=user'):
+                with self.subTest(url=url):
+                    with CaptureQueriesContext(connection) as context:
+                        response = self.client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertLessEqual(
+                        len(context.captured_queries), CHANGELIST_QUERIES)
+
+    def test_recipe_change_page(self):
+        recipe = Recipe.objects.first()
+        response = self.client.get(
+            f'/admin/recipes/recipe/{recipe.id}/change/')
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,102 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Cart, Favorite, Follow, Recipe
+from users.models import User
+
+
+class BulkActionsTest(TestCase):
+    """Bulk favorite, shopping cart and subscribe actions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader', email='reader@foodgram.ru')
+        cls.authors = User.objects.bulk_create(
+            User(username=f'author{i}', email=f'author{i}@foodgram.ru')
+            for i in range(3)
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.authors[0], name=f'Рецепт {i}', text='Текст',
+                image='recipe.jpg', cooking_time=10)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def send(self, method, url, ids):
+        response = getattr(self.client, method)(
+            url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return {item['id']: item['status'] for item in response.json()}
+
+    def test_recipes(self):
+        ids = [recipe.id for recipe in self.recipes]
+        for url, model, field in (
+            ('/api/recipes/favorite/', Favorite, 'favorites_count'),
+            ('/api/recipes/shopping_cart/', Cart, 'in_carts_count'),
+        ):
+            with self.subTest(url=url):
+                model.objects.create(user=self.user, recipe=self.recipes[0])
+                self.assertEqual(
+                    self.send('post', url, [*ids, ids[1], 900]),
+                    {ids[0]: 'exists', ids[1]: 'created',
+                     ids[2]: 'created', 900: 'not_found'})
+                self.assertEqual(
+                    model.objects.filter(user=self.user).count(), 3)
+                self.assertEqual(
+                    set(Recipe.objects.values_list(field, flat=True)), {1})
+                self.assertEqual(
+                    self.send('delete', url, [ids[0], ids[1], 900]),
+                    {ids[0]: 'deleted', ids[1]: 'deleted',
+                     900: 'not_found'})
+                self.assertEqual(
+                    list(Recipe.objects.order_by('pk').values_list(
+                        field, flat=True)), [0, 0, 1])
+
+    def test_subscribe(self):
+        ids = [author.id for author in self.authors]
+        self.assertEqual(
+            self.send('post', '/api/users/subscribe/', [*ids, self.user.id]),
+            {**dict.fromkeys(ids, 'created'), self.user.id: 'not_found'})
+        self.assertEqual(
+            self.send('post', '/api/users/subscribe/', ids[:1]),
+            {ids[0]: 'exists'})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 3)
+        self.assertEqual(
+            self.send('delete', '/api/users/subscribe/', ids[:2]),
+            dict.fromkeys(ids[:2], 'deleted'))
+        self.assertEqual(
+            list(Follow.objects.values_list('author_id', flat=True)),
+            ids[2:])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 1)
+
+    def test_single_actions(self):
+        recipe = self.recipes[0]
+        url = f'/api/recipes/{recipe.id}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assertEqual(
+            self.client.post('/api/recipes/900/favorite/').status_code, 404)
+        url = f'/api/users/{self.authors[1].id}/subscribe/'
+        self.assertEqual(self.client.post(url).status_code, 200)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assertEqual(
+            self.client.post(
+                f'/api/users/{self.user.id}/subscribe/').status_code, 400)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+
+    def test_invalid_body(self):
+        for ids in ([], ['x'], [0], list(range(1, 102))):
+            with self.subTest(ids=ids):
+                response = self.client.post(
+                    '/api/recipes/favorite/', {'ids': ids}, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Favorite.objects.exists())
@@ -0,0 +1,160 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.core.management import CommandError, call_command
+from django.db.models import F, Sum
+from django.test import TestCase
+from django.utils import timezone
+
+from recipes.management.commands.load_csv_data import read_json_array
+from recipes.models import (Cart, Favorite, FeedEntry, Follow, Ingredient,
+                            IngredientInRecipe, Recipe, RecipeScore, Tag)
+from users.models import User
+
+
+class LoadCsvDataTest(TestCase):
+    """Ingredients loading with upsert, replace and dry run."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(cls.directory, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, path, *args):
+        call_command(
+            'load_csv_data', '--path', path, *args, stdout=io.StringIO())
+
+    def get_rows(self):
+        return set(Ingredient.objects.values_list(
+            'name', 'measurement_unit'))
+
+    def test_upsert_is_idempotent(self):
+        """Duplicates and rows without a name are skipped, existing
+        ingredients keep their ids."""
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        path = self.write('ingredients.csv', (
+            'name,measurement_unit\n'
+            'соль,г\n'
+            'мука,г\n'
+            'мука,г\n'
+            'молоко,мл\n'
+            ',г\n'
+        ))
+        for _ in range(2):
+            self.load(path, '--batch-size', '2')
+            self.assertEqual(Ingredient.objects.count(), 3)
+        self.assertEqual(
+            self.get_rows(), {('соль', 'г'), ('мука', 'г'), ('молоко', 'мл')})
+        self.assertTrue(Ingredient.objects.filter(pk=salt.pk).exists())
+
+    def test_json(self):
+        path = self.write('ingredients.json', json.dumps([
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'мука'},
+        ], ensure_ascii=False))
+        self.load(path)
+        self.assertEqual(self.get_rows(), {('соль', 'г')})
+
+    def test_json_read_in_chunks(self):
+        rows = [{'name': 'соль, [крупная]', 'amount': 12345}, {}, [1, 2]]
+        self.assertEqual(list(read_json_array(
+            io.StringIO(json.dumps(rows, indent=2)), chunk_size=3)), rows)
+        self.assertEqual(list(read_json_array(io.StringIO(' [ ] '))), [])
+        for content in ('{}', '[{}', '[{} {}]'):
+            with self.assertRaises(CommandError):
+                list(read_json_array(io.StringIO(content), chunk_size=2))
+
+    def test_backslashes_kept(self):
+        """Names with backslashes and the COPY null marker are loaded as
+        written."""
+        path = self.write('ingredients.json', json.dumps([
+            {'name': '\\N', 'measurement_unit': 'г'},
+            {'name': 'соль\\t', 'measurement_unit': '\\'},
+        ]))
+        self.load(path)
+        self.assertEqual(
+            self.get_rows(), {('\\N', 'г'), ('соль\\t', '\\')})
+
+    def test_dry_run(self):
+        path = self.write('ingredients.csv', 'name,measurement_unit\nсоль,г\n')
+        self.load(path, '--dry-run')
+        self.assertFalse(Ingredient.objects.exists())
+
+    def test_replace(self):
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+        path = self.write('ingredients.csv', 'name,measurement_unit\nсоль,г\n')
+        self.load(path, '--mode', 'replace', '--noinput')
+        self.assertEqual(self.get_rows(), {('соль', 'г')})
+
+    def test_missing_file(self):
+        with self.assertRaises(CommandError):
+            self.load(os.path.join(self.directory, 'missing.csv'))
+
+
+class GenerateFakeDataTest(TestCase):
+    """Fake data generation with consistent counters and derived tables."""
+
+    def generate(self, **options):
+        call_command(
+            'generate_fake_data', users=5, tags=3, recipes=20,
+            ingredients_per_recipe=3, follows=6, favorites=30, carts=10,
+            batch_size=7, stdout=io.StringIO(), **options)
+
+    def test_generate(self):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(30))
+        self.generate()
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Tag.objects.count(), 3)
+        self.assertEqual(Recipe.objects.count(), 20)
+        self.assertEqual(Favorite.objects.count(), 30)
+        self.assertEqual(Cart.objects.count(), 10)
+        self.assertEqual(Follow.objects.count(), 6)
+        self.assertFalse(Follow.objects.filter(
+            user_id=F('author_id')).exists())
+        self.assertFalse(Recipe.objects.filter(
+            ingredientinrecipe__isnull=True).exists())
+        totals = Recipe.objects.aggregate(
+            favorites=Sum('favorites_count'), carts=Sum('in_carts_count'))
+        self.assertEqual(totals, {'favorites': 30, 'carts': 10})
+        self.assertEqual(
+            User.objects.aggregate(total=Sum('recipes_count'))['total'], 20)
+        self.assertEqual(RecipeScore.objects.count(), 20)
+        self.assertEqual(
+            FeedEntry.objects.count(),
+            sum(Recipe.objects.filter(author_id=author_id).count()
+                for author_id in Follow.objects.values_list(
+                    'author_id', flat=True)))
+        self.assertTrue(IngredientInRecipe.objects.exists())
+
+    def test_generated_dates(self):
+        """Generated dates are stored without touching auto_now_add."""
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(30))
+        started = timezone.now()
+        self.generate()
+        self.assertTrue(Recipe._meta.get_field('date').auto_now_add)
+        for model in (Recipe, Favorite, Cart):
+            self.assertFalse(
+                model.objects.filter(date__gte=started).exists(), model)
+
+    def test_requires_ingredients(self):
+        with self.assertRaises(CommandError):
+            self.generate()
+        self.assertFalse(User.objects.exists())
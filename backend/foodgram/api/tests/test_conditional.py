@@ -0,0 +1,113 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+class ConditionalGetTest(TestCase):
+    """ETag and Last-Modified validators of read endpoints."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.other_user, cls.author = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@foodgram.ru')
+            for i in range(3)
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#49B64E', slug='breakfast')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст',
+            image='recipe.jpg', cooking_time=10)
+        cls.recipe.tags.add(cls.tag)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_not_modified(self, url, client=None, queries=2):
+        client = client or self.client
+        etag = client.get(url)['ETag']
+        with self.assertNumQueries(queries):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        return etag
+
+    def assert_modified(self, url, etag, client=None):
+        client = client or self.client
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_recipe_detail(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        etag = self.assert_not_modified(url)
+        other_client = APIClient()
+        other_client.force_authenticate(self.other_user)
+        self.assert_modified(url, etag, other_client)
+        other_client.post(f'{url}favorite/')
+        self.assertEqual(self.assert_not_modified(url), etag)
+        self.client.post(f'{url}favorite/')
+        self.assert_modified(url, etag)
+        etag = self.assert_not_modified(url)
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assert_modified(url, etag)
+
+    def test_recipe_detail_invalid_id(self):
+        response = self.client.get('/api/recipes/abc/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_recipe_detail_if_modified_since(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        last_modified = self.client.get(url)['Last-Modified']
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_recipe_list(self):
+        url = '/api/recipes/?is_favorited=1'
+        etag = self.assert_not_modified(url)
+        self.client.post(f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assert_modified(url, etag)
+
+    def test_recipe_list_whole(self):
+        """Validators cover the whole filtered list, a 304 does not read
+        the page."""
+        recipe = Recipe.objects.create(
+            author=self.other_user, name='Рецепт на второй странице',
+            text='Текст', image='recipe.jpg', cooking_time=10)
+        url = '/api/recipes/?limit=1'
+        etag = self.assert_not_modified(url)
+        recipe.name = 'Новое название'
+        recipe.save()
+        self.assert_modified(url, etag)
+        etag = self.assert_not_modified(url)
+        recipe.delete()
+        self.assert_modified(url, etag)
+
+    def test_counters_of_other_users(self):
+        """Favorites of other users change counters only, the validators
+        are kept."""
+        url = '/api/recipes/'
+        etag = self.assert_not_modified(url)
+        other_client = APIClient()
+        other_client.force_authenticate(self.other_user)
+        other_client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        other_client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertEqual(self.assert_not_modified(url), etag)
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+        self.assert_modified(url, etag)
+
+    def test_reference_data(self):
+        tags_etag = self.assert_not_modified('/api/tags/', queries=1)
+        ingredients_etag = self.assert_not_modified(
+            '/api/ingredients/?name=со', queries=1)
+        recipe_etag = self.assert_not_modified(
+            f'/api/recipes/{self.recipe.id}/')
+        self.tag.name = 'Обед'
+        self.tag.save()
+        self.assert_modified('/api/tags/', tags_etag)
+        self.assert_modified(f'/api/recipes/{self.recipe.id}/', recipe_etag)
+        Ingredient.objects.create(name='сода', measurement_unit='г')
+        self.assert_modified('/api/ingredients/?name=со', ingredients_etag)
@@ -0,0 +1,108 @@
+import io
+
+from django.core.management import call_command
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes import counters
+from recipes.models import Cart, Favorite, Follow, Recipe
+from users.models import User
+
+
+class CountersTest(TestCase):
+    """Denormalized counters follow writes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@foodgram.ru')
+            for i in range(4)
+        )
+        cls.user, cls.author = cls.users[:2]
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(author=cls.author, name=f'Рецепт {i}', text='Текст',
+                   image='recipe.jpg', cooking_time=10)
+            for i in range(3)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_counts(self, user, **counts):
+        user.refresh_from_db()
+        for field, value in counts.items():
+            self.assertEqual(getattr(user, field), value, field)
+
+    def assert_no_drift(self):
+        for model in (Recipe, Favorite, Cart, Follow):
+            self.assertFalse(any(counters.recount(model).values()), model)
+
+    def test_single_writes(self):
+        recipe = self.recipes[0]
+        self.client.post(f'/api/recipes/{recipe.id}/favorite/')
+        self.client.post(f'/api/recipes/{recipe.id}/shopping_cart/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.in_carts_count), (1, 1))
+        self.assert_counts(self.author, recipes_count=3, followers_count=1)
+        self.assert_counts(self.user, following_count=1)
+        self.client.delete(f'/api/recipes/{recipe.id}/favorite/')
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 0)
+        self.assert_counts(self.author, followers_count=0)
+        self.assert_no_drift()
+
+    def test_bulk_writes(self):
+        Favorite.objects.bulk_create(
+            Favorite(user=user, recipe=recipe)
+            for user in self.users for recipe in self.recipes
+        )
+        Favorite.objects.bulk_create(
+            [Favorite(user=self.user, recipe=self.recipes[0])],
+            ignore_conflicts=True,
+        )
+        self.assertEqual(
+            Recipe.objects.filter(favorites_count=4).count(), 3)
+        Favorite.objects.filter(user__in=self.users[:2]).delete()
+        self.assertEqual(
+            Recipe.objects.filter(favorites_count=2).count(), 3)
+        Recipe.objects.filter(pk=self.recipes[0].pk).delete()
+        self.assert_counts(self.author, recipes_count=2)
+        self.assert_no_drift()
+
+    def test_insert_missing(self):
+        """Counters change by inserted rows only, existing rows are
+        skipped without a recount."""
+        recipe, other = self.recipes[:2]
+        Favorite.objects.create(user=self.user, recipe=recipe)
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=5)
+        rows = Favorite.objects.insert_missing([
+            Favorite(user=self.user, recipe=recipe),
+            Favorite(user=self.user, recipe=other),
+            Favorite(user=self.author, recipe=recipe),
+        ])
+        self.assertEqual(
+            sorted(row['recipe_id'] for row in rows),
+            sorted([recipe.id, other.id]))
+        self.assertEqual(
+            dict(Recipe.objects.filter(
+                pk__in=[recipe.pk, other.pk]
+            ).values_list('pk', 'favorites_count')),
+            {recipe.pk: 6, other.pk: 1})
+        self.assertEqual(Favorite.objects.insert_missing(
+            [Favorite(user=self.user, recipe=other)]), [])
+        rows = Follow.objects.insert_missing(
+            [Follow(user=self.user, author=self.author)] * 2)
+        self.assertEqual(len(rows), 1)
+        self.assert_counts(self.author, followers_count=1)
+        self.assert_counts(self.user, following_count=1)
+
+    def test_recount(self):
+        Recipe.objects.update(favorites_count=10)
+        User.objects.update(recipes_count=0)
+        call_command('recount', stdout=io.StringIO())
+        self.assert_counts(self.author, recipes_count=3)
+        self.assertFalse(Recipe.objects.exclude(favorites_count=0).exists())
@@ -0,0 +1,136 @@
+import io
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import FeedEntry, FeedFanOut, Follow, Recipe
+from users.models import User
+
+
+class FeedTest(TestCase):
+    """Following feed filled on write and read for popular authors."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader', email='reader@foodgram.ru')
+        cls.authors = User.objects.bulk_create(
+            User(username=f'author{i}', email=f'author{i}@foodgram.ru')
+            for i in range(3)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, author):
+        return Recipe.objects.create(
+            author=author, name='Рецепт', text='Текст', image='recipe.jpg',
+            cooking_time=10)
+
+    def get_feed(self, url='/api/recipes/feed/'):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def get_feed_ids(self):
+        return [recipe['id'] for recipe in self.get_feed()['results']]
+
+    def process_pending(self):
+        call_command('rebuild_feeds', '--pending', stdout=io.StringIO())
+
+    def get_entries(self):
+        return set(FeedEntry.objects.values_list('user_id', 'recipe_id'))
+
+    def test_fan_out_and_unfollow(self):
+        old = self.create_recipe(self.authors[0])
+        Follow.objects.create(user=self.user, author=self.authors[0])
+        self.client.post(
+            '/api/users/subscribe/',
+            {'ids': [self.authors[1].id]}, format='json')
+        self.assertEqual(self.get_feed_ids(), [old.id])
+        recipes = [self.create_recipe(author) for author in self.authors]
+        self.assertEqual(self.get_entries(), {(self.user.id, old.id)})
+        self.assertEqual(
+            self.get_feed_ids(), [recipes[1].id, recipes[0].id, old.id])
+        self.process_pending()
+        self.assertFalse(FeedFanOut.objects.exists())
+        self.assertEqual(
+            self.get_entries(),
+            {(self.user.id, recipe.id) for recipe in (old, *recipes[:2])})
+        self.assertEqual(
+            self.get_feed_ids(), [recipes[1].id, recipes[0].id, old.id])
+        self.client.delete(f'/api/users/{self.authors[0].id}/subscribe/')
+        self.assertEqual(self.get_feed_ids(), [recipes[1].id])
+        self.client.delete(
+            '/api/users/subscribe/',
+            {'ids': [self.authors[1].id]}, format='json')
+        self.assertEqual(self.get_feed_ids(), [])
+        self.assertFalse(FeedEntry.objects.exists())
+
+    def test_popular_authors(self):
+        with override_settings(FEED_FANOUT_MAX_FOLLOWERS=2,
+                               FEED_FANOUT_MIN_FOLLOWERS=1):
+            Follow.objects.bulk_create(
+                Follow(user=self.user, author=author)
+                for author in self.authors)
+            Follow.objects.create(
+                user=self.authors[1], author=self.authors[0])
+            recipes = [
+                self.create_recipe(self.authors[i]) for i in (0, 1, 0, 2)]
+            self.process_pending()
+            self.assertEqual(
+                set(FeedEntry.objects.values_list('recipe_id', flat=True)),
+                {recipes[1].id, recipes[3].id})
+            data = self.get_feed('/api/recipes/feed/?limit=3')
+            self.assertEqual(
+                [recipe['id'] for recipe in data['results']],
+                [recipe.id for recipe in recipes[:0:-1]])
+            self.assertIsNone(data['previous'])
+            data = self.get_feed(data['next'])
+            self.assertEqual(
+                [recipe['id'] for recipe in data['results']],
+                [recipes[0].id])
+            self.assertIsNone(data['next'])
+            data = self.get_feed(data['previous'])
+            self.assertEqual(len(data['results']), 3)
+        expected = [recipe.id for recipe in reversed(recipes)]
+        self.assertEqual(self.get_feed_ids(), expected)
+        call_command('rebuild_feeds', stdout=io.StringIO())
+        self.assertFalse(User.objects.filter(feed_pull=True).exists())
+        self.assertEqual(self.get_feed_ids(), expected)
+        self.assertIn((self.user.id, recipes[0].id), self.get_entries())
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=3,
+                       FEED_FANOUT_MIN_FOLLOWERS=2)
+    def test_author_no_longer_popular(self):
+        """Copying resumes only under the lower threshold, recipes published
+        while the author was popular are copied then."""
+        author, other, third = self.authors
+        for user in (self.user, other, third):
+            Follow.objects.create(user=user, author=author)
+        author.refresh_from_db()
+        self.assertTrue(author.feed_pull)
+        recipe = self.create_recipe(author)
+        self.process_pending()
+        self.assertFalse(FeedEntry.objects.exists())
+        self.assertEqual(self.get_feed_ids(), [recipe.id])
+        Follow.objects.get(user=third).delete()
+        self.process_pending()
+        author.refresh_from_db()
+        self.assertTrue(author.feed_pull)
+        self.assertFalse(FeedEntry.objects.exists())
+        self.client.force_authenticate(other)
+        self.client.delete(f'/api/users/{author.id}/subscribe/')
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.get_feed_ids(), [recipe.id])
+        self.process_pending()
+        author.refresh_from_db()
+        self.assertFalse(author.feed_pull)
+        self.assertEqual(self.get_entries(), {(self.user.id, recipe.id)})
+        self.assertEqual(self.get_feed_ids(), [recipe.id])
+
+    def test_anonymous(self):
+        self.assertEqual(
+            APIClient().get('/api/recipes/feed/').status_code, 401)
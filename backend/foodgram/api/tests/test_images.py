@@ -0,0 +1,208 @@
+import base64
+import io
+import json
+import os
+import shutil
+import tempfile
+import tracemalloc
+
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.images import SIZES
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_image(width=1600, height=1200):
+    content = io.BytesIO()
+    Image.new('RGB', (width, height), '#49B64E').save(content, 'JPEG')
+    return 'data:image/jpeg;base64,' + base64.b64encode(
+        content.getvalue()).decode()
+
+
+def make_noise_png(side):
+    """PNG that does not compress, about 3 * side ** 2 bytes."""
+    content = io.BytesIO()
+    Image.frombytes('RGB', (side, side), os.urandom(side * side * 3)).save(
+        content, 'PNG')
+    return content.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImageVariantsTest(TestCase):
+    """Resized recipe images generated on save and by the backfill."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#49B64E', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_recipe_data(self):
+        return {
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+            'name': 'Рецепт',
+            'text': 'Текст',
+            'cooking_time': 10,
+        }
+
+    def create_recipe(self, image=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                '/api/recipes/',
+                {**self.get_recipe_data(), 'image': image or make_image()},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 201, response.content)
+        return Recipe.objects.get(pk=response.json()['id'])
+
+    def encode_multipart(self, image):
+        """Recipe as a JSON part and the image as a binary part."""
+        return encode_multipart(BOUNDARY, {
+            'data': json.dumps(self.get_recipe_data()),
+            'image': SimpleUploadedFile('recipe.png', image, 'image/png'),
+        })
+
+    def post_multipart(self, body, url='/api/recipes/', method='POST'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.generic(
+                method, url, body, content_type=MULTIPART_CONTENT)
+
+    def assert_variants(self, recipe):
+        """Variants are downscaled to their size, never upscaled."""
+        variants = recipe.image_variants
+        self.assertEqual(variants['source'], recipe.image.name)
+        with Image.open(recipe.image.path) as image:
+            original_side = max(image.size)
+        for size, side in SIZES.items():
+            for name in variants[size].values():
+                with Image.open(os.path.join(MEDIA_ROOT, name)) as image:
+                    self.assertEqual(
+                        max(image.size), min(side, original_side))
+
+    def test_generated_on_save(self):
+        recipe = self.create_recipe()
+        self.assert_variants(recipe)
+        data = self.client.get(f'/api/recipes/{recipe.id}/').json()
+        self.assertTrue(
+            data['images']['thumbnail']['webp'].endswith('_thumbnail.webp'))
+        self.assertTrue(data['image'].endswith(recipe.image.name))
+        data = self.client.get(
+            f'/api/recipes/{recipe.id}/?image_size=thumbnail').json()
+        self.assertTrue(data['image'].endswith('_thumbnail.jpg'))
+
+    def test_generated_after_commit(self):
+        """Variants are not generated inside the transaction, a replaced
+        image hides the variants of the previous one."""
+        recipe = self.create_recipe()
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/',
+                {**self.get_recipe_data(), 'image': make_image(800, 600)},
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(response.json()['images'])
+        old_variants = recipe.image_variants
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image_variants, old_variants)
+        for callback in callbacks:
+            callback()
+        recipe.refresh_from_db()
+        self.assert_variants(recipe)
+        self.assertFalse(os.path.exists(
+            os.path.join(MEDIA_ROOT, old_variants['detail']['jpeg'])))
+
+    def test_backfill(self):
+        recipe = self.create_recipe()
+        Recipe.objects.filter(pk=recipe.pk).update(image_variants={})
+        broken = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Текст',
+            image='missing.jpg', cooking_time=10)
+        self.assertEqual(broken.image_variants, {})
+        data = self.client.get(f'/api/recipes/{recipe.id}/').json()
+        self.assertIsNone(data['images'])
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('generate_image_variants', workers=0, stdout=stdout,
+                     stderr=stderr)
+        recipe.refresh_from_db()
+        self.assert_variants(recipe)
+        self.assertIn(f'Рецепт {broken.id}', stderr.getvalue())
+
+    def test_multipart_upload(self):
+        response = self.post_multipart(
+            self.encode_multipart(make_noise_png(400)))
+        self.assertEqual(response.status_code, 201, response.content)
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        self.assertEqual(recipe.ingredients.get(), self.ingredient)
+        self.assert_variants(recipe)
+        response = self.post_multipart(
+            self.encode_multipart(make_noise_png(200)),
+            f'/api/recipes/{recipe.id}/', 'PATCH')
+        self.assertEqual(response.status_code, 200, response.content)
+        recipe.refresh_from_db()
+        with Image.open(recipe.image.path) as image:
+            self.assertEqual(image.size, (200, 200))
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=100 * 1024,
+                       RECIPE_IMAGE_MAX_SIDE=1000)
+    def test_limits(self):
+        response = self.post_multipart(
+            self.encode_multipart(make_noise_png(400)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.json())
+        for image in (make_image(1200, 800), make_image(800, 1200)):
+            response = self.client.post(
+                '/api/recipes/',
+                {**self.get_recipe_data(), 'image': image},
+                format='json',
+            )
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('image', response.json())
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_peak_memory(self):
+        """Multipart uploads stream the image to disk, base64 ones keep the
+        body, the decoded string and the file in memory."""
+        image = make_noise_png(800)
+        multipart = self.encode_multipart(image)
+        base64_body = json.dumps({
+            **self.get_recipe_data(),
+            'image': 'data:image/png;base64,' + base64.b64encode(
+                image).decode(),
+        })
+        peaks = {}
+        for name, send in (
+            ('multipart', lambda: self.post_multipart(multipart)),
+            ('base64', lambda: self.client.generic(
+                'POST', '/api/recipes/', base64_body,
+                content_type='application/json')),
+        ):
+            tracemalloc.start()
+            response = send()
+            peaks[name] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            self.assertEqual(response.status_code, 201, response.content)
+        self.assertLess(
+            peaks['multipart'] + len(image), peaks['base64'],
+            f'Peak memory of a {len(image)} bytes upload: {peaks}')
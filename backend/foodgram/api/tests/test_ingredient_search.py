@@ -0,0 +1,49 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient
+
+
+class IngredientSearchTest(TestCase):
+    """Ingredient autocomplete served from the in-process index."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.substring = Ingredient.objects.create(
+            name='морская соль', measurement_unit='г')
+        cls.prefix = Ingredient.objects.create(
+            name='соль крупная', measurement_unit='г')
+        cls.exact = Ingredient.objects.create(
+            name='Соль', measurement_unit='г')
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [ingredient['id'] for ingredient in response.json()]
+
+    def test_exact_then_prefix_then_substring(self):
+        self.assertEqual(
+            self.search('соль'),
+            [self.exact.id, self.prefix.id, self.substring.id])
+
+    @override_settings(INGREDIENTS_SEARCH_LIMIT=2)
+    def test_limit(self):
+        self.assertEqual(self.search('соль'), [self.exact.id, self.prefix.id])
+
+    def test_rebuilt_after_save(self):
+        self.search('соль')
+        self.substring.name = 'перец'
+        self.substring.save()
+        Ingredient.objects.create(name='соль морская', measurement_unit='г')
+        self.assertEqual(self.search('перец'), [self.substring.id])
+        self.assertEqual(len(self.search('соль')), 3)
+
+    def test_rebuilt_after_delete(self):
+        self.search('соль')
+        self.prefix.delete()
+        self.assertEqual(
+            self.search('соль'), [self.exact.id, self.substring.id])
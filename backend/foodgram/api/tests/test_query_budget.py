@@ -0,0 +1,526 @@
+import io
+import tempfile
+from itertools import product
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from api.reference_data import ingredients_snapshot, tags_snapshot
+from recipes import catalog, versions
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Cart, Favorite, Follow, Ingredient,
+                            IngredientInRecipe, Recipe, Tag)
+from users.models import User
+
+USERS_COUNT = 12
+RECIPES_COUNT = 40
+INGREDIENTS_COUNT = 60
+INGREDIENTS_IN_RECIPE = 10
+SMALL_PAGE = 2
+LARGE_PAGE = 20
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNo'
+    'AAAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+
+RECIPE_FILTERS = (
+    '',
+    'author={author}',
+    'tags=breakfast',
+    'tags=breakfast&tags=dinner',
+    'is_favorited=1',
+    'is_in_shopping_cart=1',
+    'is_favorited=1&is_in_shopping_cart=1',
+    'author={author}&tags=dinner&is_favorited=1',
+    'search=Рецепт',
+    'search=ингредиент&tags=lunch',
+    'ordering=popular',
+    'ordering=trending&tags=lunch',
+)
+
+# Maximum number of queries per endpoint. Clients are authenticated with
+# force_authenticate, so the token lookup is not counted. Tags and
+# ingredients are served from warm in-process snapshots after the table
+# versions query. Recipe lists read their ETag validators with one aggregate
+# query before the page. Filtering by author costs one validation query on
+# top of the list itself, tags are validated against the snapshot. Writes
+# also update denormalized counters, one query per counter, and favorites and
+# carts mark the recipe score for recomputation. Recipe writes validate all
+# ingredients with one query, touch only changed rows, queue the similar
+# recipes refresh and read the recipe back with the list prefetches, so their
+# cost does not depend on the number of ingredients. Bulk favorite, cart and
+# subscribe actions cost the same as single ones for any number of ids.
+# Recipe deletion also deletes its ingredients, tags, favorites, carts, feed
+# entries and queued refreshes, one query per table. Subscribing and
+# unsubscribing also check whether the author reached the feed fan-out
+# threshold. New and changed ingredients are checked for a duplicate name and
+# unit.
+BUDGETS = {
+    'tags-list': 1,
+    'tags-detail': 1,
+    'tags-create': 4,
+    'tags-update': 4,
+    'tags-delete': 4,
+    'ingredients-list': 1,
+    'ingredients-search': 2,
+    'ingredients-search-warm': 1,
+    'ingredients-detail': 1,
+    'ingredients-create': 3,
+    'ingredients-update': 5,
+    'ingredients-delete': 4,
+    'recipes-list-anonymous': 8,
+    'recipes-list': 8,
+    'recipes-list-cursor': 6,
+    'recipes-feed': 7,
+    'recipes-detail-anonymous': 6,
+    'recipes-detail': 6,
+    'recipes-similar': 5,
+    'recipes-create': 18,
+    'recipes-update': 20,
+    'recipes-delete': 22,
+    'recipes-favorite-post': 4,
+    'recipes-favorite-delete': 5,
+    'recipes-shopping-cart-post': 4,
+    'recipes-shopping-cart-delete': 5,
+    'recipes-favorite-bulk-post': 4,
+    'recipes-favorite-bulk-delete': 5,
+    'recipes-shopping-cart-bulk-post': 4,
+    'recipes-shopping-cart-bulk-delete': 5,
+    'recipes-download-shopping-cart': 1,
+    'recipes-shopping-cart-job-post': 4,
+    'recipes-shopping-cart-job': 1,
+    'users-list-anonymous': 2,
+    'users-list': 2,
+    'users-detail': 1,
+    'users-me': 1,
+    'users-create': 3,
+    'users-set-password': 1,
+    'auth-token-login': 6,
+    'auth-token-logout': 1,
+    'users-subscriptions': 3,
+    'users-subscribe-post': 9,
+    'users-subscribe-delete': 7,
+    'users-subscribe-bulk-post': 7,
+    'users-subscribe-bulk-delete': 7,
+}
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+    },
+})
+class QueryBudgetTestCase(TestCase):
+    """Base class recording query counts and DB time per endpoint."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.report = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(
+                username=f'user{i}',
+                email=f'user{i}@foodgram.ru',
+                first_name=f'Имя{i}',
+                last_name=f'Фамилия{i}',
+            )
+            for i in range(USERS_COUNT)
+        )
+        cls.user = cls.users[0]
+        cls.author = cls.users[1]
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=slug, color='#49B64E', slug=slug)
+            for slug in ('breakfast', 'lunch', 'dinner')
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(INGREDIENTS_COUNT)
+        )
+        cls.recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=cls.users[i % USERS_COUNT],
+                name=f'Рецепт {i}',
+                text='Описание рецепта',
+                image='recipe.jpg',
+                cooking_time=10 + i,
+            )
+            for i in range(RECIPES_COUNT)
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe,
+                ingredient=cls.ingredients[(i + j) % INGREDIENTS_COUNT],
+                amount=j + 1,
+            )
+            for i, recipe in enumerate(cls.recipes)
+            for j in range(INGREDIENTS_IN_RECIPE)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for i, recipe in enumerate(cls.recipes)
+            for tag in cls.tags[:i % len(cls.tags) + 1]
+        )
+        Follow.objects.bulk_create(
+            Follow(user=cls.user, author=author)
+            for author in cls.users[1:]
+        )
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.user, recipe=recipe)
+            for recipe in cls.recipes[::2]
+        )
+        Cart.objects.bulk_create(
+            Cart(user=cls.user, recipe=recipe)
+            for recipe in cls.recipes[:2]
+        )
+        call_command('update_recipe_scores', stdout=io.StringIO())
+        versions.bump(versions.TAGS)
+        versions.bump(versions.INGREDIENTS)
+        table_versions = versions.get_versions()
+        tags_snapshot.get(table_versions)
+        ingredients_snapshot.get(table_versions)
+        ingredient_index.search(table_versions, '', 1)
+        catalog.invalidate()
+
+    def setUp(self):
+        self.anonymous_client = APIClient()
+        self.authorized_client = APIClient()
+        self.authorized_client.force_authenticate(self.user)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        print(f'\n{cls.__name__}')
+        print(f'{"endpoint":<70} {"queries":>8} {"db, ms":>8}')
+        for request, (count, time) in sorted(cls.report.items()):
+            print(f'{request:<70} {count:>8} {time * 1000:>8.2f}')
+
+    def count_queries(self, name, client, method, url, **kwargs):
+        """Request endpoint and record query count and DB time."""
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, method)(url, **kwargs)
+        self.assertLess(
+            response.status_code, 400, f'{method.upper()} {url}')
+        count = len(context.captured_queries)
+        time = sum(float(query['time'])
+                   for query in context.captured_queries)
+        self.report[f'{name}: {method.upper()} {url}'] = (count, time)
+        self.assertLessEqual(
+            count,
+            BUDGETS[name],
+            f'{method.upper()} {url} is over its query budget:\n'
+            + '\n'.join(query['sql'] for query in context.captured_queries)
+        )
+        return count
+
+    def assert_constant_queries(self, name, client, url):
+        """Query count must not grow with the page size."""
+        separator = '&' if '?' in url else '?'
+        small = self.count_queries(
+            name, client, 'get', f'{url}{separator}limit={SMALL_PAGE}')
+        large = self.count_queries(
+            name, client, 'get', f'{url}{separator}limit={LARGE_PAGE}')
+        self.assertEqual(
+            small, large, f'Query count of {url} grows with page size')
+
+
+class ReferenceDataQueryBudgetTest(QueryBudgetTestCase):
+    """Tags and ingredients."""
+
+    def test_tags(self):
+        self.count_queries(
+            'tags-list', self.anonymous_client, 'get', '/api/tags/')
+        self.count_queries(
+            'tags-detail', self.anonymous_client, 'get',
+            f'/api/tags/{self.tags[0].id}/')
+
+    def test_ingredients(self):
+        self.count_queries(
+            'ingredients-list', self.anonymous_client, 'get',
+            '/api/ingredients/')
+        self.count_queries(
+            'ingredients-search', self.anonymous_client, 'get',
+            '/api/ingredients/?name=инг')
+        self.count_queries(
+            'ingredients-search-warm', self.anonymous_client, 'get',
+            '/api/ingredients/?name=ингредиент 1')
+        self.count_queries(
+            'ingredients-detail', self.anonymous_client, 'get',
+            f'/api/ingredients/{self.ingredients[0].id}/')
+
+    def test_writes(self):
+        """Admin writes of tags and ingredients."""
+        client = APIClient()
+        client.force_authenticate(User.objects.create(
+            username='admin', email='admin@foodgram.ru', is_staff=True))
+        for name, model, data in (
+            ('tags', Tag,
+             {'name': 'Ужин', 'color': '#E26C2D', 'slug': 'supper'}),
+            ('ingredients', Ingredient,
+             {'name': 'соль', 'measurement_unit': 'г'}),
+        ):
+            with self.subTest(name=name):
+                self.count_queries(
+                    f'{name}-create', client, 'post', f'/api/{name}/',
+                    data=data, format='json')
+                url = f'/api/{name}/{model.objects.latest("id").id}/'
+                self.count_queries(
+                    f'{name}-update', client, 'patch', url,
+                    data={'name': f'{data["name"]} 2'}, format='json')
+                self.count_queries(f'{name}-delete', client, 'delete', url)
+
+
+class RecipeQueryBudgetTest(QueryBudgetTestCase):
+    """Recipe list, detail and user' recipe lists."""
+
+    def test_recipe_list_filters(self):
+        clients = (
+            ('recipes-list-anonymous', self.anonymous_client),
+            ('recipes-list', self.authorized_client),
+        )
+        for (name, client), query in product(clients, RECIPE_FILTERS):
+            with self.subTest(client=name, query=query):
+                query = query.format(author=self.author.id)
+                self.assert_constant_queries(
+                    name, client, f'/api/recipes/?{query}')
+
+    def test_recipe_list_cursor(self):
+        url = f'/api/recipes/?cursor=&limit={LARGE_PAGE}'
+        self.assert_constant_queries(
+            'recipes-list-cursor', self.authorized_client,
+            '/api/recipes/?cursor=')
+        ids, pages = [], []
+        while url:
+            response = self.authorized_client.get(url)
+            pages.append(response.data)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(ids, [recipe.id for recipe in self.recipes])
+        self.count_queries(
+            'recipes-list-cursor', self.authorized_client, 'get',
+            pages[-1]['previous'])
+        response = self.authorized_client.get(pages[-1]['previous'])
+        self.assertEqual(response.data['results'], pages[-2]['results'])
+        response = self.authorized_client.get('/api/recipes/?cursor=bad')
+        self.assertEqual(response.status_code, 404)
+        for query in ('ordering=popular', 'search=Рецепт'):
+            with self.subTest(query=query):
+                response = self.authorized_client.get(
+                    f'/api/recipes/?cursor=&{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.data)
+
+    def test_feed(self):
+        """Feed pages cost the same at any depth, whether recipes are read
+        from the feed table or from popular authors' recipes."""
+        expected = [
+            recipe.id for recipe in reversed(self.recipes)
+            if recipe.author_id != self.user.id
+        ]
+        for max_followers in (1000, 1):
+            with self.subTest(max_followers=max_followers), (
+                override_settings(FEED_FANOUT_MAX_FOLLOWERS=max_followers)
+            ):
+                self.assert_constant_queries(
+                    'recipes-feed', self.authorized_client,
+                    '/api/recipes/feed/')
+                url = f'/api/recipes/feed/?limit={SMALL_PAGE}'
+                ids, urls = [], []
+                while url:
+                    urls.append(url)
+                    response = self.authorized_client.get(url)
+                    ids.extend(
+                        recipe['id'] for recipe in response.data['results'])
+                    url = response.data['next']
+                self.assertEqual(ids, expected)
+                self.count_queries(
+                    'recipes-feed', self.authorized_client, 'get', urls[-1])
+
+    def test_similar(self):
+        call_command('build_similar_recipes', stdout=io.StringIO())
+        url = f'/api/recipes/{self.recipes[0].id}/similar/'
+        self.count_queries(
+            'recipes-similar', self.anonymous_client, 'get', url)
+        self.count_queries(
+            'recipes-similar', self.authorized_client, 'get', url)
+
+    def test_recipe_detail(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.count_queries(
+            'recipes-detail-anonymous', self.anonymous_client, 'get', url)
+        self.count_queries(
+            'recipes-detail', self.authorized_client, 'get', url)
+
+    @override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+    def test_recipe_write(self):
+        """Create and update cost the same for any number of ingredients."""
+        def get_data(ingredients):
+            return {
+                'tags': [tag.id for tag in self.tags],
+                'ingredients': [
+                    {'id': ingredient.id, 'amount': 10}
+                    for ingredient in ingredients
+                ],
+                'name': 'Рецепт',
+                'image': IMAGE,
+                'text': 'Текст',
+                'cooking_time': 10,
+            }
+
+        client = self.authorized_client
+        for size in (SMALL_PAGE, LARGE_PAGE):
+            with self.subTest(size=size):
+                self.count_queries(
+                    'recipes-create', client, 'post', '/api/recipes/',
+                    data=get_data(self.ingredients[:size]), format='json')
+                url = f'/api/recipes/{Recipe.objects.latest("id").id}/'
+                self.count_queries(
+                    'recipes-update', client, 'patch', url,
+                    data=get_data(self.ingredients[size:2 * size]),
+                    format='json')
+
+    def test_recipe_delete(self):
+        recipe = self.recipes[0]
+        client = APIClient()
+        client.force_authenticate(recipe.author)
+        self.count_queries(
+            'recipes-delete', client, 'delete', f'/api/recipes/{recipe.id}/')
+
+    def test_favorite_toggle(self):
+        url = f'/api/recipes/{self.recipes[1].id}/favorite/'
+        self.count_queries(
+            'recipes-favorite-post', self.authorized_client, 'post', url)
+        self.count_queries(
+            'recipes-favorite-delete', self.authorized_client, 'delete', url)
+
+    def test_shopping_cart_toggle(self):
+        url = f'/api/recipes/{self.recipes[5].id}/shopping_cart/'
+        self.count_queries(
+            'recipes-shopping-cart-post', self.authorized_client, 'post', url)
+        self.count_queries(
+            'recipes-shopping-cart-delete', self.authorized_client,
+            'delete', url)
+
+    def test_bulk_toggles(self):
+        """Bulk actions cost the same for any number of ids."""
+        for name, url in (('recipes-favorite-bulk', '/api/recipes/favorite/'),
+                          ('recipes-shopping-cart-bulk',
+                           '/api/recipes/shopping_cart/')):
+            for size in (SMALL_PAGE, LARGE_PAGE):
+                data = {'ids': [recipe.id for recipe in self.recipes[:size]]}
+                for method in ('post', 'delete'):
+                    with self.subTest(name=name, size=size, method=method):
+                        self.count_queries(
+                            f'{name}-{method}', self.authorized_client,
+                            method, url, data=data, format='json')
+
+    def test_download_shopping_cart(self):
+        url = '/api/recipes/download_shopping_cart/'
+        self.count_queries(
+            'recipes-download-shopping-cart', self.authorized_client, 'get',
+            url)
+        etag = self.authorized_client.get(url)['ETag']
+        self.count_queries(
+            'recipes-download-shopping-cart', self.authorized_client, 'get',
+            url, HTTP_IF_NONE_MATCH=etag)
+
+    @override_settings(PRIVATE_MEDIA_ROOT=tempfile.mkdtemp())
+    def test_shopping_cart_job(self):
+        url = '/api/recipes/download_shopping_cart/'
+        self.count_queries(
+            'recipes-shopping-cart-job-post', self.authorized_client, 'post',
+            url)
+        response = self.authorized_client.post(url)
+        self.assertEqual(response.status_code, 202)
+        status_url = response['Location']
+        call_command('render_shopping_lists', '--once', stdout=io.StringIO())
+        self.count_queries(
+            'recipes-shopping-cart-job', self.authorized_client, 'get',
+            status_url)
+        response = self.authorized_client.get(status_url)
+        self.assertEqual(response.data['status'], 'done')
+        response = self.authorized_client.get(response.data['file'])
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        response = self.client.get(status_url)
+        self.assertEqual(response.status_code, 401)
+
+
+class UserQueryBudgetTest(QueryBudgetTestCase):
+    """Users and subscriptions."""
+
+    def test_user_list_anonymous(self):
+        self.assert_constant_queries(
+            'users-list-anonymous', self.anonymous_client, '/api/users/')
+
+    def test_user_list(self):
+        self.assert_constant_queries(
+            'users-list', self.authorized_client, '/api/users/')
+        self.assert_constant_queries(
+            'users-list', self.authorized_client, '/api/users/?search=user1')
+
+    def test_user_detail(self):
+        self.count_queries(
+            'users-detail', self.authorized_client, 'get',
+            f'/api/users/{self.author.id}/')
+        self.count_queries(
+            'users-me', self.authorized_client, 'get', '/api/users/me/')
+
+    def test_user_create(self):
+        self.count_queries(
+            'users-create', self.anonymous_client, 'post', '/api/users/',
+            data={
+                'email': 'new@foodgram.ru',
+                'username': 'new',
+                'first_name': 'Имя',
+                'last_name': 'Фамилия',
+                'password': 'Pa55word!',
+            },
+            format='json')
+
+    def test_password_and_token(self):
+        self.user.set_password('Pa55word!')
+        self.user.save()
+        self.count_queries(
+            'users-set-password', self.authorized_client, 'post',
+            '/api/users/set_password/',
+            data={'current_password': 'Pa55word!',
+                  'new_password': 'N3wPa55word!'},
+            format='json')
+        self.count_queries(
+            'auth-token-login', self.anonymous_client, 'post',
+            '/api/auth/token/login/',
+            data={'email': self.user.email, 'password': 'N3wPa55word!'},
+            format='json')
+        self.count_queries(
+            'auth-token-logout', self.authorized_client, 'post',
+            '/api/auth/token/logout/')
+
+    def test_subscriptions(self):
+        for query in ('', 'recipes_limit=1', 'recipes_limit=3'):
+            with self.subTest(query=query):
+                self.assert_constant_queries(
+                    'users-subscriptions', self.authorized_client,
+                    f'/api/users/subscriptions/?{query}')
+
+    def test_subscribe_toggle(self):
+        url = f'/api/users/{self.users[2].id}/subscribe/'
+        self.count_queries(
+            'users-subscribe-delete', self.authorized_client, 'delete', url)
+        self.count_queries(
+            'users-subscribe-post', self.authorized_client, 'post', url)
+        for size in (SMALL_PAGE, USERS_COUNT):
+            data = {'ids': [user.id for user in self.users[1:size]]}
+            for method in ('post', 'delete'):
+                with self.subTest(size=size, method=method):
+                    self.count_queries(
+                        f'users-subscribe-bulk-{method}',
+                        self.authorized_client, method,
+                        '/api/users/subscribe/', data=data, format='json')
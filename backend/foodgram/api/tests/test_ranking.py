@@ -0,0 +1,134 @@
+import io
+from datetime import timedelta
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from recipes.models import Cart, Favorite, Recipe, RecipeScore, Tag
+from users.models import User
+
+
+class RecipeRankingTest(TestCase):
+    """Popular and trending orderings by decayed favorite and cart scores."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@foodgram.ru')
+            for i in range(3)
+        )
+        cls.tag = Tag.objects.create(
+            name='lunch', color='#49B64E', slug='lunch')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.users[0], name=f'Рецепт {i}', text='Текст',
+                image='recipe.jpg', cooking_time=10)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def update(self, **options):
+        stdout = io.StringIO()
+        call_command('update_recipe_scores', stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def get_ids(self, query):
+        response = self.client.get(f'/api/recipes/?{query}')
+        self.assertEqual(response.status_code, 200, response.content)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_new_recipes_by_date(self):
+        """Recipes without favorites and carts are ordered by date."""
+        first, second, third = self.recipes
+        for ordering in ('popular', 'trending'):
+            self.assertEqual(
+                self.get_ids(f'ordering={ordering}'),
+                [third.id, second.id, first.id])
+
+    def test_scores_sorted_by_index(self):
+        """Every recipe has a score, so the ordering reads the score table
+        with an inner join in the order of its index."""
+        sql = str(Recipe.objects.order_by_score('popular').query)
+        self.assertIn('INNER JOIN "recipes_recipescore"', sql)
+        self.assertIn(
+            'ORDER BY "recipes_recipescore"."popular" DESC, '
+            '"recipes_recipescore"."recipe_id" DESC', sql)
+
+    def test_changes_mark_scores(self):
+        """Single and bulk favorites and carts mark scores for the command."""
+        first, second, third = self.recipes
+        self.assertFalse(RecipeScore.objects.filter(dirty=True).exists())
+        Favorite.objects.create(user=self.users[1], recipe=first)
+        Cart.objects.bulk_create([Cart(user=self.users[1], recipe=second)])
+        self.assertEqual(
+            set(RecipeScore.objects.filter(dirty=True).values_list(
+                'pk', flat=True)),
+            {first.id, second.id})
+        self.assertIn('для 2 рецептов', self.update())
+        self.assertFalse(RecipeScore.objects.filter(dirty=True).exists())
+
+    def test_all_creates_missing_scores(self):
+        first, second, third = self.recipes
+        RecipeScore.objects.filter(recipe=third).delete()
+        self.assertIn('для 3 рецептов', self.update(all=True))
+        self.assertEqual(
+            self.get_ids('ordering=popular'), [third.id, second.id, first.id])
+
+    def test_favorites_and_carts(self):
+        first, second, third = self.recipes
+        Favorite.objects.create(user=self.users[1], recipe=first)
+        Cart.objects.create(user=self.users[1], recipe=second)
+        self.update()
+        self.assertEqual(
+            self.get_ids('ordering=popular'), [second.id, first.id, third.id])
+
+    def test_decay(self):
+        """Old favorites keep popularity but lose recent popularity."""
+        first, second, _ = self.recipes
+        Favorite.objects.bulk_create(
+            Favorite(user=user, recipe=first) for user in self.users[1:])
+        Favorite.objects.update(date=timezone.now() - timedelta(days=10))
+        Favorite.objects.create(user=self.users[0], recipe=second)
+        self.update()
+        self.assertEqual(self.get_ids('ordering=popular')[:2],
+                         [first.id, second.id])
+        self.assertEqual(self.get_ids('ordering=trending')[:2],
+                         [second.id, first.id])
+
+    def test_incremental_update(self):
+        """Only recipes changed since the last run are recomputed."""
+        first, second, third = self.recipes
+        self.assertIn('для 0 рецептов', self.update())
+        scores = {row.pk: row.popular for row in RecipeScore.objects.all()}
+        response = self.client.post(f'/api/recipes/{first.id}/favorite/')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertIn('для 1 рецептов', self.update())
+        self.assertGreater(
+            RecipeScore.objects.get(pk=first.id).popular, scores[first.id])
+        self.assertEqual(
+            RecipeScore.objects.get(pk=second.id).popular, scores[second.id])
+        self.assertEqual(self.get_ids('ordering=popular')[0], first.id)
+        self.client.delete(f'/api/recipes/{first.id}/favorite/')
+        self.update()
+        self.assertAlmostEqual(
+            RecipeScore.objects.get(pk=first.id).popular, scores[first.id])
+        self.assertIn('для 3 рецептов', self.update(all=True))
+
+    def test_tags_filter(self):
+        first, second, third = self.recipes
+        for recipe in (first, second):
+            recipe.tags.add(self.tag)
+        Favorite.objects.create(user=self.users[1], recipe=first)
+        self.update()
+        self.assertEqual(
+            self.get_ids('ordering=trending&tags=lunch'),
+            [first.id, second.id])
+
+    def test_invalid_ordering(self):
+        response = self.client.get('/api/recipes/?ordering=name')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,150 @@
+import shutil
+import tempfile
+from unittest import mock
+
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from users.models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNo'
+    'AAAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeWriteTest(TestCase):
+    """Validation and diff-based updates of recipe ingredients and tags."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=slug, color='#49B64E', slug=slug)
+            for slug in ('breakfast', 'lunch')
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(4)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_data(self, amounts, tags=None, **kwargs):
+        return {
+            'tags': [tag.id for tag in tags or self.tags[:1]],
+            'ingredients': [
+                {'id': self.ingredients[index].id, 'amount': amount}
+                for index, amount in amounts.items()
+            ],
+            'name': 'Рецепт',
+            'image': IMAGE,
+            'text': 'Текст',
+            'cooking_time': 10,
+            **kwargs,
+        }
+
+    def create_recipe(self):
+        response = self.client.post(
+            '/api/recipes/', self.get_data({0: 10, 1: 20}), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Recipe.objects.get(pk=response.json()['id'])
+
+    def get_rows(self, recipe):
+        return {
+            row.ingredient_id: (row.id, row.amount)
+            for row in IngredientInRecipe.objects.filter(recipe=recipe)
+        }
+
+    def test_unknown_ids_reported_together(self):
+        data = self.get_data({0: 10})
+        data['ingredients'] += [{'id': 900, 'amount': 1},
+                                {'id': 901, 'amount': 1}]
+        data['tags'].append(902)
+        response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        errors = response.json()
+        self.assertIn('900, 901', errors['ingredients'][0])
+        self.assertIn('902', errors['tags'][0])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_duplicates(self):
+        data = self.get_data({0: 10})
+        data['ingredients'].append({'id': self.ingredients[0].id, 'amount': 5})
+        data['tags'] *= 2
+        response = self.client.post('/api/recipes/', data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'ingredients', 'tags'})
+
+    def test_update_name_keeps_relations(self):
+        recipe = self.create_recipe()
+        rows = self.get_rows(recipe)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/',
+                self.get_data({0: 10, 1: 20}, name='Новое название'),
+                format='json',
+            )
+        self.assertEqual(response.status_code, 200, response.content)
+        writes = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith(('INSERT', 'DELETE'))
+            and ('ingredientinrecipe' in query['sql']
+                 or 'recipe_tags' in query['sql'])
+        ]
+        self.assertEqual(writes, [])
+        self.assertEqual(self.get_rows(recipe), rows)
+
+    def test_update_diff(self):
+        recipe = self.create_recipe()
+        rows = self.get_rows(recipe)
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            self.get_data({0: 10, 1: 25, 2: 30}, tags=self.tags),
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        new_rows = self.get_rows(recipe)
+        ids = [ingredient.id for ingredient in self.ingredients]
+        self.assertEqual(new_rows[ids[0]], rows[ids[0]])
+        self.assertEqual(new_rows[ids[1]], (rows[ids[1]][0], 25))
+        self.assertEqual(new_rows[ids[2]][1], 30)
+        self.assertEqual(recipe.tags.count(), 2)
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/',
+            self.get_data({2: 30}),
+            format='json',
+        )
+        self.assertEqual(list(self.get_rows(recipe)), [ids[2]])
+
+    def test_partial_update(self):
+        recipe = self.create_recipe()
+        response = self.client.patch(
+            f'/api/recipes/{recipe.id}/', {'cooking_time': 15},
+            format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len(self.get_rows(recipe)), 2)
+
+    def test_atomic(self):
+        with mock.patch.object(
+            IngredientInRecipe.objects, 'bulk_create',
+            side_effect=DatabaseError,
+        ):
+            with self.assertRaises(DatabaseError):
+                self.client.post(
+                    '/api/recipes/', self.get_data({0: 10}), format='json')
+        self.assertFalse(Recipe.objects.exists())
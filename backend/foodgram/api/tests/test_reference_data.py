@@ -0,0 +1,59 @@
+import gzip
+import json
+
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, Recipe, Tag
+from users.models import User
+
+
+class ReferenceDataTest(TestCase):
+    """Tags and ingredients served from in-process snapshots."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#49B64E', slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст',
+            image='recipe.jpg', cooking_time=10)
+        cls.recipe.tags.add(cls.tag)
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_gzip_variant(self):
+        plain = self.client.get('/api/ingredients/')
+        compressed = self.client.get(
+            '/api/ingredients/', HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(
+            json.loads(gzip.decompress(compressed.content)), plain.json())
+        self.assertNotEqual(plain['ETag'], compressed['ETag'])
+
+    def test_rebuilt_on_change(self):
+        self.assertEqual(len(self.client.get('/api/tags/').json()), 1)
+        Tag.objects.create(name='Обед', color='#E26C2D', slug='lunch')
+        self.assertEqual(len(self.client.get('/api/tags/').json()), 2)
+        self.ingredient.name = 'сахар'
+        self.ingredient.save()
+        response = self.client.get(f'/api/ingredients/{self.ingredient.id}/')
+        self.assertEqual(response.json()['name'], 'сахар')
+
+    def test_detail_not_found(self):
+        response = self.client.get('/api/tags/0/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_recipe_tags_filter(self):
+        self.client.get('/api/tags/')
+        response = self.client.get('/api/recipes/?tags=breakfast')
+        self.assertEqual(response.json()['count'], 1)
+        response = self.client.get('/api/recipes/?tags=unknown')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('tags', response.json())
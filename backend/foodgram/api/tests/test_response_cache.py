@@ -0,0 +1,97 @@
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api.response_cache import get_stats, reset_stats
+from recipes import catalog
+from recipes.models import Favorite, Recipe, Tag
+from users.models import User
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 3},
+    },
+}, RESPONSE_CACHE_STATS_RATE=1)
+class AnonymousResponseCacheTest(TestCase):
+    """Cache of anonymous recipe responses."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@foodgram.ru')
+            for i in range(2)
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#49B64E', slug='breakfast')
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', text='Текст',
+            image='recipe.jpg', cooking_time=10)
+        cls.recipe.tags.add(cls.tag)
+
+    def setUp(self):
+        catalog.invalidate()
+        reset_stats()
+        self.client = APIClient()
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def assert_cached(self, url, cached):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Cache'], 'HIT' if cached else 'MISS')
+        return response
+
+    def test_hit_without_queries(self):
+        response = self.assert_cached(self.url, False)
+        with self.assertNumQueries(0):
+            cached = self.assert_cached(self.url, True)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(get_stats(), (2, 1, 2 / 3))
+
+    def test_query_params_are_normalized(self):
+        self.assert_cached('/api/recipes/?tags=breakfast&limit=6', False)
+        self.assert_cached('/api/recipes/?limit=6&tags=breakfast', True)
+
+    def test_invalidation(self):
+        self.assert_cached(self.url, False)
+        self.recipe.name = 'Новое название'
+        self.recipe.save()
+        self.assertEqual(
+            self.assert_cached(self.url, False).data['name'],
+            'Новое название')
+        self.author.first_name = 'Имя'
+        self.author.save(update_fields=['first_name'])
+        self.assert_cached(self.url, False)
+        self.tag.name = 'Обед'
+        self.tag.save()
+        self.assert_cached(self.url, False)
+
+    def test_counters_and_logins_keep_cache(self):
+        """Counters in cached responses lag until the entries expire."""
+        self.assert_cached(self.url, False)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.author.last_login = timezone.now()
+        self.author.save(update_fields=['last_login'])
+        response = self.assert_cached(self.url, True)
+        self.assertEqual(response.json()['favorites_count'], 0)
+        User.objects.create(username='new', email='new@foodgram.ru')
+        self.assert_cached(self.url, True)
+
+    @override_settings(RESPONSE_CACHE_STATS_RATE=0)
+    def test_stats_sampling(self):
+        self.assert_cached(self.url, False)
+        self.assert_cached(self.url, True)
+        self.assertEqual(get_stats(), (0, 0, 0))
+
+    def test_authenticated_requests_bypass_cache(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Cache', response)
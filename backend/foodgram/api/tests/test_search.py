@@ -0,0 +1,100 @@
+import shutil
+import tempfile
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.models import Ingredient, IngredientInRecipe, Recipe, Tag
+from users.models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABAgMAAABieywaAAAA'
+    'CVBMVEUAAAD///9fX1/S0ecCAAAACXBIWXMAAA7EAAAOxAGVKw4bAAAACklEQVQImWNo'
+    'AAAAggCByxOyYQAAAABJRU5ErkJggg=='
+)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeSearchTest(TestCase):
+    """Recipe search by title, description and ingredients."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        cls.tag = Tag.objects.create(
+            name='lunch', color='#49B64E', slug='lunch')
+        cls.beet = Ingredient.objects.create(
+            name='Свекла', measurement_unit='г')
+        cls.salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        cls.by_ingredient = cls.create_recipe(
+            'Салат', 'Нарезать и перемешать', cls.beet)
+        cls.by_text = cls.create_recipe(
+            'Суп', 'Нужна свекла и капуста', cls.salt)
+        cls.by_name = cls.create_recipe(
+            'Свекла тушеная', 'Тушить час', cls.salt)
+        cls.other = cls.create_recipe('Борщ 2', 'Варить два часа', cls.salt)
+
+    @classmethod
+    def create_recipe(cls, name, text, ingredient):
+        recipe = Recipe.objects.create(
+            author=cls.user, name=name, text=text, image='recipe.jpg',
+            cooking_time=10)
+        IngredientInRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=100)
+        return recipe
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, text):
+        response = self.client.get('/api/recipes/', {'search': text})
+        self.assertEqual(response.status_code, 200, response.content)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_ranked_by_title_description_ingredients(self):
+        self.assertEqual(
+            self.search('свекла'),
+            [self.by_name.id, self.by_text.id, self.by_ingredient.id])
+
+    def test_case_insensitive(self):
+        """Cyrillic queries ignore case on every database."""
+        self.assertEqual(self.search('борщ'), [self.other.id])
+        self.assertEqual(self.search('СВЕКЛА')[0], self.by_name.id)
+
+    def test_no_match(self):
+        self.assertEqual(self.search('пирог'), [])
+
+    def test_removed_ingredient(self):
+        IngredientInRecipe.objects.filter(recipe=self.by_ingredient).delete()
+        self.assertNotIn(self.by_ingredient.id, self.search('свекла'))
+
+    def test_created_recipe(self):
+        """A recipe created through the API is found by its ingredients,
+        its search vector is computed once."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/recipes/', {
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.beet.id, 'amount': 1}],
+                'name': 'Винегрет',
+                'image': IMAGE,
+                'text': 'Нарезать кубиками',
+                'cooking_time': 10,
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        updates = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('UPDATE')
+            and '"search_vector"' in query['sql']
+        ]
+        self.assertLessEqual(len(updates), 1)
+        self.assertIn(response.json()['id'], self.search('свекла'))
@@ -0,0 +1,248 @@
+import csv
+import gc
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api import shopping_list
+from recipes.models import (Cart, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingListJob, Tag)
+from users.models import User
+
+URL = '/api/recipes/download_shopping_cart/'
+MEDIA_ROOT = tempfile.mkdtemp()
+PRIVATE_MEDIA_ROOT = tempfile.mkdtemp()
+# More purchases than fit on the first page of the PDF.
+INGREDIENTS_COUNT = 40
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}, MEDIA_ROOT=MEDIA_ROOT, PRIVATE_MEDIA_ROOT=PRIVATE_MEDIA_ROOT)
+class ShoppingListTest(TestCase):
+    """Shopping list PDF rendering and caching."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(PRIVATE_MEDIA_ROOT, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user', email='user@foodgram.ru')
+        tag = Tag.objects.create(
+            name='Завтрак', color='#49B64E', slug='breakfast')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i:02}', measurement_unit='г')
+            for i in range(INGREDIENTS_COUNT)
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {i}', text='Текст',
+                image='recipe.jpg', cooking_time=10)
+            for i in range(2)
+        ]
+        for recipe in cls.recipes:
+            recipe.tags.add(tag)
+            IngredientInRecipe.objects.bulk_create(
+                IngredientInRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=i + 1)
+                for i, ingredient in enumerate(cls.ingredients)
+            )
+        Cart.objects.bulk_create(
+            Cart(user=cls.user, recipe=recipe) for recipe in cls.recipes)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_purchases(self):
+        return list(shopping_list.get_purchases(self.user))
+
+    def get_expected_rows(self):
+        return [
+            (ingredient.name, 'г', 2 * (i + 1))
+            for i, ingredient in enumerate(self.ingredients)
+        ]
+
+    def download(self, query='', **headers):
+        response = self.client.get(f'{URL}{query}', **headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def read(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_txt(self):
+        for query, headers in (('?format=txt', {}),
+                               ('', {'HTTP_ACCEPT': 'text/plain'})):
+            with self.subTest(query=query, headers=headers):
+                response = self.download(query, **headers)
+                self.assertEqual(
+                    response['Content-Type'], 'text/plain; charset=utf-8')
+                self.assertIn('shoping_list.txt',
+                              response['Content-Disposition'])
+                lines = self.read(response).splitlines()
+                self.assertEqual(lines[:2], ['Список покупок', ''])
+                self.assertEqual(lines[2:], [
+                    f'- {name} ({unit}) - {amount}'
+                    for name, unit, amount in self.get_expected_rows()
+                ])
+
+    def test_csv(self):
+        for query, headers in (('?format=csv', {}),
+                               ('', {'HTTP_ACCEPT': 'text/csv'})):
+            with self.subTest(query=query, headers=headers):
+                response = self.download(query, **headers)
+                self.assertEqual(
+                    response['Content-Type'], 'text/csv; charset=utf-8')
+                rows = list(csv.reader(io.StringIO(self.read(response))))
+                self.assertEqual(
+                    rows[0], ['name', 'measurement_unit', 'amount'])
+                self.assertEqual(rows[1:], [
+                    [name, unit, str(amount)]
+                    for name, unit, amount in self.get_expected_rows()
+                ])
+
+    def test_json(self):
+        for query, headers in (('?format=json', {}),
+                               ('', {'HTTP_ACCEPT': 'application/json'})):
+            with self.subTest(query=query, headers=headers):
+                response = self.download(query, **headers)
+                self.assertEqual(response['Content-Type'], 'application/json')
+                self.assertEqual(json.loads(self.read(response)), [
+                    {'name': name, 'measurement_unit': unit, 'amount': amount}
+                    for name, unit, amount in self.get_expected_rows()
+                ])
+
+    def test_empty_cart(self):
+        Cart.objects.all().delete()
+        response = self.download('?format=json')
+        self.assertEqual(json.loads(self.read(response)), [])
+        response = self.download('?format=csv')
+        self.assertEqual(
+            self.read(response).splitlines(),
+            ['name,measurement_unit,amount'])
+
+    def test_accept_fallback(self):
+        """PDF is the default for missing, wildcard and mixed Accept."""
+        for accept in (None, '*/*', 'application/xml, */*;q=0.1'):
+            with self.subTest(accept=accept):
+                headers = {'HTTP_ACCEPT': accept} if accept else {}
+                response = self.download(**headers)
+                self.assertEqual(response['Content-Type'], 'application/pdf')
+                self.assertTrue(response.content.startswith(b'%PDF'))
+
+    def test_not_acceptable(self):
+        response = self.client.get(URL, HTTP_ACCEPT='application/xml')
+        self.assertEqual(response.status_code, 406)
+        response = self.client.get(f'{URL}?format=xml')
+        self.assertEqual(response.status_code, 404)
+
+    def test_pages(self):
+        """Purchases that do not fit on one page continue on the next."""
+        response = self.client.get(URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(
+            len(re.findall(rb'/Type /Page\b', response.content)), 2)
+
+    def test_concurrent_renders_coalesced(self):
+        """Identical concurrent requests render the document once."""
+        purchases = self.get_purchases()
+        digest = shopping_list.get_digest(purchases)
+        results = []
+
+        def render(purchases):
+            time.sleep(0.2)
+            return b'%PDF'
+
+        def get_pdf():
+            results.append(shopping_list.get_pdf(purchases, digest))
+
+        with mock.patch.object(
+                shopping_list, 'render_pdf', side_effect=render) as mocked:
+            threads = [threading.Thread(target=get_pdf) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(mocked.call_count, 1)
+        self.assertEqual(results, [b'%PDF'] * 4)
+        gc.collect()
+        self.assertNotIn(digest, shopping_list._render_locks)
+
+    def test_failed_render_releases_locks(self):
+        purchases = self.get_purchases()
+        digest = shopping_list.get_digest(purchases)
+        with mock.patch.object(
+                shopping_list, 'render_pdf', side_effect=OSError):
+            with self.assertRaises(OSError):
+                shopping_list.get_pdf(purchases, digest)
+        gc.collect()
+        self.assertNotIn(digest, shopping_list._render_locks)
+        self.assertIsNone(cache.get(f'shopping_list:pdf:{digest}:lock'))
+        self.assertTrue(
+            shopping_list.get_pdf(purchases, digest).startswith(b'%PDF'))
+
+    def test_foreign_render_lock_kept(self):
+        """A process that did not take the cache lock leaves it to its
+        owner after rendering on timeout."""
+        purchases = self.get_purchases()
+        digest = shopping_list.get_digest(purchases)
+        lock_key = f'shopping_list:pdf:{digest}:lock'
+        cache.set(lock_key, 'owner')
+        with mock.patch.object(shopping_list, 'RENDER_TIMEOUT', 0):
+            self.assertTrue(
+                shopping_list.get_pdf(purchases, digest).startswith(b'%PDF'))
+        self.assertEqual(cache.get(lock_key), 'owner')
+        cache.delete(lock_key)
+
+    def test_job_file_is_private(self):
+        """Rendered files are stored outside MEDIA_ROOT and are served only
+        to the job' owner."""
+        response = self.client.post(URL)
+        self.assertEqual(response.status_code, 202)
+        call_command('render_shopping_lists', '--once', stdout=io.StringIO())
+        job = ShoppingListJob.objects.get()
+        self.assertEqual(job.status, ShoppingListJob.DONE)
+        self.assertTrue(job.file.path.startswith(PRIVATE_MEDIA_ROOT))
+        self.assertFalse(os.listdir(MEDIA_ROOT))
+        with self.assertRaises(ValueError):
+            job.file.url
+        response = self.client.get(self.client.get(
+            response['Location']).data['file'])
+        self.assertEqual(b''.join(response.streaming_content)[:4], b'%PDF')
+        other = APIClient()
+        other.force_authenticate(User.objects.create(
+            username='other', email='other@foodgram.ru'))
+        response = other.get(f'{URL}{job.id}/file/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_job_invalid_id(self):
+        """Malformed job ids are not found instead of failing the lookup."""
+        for job_id in ('abc', '0' * 32, f'{uuid.uuid4()}0'):
+            for suffix in ('', 'file/'):
+                with self.subTest(job_id=job_id, suffix=suffix):
+                    response = self.client.get(f'{URL}{job_id}/{suffix}')
+                    self.assertEqual(response.status_code, 404)
+
+    def test_job_unknown_id(self):
+        for suffix in ('', 'file/'):
+            response = self.client.get(f'{URL}{uuid.uuid4()}/{suffix}')
+            self.assertEqual(response.status_code, 404)
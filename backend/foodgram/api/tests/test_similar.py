@@ -0,0 +1,172 @@
+import io
+import shutil
+import tempfile
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes import similarity
+from recipes.models import (Ingredient, IngredientInRecipe, Recipe,
+                            SimilarRecipe, SimilarRecipeRefresh, Tag)
+from users.models import User
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, SIMILAR_RECIPES_MAX_DF=0.8)
+class SimilarRecipesTest(TestCase):
+    """Similar recipes built by the command and refreshed on write."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='author', email='author@foodgram.ru')
+        cls.tags = Tag.objects.bulk_create(
+            Tag(name=slug, color='#49B64E', slug=slug)
+            for slug in ('breakfast', 'lunch')
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(5)
+        )
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г')
+        cls.recipes = [
+            cls.create_recipe(ingredients, tags)
+            for ingredients, tags in (
+                ((0, 1, 2), (0,)),
+                ((0, 1, 2), (1,)),
+                ((0, 1, 3), (0,)),
+                ((4,), ()),
+                ((), ()),
+            )
+        ]
+
+    @classmethod
+    def create_recipe(cls, ingredients, tags):
+        recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', text='Текст',
+            image='recipe.jpg', cooking_time=10)
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in [
+                *(cls.ingredients[index] for index in ingredients), cls.salt]
+        )
+        recipe.tags.set(cls.tags[index] for index in tags)
+        return recipe
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def build(self, **options):
+        call_command(
+            'build_similar_recipes', max_pairs=2, stdout=io.StringIO(),
+            **options)
+
+    def get_similar(self, recipe):
+        return {
+            row.similar_id: row.score
+            for row in SimilarRecipe.objects.filter(recipe=recipe)
+        }
+
+    def assert_similar(self, recipe, expected):
+        similar = self.get_similar(recipe)
+        self.assertEqual(similar.keys(), expected.keys())
+        for pk, score in expected.items():
+            self.assertAlmostEqual(similar[pk], score)
+
+    def test_build(self):
+        """Salt is in every recipe and makes no recipes similar."""
+        self.build()
+        first, second, third, other, _ = self.recipes
+        self.assert_similar(first, {
+            second.id: 0.75 * 3 / 5, third.id: 0.75 * 2 / 6 + 0.25})
+        self.assert_similar(other, {})
+        response = APIClient().get(f'/api/recipes/{first.id}/similar/')
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()],
+            [third.id, second.id])
+        response = APIClient().get(f'/api/recipes/{other.id}/similar/')
+        self.assertEqual(response.json(), [])
+        response = APIClient().get('/api/recipes/900/similar/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_refresh_matches_build(self):
+        self.build()
+        built = {recipe.id: self.get_similar(recipe)
+                 for recipe in self.recipes}
+        for recipe in self.recipes:
+            similarity.refresh(recipe.id)
+            self.assert_similar(recipe, built[recipe.id])
+
+    def test_refresh_on_write(self):
+        self.build()
+        first, second, third, other, _ = self.recipes
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.patch(
+            f'/api/recipes/{other.id}/',
+            {'ingredients': [
+                {'id': self.ingredients[index].id, 'amount': 1}
+                for index in (0, 1, 2)
+            ]},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assert_similar(other, {})
+        self.assertEqual(
+            list(SimilarRecipeRefresh.objects.values_list(
+                'recipe_id', flat=True)),
+            [other.id])
+        self.build(pending=True)
+        self.assertFalse(SimilarRecipeRefresh.objects.exists())
+        self.assert_similar(other, {
+            first.id: 0.75 * 3 / 4, second.id: 0.75 * 3 / 4,
+            third.id: 0.75 * 2 / 5})
+        self.assertAlmostEqual(
+            self.get_similar(first)[other.id], 0.75 * 3 / 4)
+        self.assertAlmostEqual(
+            self.get_similar(third)[other.id], 0.75 * 2 / 5)
+
+    def test_queue_on_model_changes(self):
+        """Ingredient and tag changes outside the API queue the refresh,
+        deleting a recipe does not."""
+        self.build()
+        first, second, third, other, empty = self.recipes
+        queued = SimilarRecipeRefresh.objects.values_list(
+            'recipe_id', flat=True)
+        IngredientInRecipe.objects.bulk_create([IngredientInRecipe(
+            recipe=empty, ingredient=self.ingredients[4], amount=1)])
+        IngredientInRecipe.objects.filter(recipe=other).delete()
+        first.tags.clear()
+        self.tags[1].recipes.add(third)
+        self.assertCountEqual(
+            queued.all(), [empty.id, other.id, first.id, third.id])
+        SimilarRecipeRefresh.objects.all().delete()
+        second.delete()
+        self.tags[0].recipes.clear()
+        self.assertCountEqual(queued.all(), [third.id])
+
+    def test_build_clears_queue(self):
+        similarity.schedule([self.recipes[0].id])
+        self.build()
+        self.assertFalse(SimilarRecipeRefresh.objects.exists())
+
+    @override_settings(SIMILAR_RECIPES_COUNT=1)
+    def test_refresh_keeps_best(self):
+        self.build()
+        first, second, third, other, _ = self.recipes
+        IngredientInRecipe.objects.filter(recipe=other).delete()
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=other, ingredient=ingredient, amount=1)
+            for ingredient in [
+                *(self.ingredients[index] for index in (0, 1, 3)), self.salt]
+        )
+        other.tags.set(self.tags[:1])
+        similarity.refresh(other.id)
+        self.assert_similar(other, {third.id: 0.75 * 3 / 5 + 0.25})
+        self.assert_similar(third, {other.id: 0.75 * 3 / 5 + 0.25})
+        self.assert_similar(first, {third.id: 0.75 * 2 / 6 + 0.25})
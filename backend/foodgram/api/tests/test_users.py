@@ -0,0 +1,68 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from recipes.models import Follow
+from users.models import User
+
+
+class UserSearchTest(TestCase):
+    """User list prefix search and subscription flags."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader', email='reader@foodgram.ru',
+            first_name='Анна', last_name='Смирнова')
+        cls.by_username = User.objects.create(
+            username='ivan_cook', email='cook@foodgram.ru',
+            first_name='Семен', last_name='Сидоров')
+        cls.by_first_name = User.objects.create(
+            username='chef', email='chef@foodgram.ru',
+            first_name='Иван', last_name='Петров')
+        cls.by_last_name = User.objects.create(
+            username='baker', email='baker@foodgram.ru',
+            first_name='Олег', last_name='Иванов')
+        Follow.objects.create(user=cls.user, author=cls.by_first_name)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, text):
+        response = self.client.get('/api/users/', {'search': text})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_prefix_search(self):
+        for text, user in (
+            ('ivan', self.by_username),
+            ('Петр', self.by_first_name),
+            ('Олег', self.by_last_name),
+            ('baker@', self.by_last_name),
+        ):
+            with self.subTest(text=text):
+                self.assertEqual(
+                    [found['id'] for found in self.search(text)], [user.id])
+        self.assertEqual(
+            [found['id'] for found in self.search('Иван')],
+            [self.by_first_name.id, self.by_last_name.id])
+
+    def test_no_match(self):
+        """Only prefixes match."""
+        self.assertEqual(self.search('ван'), [])
+        self.assertEqual(self.search('foodgram'), [])
+
+    def test_is_subscribed(self):
+        flags = {
+            found['id']: found['is_subscribed'] for found in self.search('')
+        }
+        self.assertEqual(flags, {
+            self.user.id: False,
+            self.by_username.id: False,
+            self.by_first_name.id: True,
+            self.by_last_name.id: False,
+        })
+        other = APIClient()
+        other.force_authenticate(self.by_username)
+        response = other.get('/api/users/', {'search': 'chef'})
+        self.assertFalse(response.json()[0]['is_subscribed'])
@@ -1,37 +1,66 @@
+import time
 from http import HTTPStatus
-from typing import Union
 
 from rest_framework import viewsets
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.permissions import IsAuthenticated, AllowAny
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
-from django.db.models import Sum
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.lib import colors
-from reportlab.pdfgen import canvas
-
-from recipes.models import (Cart, Favorite, Follow, Ingredient,
-                            IngredientInRecipe, Recipe, Tag)
+from django.http import (FileResponse, Http404, HttpResponse,
+                         StreamingHttpResponse)
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Prefetch, Subquery
+
+from recipes.ingredient_index import ingredient_index
+from recipes.models import (Cart, Favorite, Follow, Ingredient, Recipe,
+                            ShoppingListJob, SimilarRecipe, Tag,
+                            with_is_subscribed)
+from recipes.versions import INGREDIENTS, SCORES, TAGS
 from users.models import User
-from .serializers import (CartSerializer, FollowSerializer,
-                          IngredientSerializer, RecipePostSerializer,
-                          RecipeSerializer, SetPasswordSerializer,
-                          TagSerializer, UserSerializer, UserCreateSerializer)
+from .bulk import (DELETED, EXISTS, NOT_FOUND, add_links, get_statuses_data,
+                   parse_id, remove_links)
+from .serializers import (RECIPES_LIMIT_MAX, BulkIdsSerializer, CartSerializer,
+                          FollowSerializer, IngredientSerializer,
+                          RecipePostSerializer, RecipeSerializer,
+                          SetPasswordSerializer, ShoppingListJobSerializer,
+                          SubscriptionsParamsSerializer, TagSerializer,
+                          UserCreateSerializer, UserSerializer)
+from .conditional import (ConditionalGetMixin, get_table_versions,
+                          query_params)
+from .response_cache import AnonymousCacheMixin
 from .permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
-from .filters import IngredientSearchFilter, RecipeFilter
-from .pagination import LimitPageNumberPagination
+from .filters import RecipeFilter, UserFilter
+from .parsers import RecipeMultiPartParser
+from .reference_data import (ReferenceDataMixin, ingredients_snapshot,
+                             tags_snapshot)
+from .pagination import (FeedPagination, LimitPageNumberPagination,
+                         RecipePagination)
+from .renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from .shopping_list import STREAMS, get_digest, get_pdf, get_purchases
+
+# Only canonical UUIDs reach the lookup, anything else is a 404 from the
+# router instead of a validation error from the database.
+JOB_ID_PATTERN = (
+    r'(?P<job_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-'
+    r'[0-9a-f]{12})'
+)
 
 
 class UserViewSet(viewsets.ModelViewSet):
     """Users' viewset."""
-    queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = LimitOffsetPagination
     permission_classes = [AllowAny]
+    filter_class = UserFilter
+
+    def get_queryset(self):
+        return with_is_subscribed(
+            User.objects.all(), self.request.user).order_by('id')
 
     def get_serializer_class(self):
         if self.request.method == 'POST':
@@ -56,21 +85,38 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=HTTPStatus.BAD_REQUEST
             )
         current_user.set_password(request.data.get('new_password'))
-        current_user.save()
+        current_user.save(update_fields=['password'])
         return Response(
             {'message': 'Пароль изменен'},
             status=HTTPStatus.OK
         )
 
+    def get_follows(self, recipes_limit=RECIPES_LIMIT_MAX):
+        """Current user' follows with authors' recipes preview."""
+        recipes = Recipe.objects.filter(pk__in=Subquery(
+            Recipe.objects.filter(
+                author=OuterRef('author')
+            ).order_by('date', 'id').values('pk')[:recipes_limit]
+        )).order_by('date', 'id')
+        return Follow.objects.filter(
+            user=self.request.user
+        ).select_related('author').prefetch_related(
+            Prefetch('author__recipes', queryset=recipes,
+                     to_attr='recipes_preview')
+        ).order_by('-following_date', '-id')
+
     @action(
         methods=['GET'],
         detail=False,
         permission_classes=[IsAuthenticated],
+        pagination_class=LimitPageNumberPagination,
     )
     def subscriptions(self, request):
         """Getting all subscriptions with recipes limit."""
-        user = request.user
-        follows = Follow.objects.filter(user=user)
+        params = SubscriptionsParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        follows = self.get_follows(
+            params.validated_data['recipes_limit'])
         pages = self.paginate_queryset(follows)
         serializer = FollowSerializer(
             pages,
@@ -87,41 +133,61 @@ class UserViewSet(viewsets.ModelViewSet):
     def subscribe(self, request, pk):
         """Create/delete subscribe."""
         user = request.user
-        author = get_object_or_404(User, id=pk)
-        if request.method == 'POST':
-            if Follow.objects.filter(
-                user=user,
-                author=author
-            ).exists():
-                return Response(
-                    {'errors': 'Вы уже подписаны на этого автора'},
-                    status=HTTPStatus.BAD_REQUEST,
-                )
-            if user == author:
-                return Response(
-                    {'errors': 'Нельзя подписаться на себя'},
-                    status=HTTPStatus.BAD_REQUEST,
-                )
-            follow = Follow.objects.create(
-                user=user,
-                author=author
+        pk = parse_id(pk)
+        if request.method == 'DELETE':
+            statuses = remove_links(Follow, user, 'author', [pk])
+            if statuses[pk] == DELETED:
+                return Response(status=HTTPStatus.NO_CONTENT)
+            return Response(
+                {'errors': 'Вы не подписаны на данного автора'},
+                status=HTTPStatus.BAD_REQUEST
             )
-            serializer = FollowSerializer(
-                follow,
-                context={'request': request},
+        if pk == user.pk:
+            return Response(
+                {'errors': 'Нельзя подписаться на себя'},
+                status=HTTPStatus.BAD_REQUEST,
             )
-            return Response(serializer.data)
-        follow = Follow.objects.filter(
-            user=user,
-            author=author
-        )
-        if follow.exists():
-            follow.delete()
-            return Response(status=HTTPStatus.NO_CONTENT)
-        return Response(
-            {'errors': 'Вы не подписаны на данного автора'},
-            status=HTTPStatus.BAD_REQUEST
+        params = SubscriptionsParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        statuses, _ = add_links(
+            Follow, user, 'author', User.objects.all(), [pk])
+        if statuses[pk] == NOT_FOUND:
+            raise Http404
+        if statuses[pk] == EXISTS:
+            return Response(
+                {'errors': 'Вы уже подписаны на этого автора'},
+                status=HTTPStatus.BAD_REQUEST,
+            )
+        follow = self.get_follows(
+            params.validated_data['recipes_limit']).get(author_id=pk)
+        serializer = FollowSerializer(
+            follow,
+            context={'request': request},
         )
+        return Response(serializer.data)
+
+    @action(
+        methods=['POST', 'DELETE'],
+        detail=False,
+        url_path='subscribe',
+        url_name='subscribe-bulk',
+        permission_classes=[IsAuthenticated]
+    )
+    def subscribe_bulk(self, request):
+        """Subscribe to or unsubscribe from many authors.
+
+        Statuses are reported per id, the user itself is not_found.
+        """
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.method == 'POST':
+            statuses, _ = add_links(
+                Follow, request.user, 'author',
+                User.objects.exclude(pk=request.user.pk).only('id'), ids)
+        else:
+            statuses = remove_links(Follow, request.user, 'author', ids)
+        return Response(get_statuses_data(statuses))
 
     @action(detail=False,
             pagination_class=None,
@@ -139,35 +205,123 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(serializer.data, status=HTTPStatus.OK)
 
 
-class TagViewSet(viewsets.ModelViewSet):
+class TagViewSet(ReferenceDataMixin, viewsets.ModelViewSet):
     """Tag' viewset."""
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
     permission_classes = [IsAdminOrReadOnly]
+    snapshot = tags_snapshot
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ReferenceDataMixin, viewsets.ModelViewSet):
     """Ingredient' viewset."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [IsAdminOrReadOnly, ]
-    filter_backends = (IngredientSearchFilter, )
-    search_fields = ('^name',)
     pagination_class = None
+    snapshot = ingredients_snapshot
 
+    def list_snapshot(self, request):
+        """Autocomplete by ?name= from the in-process ingredient index."""
+        name = request.query_params.get('name')
+        if name is None:
+            return super().list_snapshot(request)
+        return Response(ingredient_index.search(
+            get_table_versions(request), name,
+            settings.INGREDIENTS_SEARCH_LIMIT))
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    """Ingredient' viewset."""
-    queryset = Recipe.objects.all()
+
+def get_user_lists_state(user):
+    """Expressions of the number and last id of the user's favorites, carts
+    and follows.
+
+    Ids only grow, so any change of a list changes its pair.
+    """
+    if user.is_anonymous:
+        return {}
+    state = {}
+    for model in (Favorite, Cart, Follow):
+        rows = model.objects.filter(user=user).order_by().values('user')
+        name = model._meta.model_name
+        state[f'{name}_count'] = Subquery(
+            rows.annotate(value=Count('pk')).values('value'))
+        state[f'{name}_last'] = Subquery(
+            rows.annotate(value=Max('pk')).values('value'))
+    return state
+
+
+class RecipeViewSet(AnonymousCacheMixin, ConditionalGetMixin,
+                    viewsets.ModelViewSet):
+    """Recipe' viewset."""
     serializer_class = RecipeSerializer
-    paginator_class = LimitPageNumberPagination
+    pagination_class = RecipePagination
     permission_classes = [IsAuthorOrReadOnly]
+    parser_classes = [JSONParser, RecipeMultiPartParser]
     filter_class = RecipeFilter
 
+    def get_queryset(self):
+        user = self.request.user
+        return Recipe.objects.with_user_flags(user).with_related(user)
+
+    def filter_queryset(self, queryset):
+        """Filter once per request, validators and list share the result."""
+        if not hasattr(self, 'filtered_queryset'):
+            self.filtered_queryset = super().filter_queryset(queryset)
+        return self.filtered_queryset
+
+    def get_validators(self, request):
+        """Update dates of recipes and authors, the user's lists and
+        reference data versions.
+
+        Favorites, carts and follows change counters of recipes and authors
+        but not their update dates, so they do not change validators of
+        other users. Counters are covered by a period of
+        CONDITIONAL_COUNTERS_TIMEOUT seconds instead, flags of the user by
+        get_user_lists_state(). Lists are validated by an aggregate over
+        the filtered recipes, so a 304 does not read the page.
+        """
+        state = get_user_lists_state(request.user)
+        if self.action == 'retrieve':
+            pk = parse_id(self.kwargs['pk'])
+            row = Recipe.objects.filter(pk=pk).annotate(**state).values_list(
+                'updated', 'author__updated', *state).first()
+            if row is None:
+                return None
+            parts = ['recipe', pk, *row]
+            dates = list(row[:2])
+        else:
+            # The maximum of a constant subquery is its value, the user's
+            # lists are read by the same query.
+            stats = Recipe.objects.filter(
+                pk__in=self.filter_queryset(
+                    self.get_queryset()).order_by().values('pk')
+            ).aggregate(
+                count=Count('pk'),
+                updated=Max('updated'),
+                author_updated=Max('author__updated'),
+                **{name: Max(value) for name, value in state.items()},
+            )
+            parts = ['recipes', query_params(request), *stats.values()]
+            dates = [stats['updated'], stats['author_updated']]
+        parts.append(
+            int(time.time() // settings.CONDITIONAL_COUNTERS_TIMEOUT))
+        table_versions = get_table_versions(request)
+        for name in (TAGS, INGREDIENTS, SCORES):
+            version, updated = table_versions.get(name, (0, None))
+            parts.append(version)
+            dates.append(updated)
+        dates = [date for date in dates if date is not None]
+        return parts, max(dates, default=None)
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_update(self, serializer):
+        serializer.save()
+
     def get_serializer_class(self):
         if self.request.method in ['POST', 'PATCH']:
             return RecipePostSerializer
@@ -175,17 +329,17 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def create_object(self, model, user, pk):
         """Create new object."""
-        if model.objects.filter(user=user, recipe__id=pk).exists():
+        pk = parse_id(pk)
+        statuses, recipes = add_links(
+            model, user, 'recipe', Recipe.objects.all(), [pk])
+        if statuses[pk] == NOT_FOUND:
+            raise Http404
+        if statuses[pk] == EXISTS:
             return Response(
                 {'errors': 'Рецепт уже в списке.'},
                 status=HTTPStatus.BAD_REQUEST,
             )
-        recipe = get_object_or_404(Recipe, pk=pk)
-        model.objects.create(
-            user=user,
-            recipe=recipe
-        )
-        serializer = CartSerializer(recipe)
+        serializer = CartSerializer(recipes[pk])
         return Response(
             serializer.data,
             status=HTTPStatus.CREATED,
@@ -193,15 +347,28 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     def delete_object(self, model, user, pk):
         """Delete object."""
-        obj = model.objects.filter(user=user, recipe__id=pk)
-        if obj.exists():
-            obj.delete()
+        pk = parse_id(pk)
+        statuses = remove_links(model, user, 'recipe', [pk])
+        if statuses[pk] == DELETED:
             return Response(status=HTTPStatus.NO_CONTENT)
         return Response(
             {'errors': 'Рецепт уже удален'},
             status=HTTPStatus.BAD_REQUEST,
         )
 
+    def bulk_objects(self, request, model):
+        """Add or delete many recipes, statuses are reported per id."""
+        serializer = BulkIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.method == 'POST':
+            statuses, _ = add_links(
+                model, request.user, 'recipe', Recipe.objects.only('id'),
+                ids)
+        else:
+            statuses = remove_links(model, request.user, 'recipe', ids)
+        return Response(get_statuses_data(statuses))
+
     @action(
         methods=['post', 'delete'],
         detail=True,
@@ -240,49 +407,162 @@ class RecipeViewSet(viewsets.ModelViewSet):
             pk=pk,
         )
 
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk',
+        permission_classes=[IsAuthenticated]
+    )
+    def shopping_cart_bulk(self, request):
+        """Add or delete many recipes from shopping cart."""
+        return self.bulk_objects(request, Cart)
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='favorite',
+        url_name='favorite-bulk',
+        permission_classes=[IsAuthenticated]
+    )
+    def favorite_bulk(self, request):
+        """Add or delete many recipes from favorites list."""
+        return self.bulk_objects(request, Favorite)
+
+    @action(methods=['GET'], detail=True, pagination_class=None)
+    def similar(self, request, pk):
+        """Precomputed most similar recipes, best first."""
+        ids = list(SimilarRecipe.objects.filter(
+            recipe_id=parse_id(pk)
+        ).order_by('-score', 'similar_id').values_list(
+            'similar_id', flat=True))
+        if not ids:
+            get_object_or_404(Recipe, pk=pk)
+        recipes = self.get_queryset().in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[similar_id] for similar_id in ids
+             if similar_id in recipes],
+            many=True,
+        )
+        return Response(serializer.data)
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        """Recipes of followed authors, newest first."""
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    def get_renderers(self):
+        if self.action == 'download_shopping_cart':
+            return [renderer() for renderer in (
+                PDFRenderer, JSONRenderer, CSVRenderer, PlainTextRenderer)]
+        return super().get_renderers()
+
     @action(
         methods=['GET'],
         detail=False,
         permission_classes=[IsAuthenticated],
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        purchases: dict[str, Union[str, int]] = {}
-        ingredients = IngredientInRecipe.objects.filter(
-            recipe__cart__user=user).values(
-                'ingredient__name',
-                'ingredient__measurement_unit').annotate(
-                    amount_in_cart=Sum('amount'))
-        for ingredient in ingredients:
-            name = ingredient.get('ingredient__name')
-            measurement_unit = ingredient.get('ingredient__measurement_unit')
-            amount = ingredient.get('amount_in_cart')
-            purchases[name] = {
-                'measurement_unit': measurement_unit,
-                'amount': amount,
-            }
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = (
-            'attachment; filename="shoping_list.pdf"')
-        pdfmetrics.registerFont(TTFont('GOST', 'GOST type A.ttf', 'UTF-8'))
-        pdf = canvas.Canvas(response)
-        pdf.setFont('GOST', 40)
-        pdf.setFillColor(colors.black)
-        pdf.drawCentredString(300, 770, 'Список покупок')
-        pdf.setFillColor(colors.black)
-        pdf.setFont('GOST', 24)
-        height = 700
-        for name, data in purchases.items():
-            pdf.drawString(
-                60,
-                height,
-                f"- {name} ({data['measurement_unit']}) - {data['amount']}"
+        """Shopping list in the format chosen by ?format= or Accept.
+
+        PDF is cached by cart content with ETag support, other formats are
+        streamed straight from the aggregate query.
+        """
+        file_format = request.accepted_renderer.format
+        if file_format in STREAMS:
+            stream, content_type, filename = STREAMS[file_format]
+            response = StreamingHttpResponse(
+                stream(get_purchases(request.user).iterator()),
+                content_type=content_type,
+            )
+            response['Content-Disposition'] = (
+                f'attachment; filename="{filename}"')
+            return response
+        purchases = get_purchases(request.user)
+        digest = get_digest(purchases)
+        etag = f'"{digest}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponse(status=HTTPStatus.NOT_MODIFIED)
+        else:
+            response = HttpResponse(
+                get_pdf(purchases, digest),
+                content_type='application/pdf',
             )
-            height -= 25
-            if height == 50:
-                pdf.showPage()
-                pdf.setFont('Neocyr', 24)
-                height = 700
-        pdf.showPage()
-        pdf.save()
+            response['Content-Disposition'] = (
+                'attachment; filename="shoping_list.pdf"')
+        response['ETag'] = etag
+        response['Cache-Control'] = 'private, no-cache'
         return response
+
+    @download_shopping_cart.mapping.post
+    def create_shopping_cart_job(self, request):
+        """Queue shopping list PDF rendering for the worker.
+
+        Returns the pending job for the same cart content if there is one.
+        Finished jobs of the user are replaced.
+        """
+        user = request.user
+        digest = get_digest(get_purchases(user))
+        jobs = ShoppingListJob.objects.filter(user=user)
+        job = jobs.filter(digest=digest).exclude(
+            status=ShoppingListJob.FAILED).first()
+        if job is None:
+            for old_job in jobs.exclude(status__in=[
+                ShoppingListJob.PENDING, ShoppingListJob.RUNNING
+            ]):
+                old_job.file.delete(save=False)
+                old_job.delete()
+            job = ShoppingListJob.objects.create(user=user, digest=digest)
+        serializer = ShoppingListJobSerializer(
+            job, context={'request': request})
+        response = Response(serializer.data, status=HTTPStatus.ACCEPTED)
+        response['Location'] = reverse(
+            'api:recipes-shopping-cart-job',
+            kwargs={'job_id': job.id},
+            request=request,
+        )
+        return response
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path=rf'download_shopping_cart/{JOB_ID_PATTERN}',
+        url_name='shopping-cart-job',
+    )
+    def shopping_cart_job(self, request, job_id):
+        """Shopping list rendering job status."""
+        job = get_object_or_404(
+            ShoppingListJob, id=job_id, user=request.user)
+        serializer = ShoppingListJobSerializer(
+            job, context={'request': request})
+        return Response(serializer.data)
+
+    @action(
+        methods=['GET'],
+        detail=False,
+        permission_classes=[IsAuthenticated],
+        url_path=rf'download_shopping_cart/{JOB_ID_PATTERN}/file',
+        url_name='shopping-cart-job-file',
+    )
+    def shopping_cart_job_file(self, request, job_id):
+        """Rendered shopping list PDF."""
+        job = get_object_or_404(
+            ShoppingListJob,
+            id=job_id,
+            user=request.user,
+            status=ShoppingListJob.DONE,
+        )
+        return FileResponse(
+            job.file.open('rb'),
+            as_attachment=True,
+            filename='shoping_list.pdf',
+            content_type='application/pdf',
+        )
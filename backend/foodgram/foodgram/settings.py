@@ -1,5 +1,6 @@
 # from datetime import timedelta
 import os
+import tempfile
 
 from dotenv import load_dotenv
 
@@ -74,6 +75,42 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_cache')),
+    },
+    # Rendered anonymous recipe responses, see api.response_cache.
+    'responses': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'RESPONSE_CACHE_LOCATION',
+            default=os.path.join(
+                tempfile.gettempdir(), 'foodgram_response_cache')),
+        'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('RESPONSE_CACHE_MAX_ENTRIES', default=5000)),
+            'CULL_FREQUENCY': 3,
+        },
+    },
+}
+
+# Counters in recipe responses revalidated with ETag may lag by this many
+# seconds, favorites, carts and follows do not change the validators.
+CONDITIONAL_COUNTERS_TIMEOUT = int(
+    os.getenv('CONDITIONAL_COUNTERS_TIMEOUT', default=300))
+
+# Share of anonymous requests counted in the response cache statistics.
+RESPONSE_CACHE_STATS_RATE = float(
+    os.getenv('RESPONSE_CACHE_STATS_RATE', default=0.01))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation'
@@ -121,10 +158,45 @@ AUTH_USER_MODEL = 'users.User'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Files downloaded only through authenticated API views.
+PRIVATE_MEDIA_ROOT = os.getenv(
+    'PRIVATE_MEDIA_ROOT', default=os.path.join(BASE_DIR, 'private'))
 
 STATIC_URL = '/backend_static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'backend_static')
 
+INGREDIENTS_SEARCH_LIMIT = 50
+
+# Limits of recipe images uploaded as base64 or multipart/form-data.
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', default=10 * 1024 * 1024))
+RECIPE_IMAGE_MAX_SIDE = int(os.getenv('RECIPE_IMAGE_MAX_SIDE', default=8000))
+
+# Recipes of authors with at least this many followers are not copied to the
+# followers' feeds, the feed reads them from the recipes table. Copying
+# resumes only when the author has fewer than FEED_FANOUT_MIN_FOLLOWERS, so
+# an author around the threshold does not switch back and forth.
+FEED_FANOUT_MAX_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', default=1000))
+FEED_FANOUT_MIN_FOLLOWERS = int(
+    os.getenv('FEED_FANOUT_MIN_FOLLOWERS', default=800))
+FEED_BATCH_SIZE = 1000
+
+# Similar recipes: neighbours kept per recipe, weight of shared tags against
+# shared ingredients and the share of recipes above which an ingredient,
+# like salt, is too common to make recipes similar.
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_RECIPES_TAGS_WEIGHT = 0.25
+SIMILAR_RECIPES_MAX_DF = float(
+    os.getenv('SIMILAR_RECIPES_MAX_DF', default=0.05))
+
+# Half-lives of favorites and carts in the popular and trending orderings.
+# Run update_recipe_scores --all after changing them.
+RECIPE_POPULAR_HALF_LIFE_DAYS = float(
+    os.getenv('RECIPE_POPULAR_HALF_LIFE_DAYS', default=30))
+RECIPE_TRENDING_HALF_LIFE_DAYS = float(
+    os.getenv('RECIPE_TRENDING_HALF_LIFE_DAYS', default=1))
+
 DJOSER = {
     'LOGIN_FIELD': 'email'
 }
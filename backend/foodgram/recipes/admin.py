@@ -1,14 +1,49 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
+from . import search, similarity
 from .models import (Cart, Favorite, Follow, Ingredient,
-                     IngredientInRecipe, Recipe, Tag)
+                     IngredientInRecipe, Recipe, ShoppingListJob, Tag)
+
+# Below this number of rows the exact count is cheap enough.
+ESTIMATED_COUNT_MIN = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator using PostgreSQL table statistics for unfiltered lists.
+
+    Filtered and searched lists, and small tables, are counted exactly.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATED_COUNT_MIN:
+                return int(row[0])
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Admin interface for tables with millions of rows."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     """Admin interface for tags."""
     list_display = ('id', 'name', 'color', 'slug')
-    search_fields = ('slug',)
+    search_fields = ('slug', 'name')
     list_filter = ('color',)
 
 
@@ -17,47 +52,77 @@ class IngredientAdmin(admin.ModelAdmin):
     """Admin interface for ingredients."""
     list_display = ('id', 'name', 'measurement_unit',)
     search_fields = ('name',)
-    list_filter = ('name', 'measurement_unit',)
+    list_filter = ('measurement_unit',)
+
+
+class IngredientInRecipeInline(admin.TabularInline):
+    """Ingredients on the recipe page."""
+    model = IngredientInRecipe
+    autocomplete_fields = ('ingredient',)
+    extra = 0
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdmin):
     """Admin interface for recipes."""
-    list_display = ('id', 'name', 'author', 'favorites')
-    search_fields = ('name', 'author',)
-    list_filter = ('author', 'name', 'tags',)
-
-    def favorites(self, obj):
-        """Counting recipe in favorites."""
-        return obj.favorites.count()
+    list_display = ('id', 'name', 'author', 'date', 'favorites_count',
+                    'in_carts_count')
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username')
+    list_filter = ('tags',)
+    autocomplete_fields = ('author', 'tags')
+    readonly_fields = ('favorites_count', 'in_carts_count')
+    inlines = (IngredientInRecipeInline,)
+
+    def changeform_view(self, *args, **kwargs):
+        """Search vector computed and the similar recipes refresh queued
+        once for the recipe and its inlines."""
+        with similarity.deferred(), search.deferred():
+            return super().changeform_view(*args, **kwargs)
 
 
 @admin.register(IngredientInRecipe)
-class IngredientInRecipeAdmin(admin.ModelAdmin):
+class IngredientInRecipeAdmin(LargeTableAdmin):
     """Admin interface for ingredients in recipes."""
     list_display = ('ingredient', 'recipe', 'amount',)
-    search_fields = ('name', 'author',)
+    list_select_related = ('ingredient', 'recipe')
+    search_fields = ('recipe__name', 'ingredient__name')
+    raw_id_fields = ('recipe',)
+    autocomplete_fields = ('ingredient',)
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     """Admin interface for follows."""
     list_display = ('user', 'author', 'following_date',)
-    search_fields = ('user', 'author',)
-    list_filter = ('user', 'author',)
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username',)
+    raw_id_fields = ('user', 'author')
 
 
 @admin.register(Favorite)
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdmin):
     """Admin interface for favorites."""
     list_display = ('user', 'recipe',)
-    search_fields = ('user', 'recipe',)
-    list_filter = ('user', 'recipe',)
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name',)
+    raw_id_fields = ('user', 'recipe')
 
 
 @admin.register(Cart)
-class CartAdmin(admin.ModelAdmin):
+class CartAdmin(LargeTableAdmin):
     """Admin interface for carts."""
-    list_display = ('user', 'date',)
-    search_fields = ('user', 'recipe',)
-    list_filter = ('user', 'recipe',)
+    list_display = ('user', 'recipe', 'date',)
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name',)
+    raw_id_fields = ('user', 'recipe')
+
+
+@admin.register(ShoppingListJob)
+class ShoppingListJobAdmin(LargeTableAdmin):
+    """Admin interface for shopping list rendering jobs."""
+    list_display = ('id', 'user', 'status', 'created', 'updated',)
+    exclude = ('file',)
+    list_filter = ('status',)
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
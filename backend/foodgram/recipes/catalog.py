@@ -0,0 +1,33 @@
+"""Версия каталога рецептов для кеша ответов анонимным пользователям.
+
+Версия меняется при изменении данных, попадающих в представление рецептов:
+самих рецептов, их ингредиентов и тегов, авторов. Счетчики избранного,
+списков покупок и подписок версию не меняют и в закешированных ответах
+обновляются по истечении времени жизни записей.
+"""
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'catalog:version'
+
+
+def get_version():
+    """Текущая версия каталога."""
+    return cache.get_or_set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate():
+    """Смена версии каталога во всех процессах."""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def invalidate_on_commit():
+    """Смена версии сейчас и после фиксации транзакции.
+
+    Вторая смена сбрасывает ответы, закешированные параллельными запросами
+    по данным, которые были в базе до фиксации.
+    """
+    invalidate()
+    transaction.on_commit(invalidate)
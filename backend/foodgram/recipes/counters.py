@@ -0,0 +1,233 @@
+"""Денормализованные счетчики связанных объектов.
+
+Модель объявляет счетчики атрибутом counters - парами (внешний ключ, поле
+счетчика в связанной модели). Одиночные сохранения и удаления учитываются
+сигналами, пакетные - методами CountedQuerySet. После изменения счетчиков
+отправляется сигнал counters_changed с первичными ключами затронутых
+объектов по каждому внешнему ключу.
+"""
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import connections, models
+from django.db.models.functions import Coalesce, Greatest
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import catalog
+from .management.utils import batched
+
+# Базы, поддерживающие INSERT ... ON CONFLICT DO NOTHING RETURNING.
+RETURNING_VENDORS = {'postgresql', 'sqlite'}
+
+_state = threading.local()
+counters_changed = Signal()
+
+
+def counted_fields(model):
+    """Пары (внешний ключ, поле счетчика) модели."""
+    return getattr(model, 'counters', ())
+
+
+def is_suspended(model):
+    """Отключены ли сигналы счетчиков модели в текущем потоке."""
+    return model in getattr(_state, 'suspended', ())
+
+
+@contextmanager
+def suspended(model):
+    """Отключение сигналов счетчиков на время пакетной операции."""
+    previous = getattr(_state, 'suspended', frozenset())
+    _state.suspended = previous | {model}
+    try:
+        yield
+    finally:
+        _state.suspended = previous
+
+
+def touch(model):
+    """Значения полей auto_now модели для запросов update()."""
+    return {
+        field.name: timezone.now() for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)
+    }
+
+
+def change(model, rows, sign):
+    """Изменение счетчиков на число строк rows одним запросом на значение.
+
+    rows - объекты модели или словари со значениями внешних ключей.
+    Версия каталога и даты изменения объектов не меняются: счетчики в
+    закешированных ответах анонимным пользователям и в ответах с
+    валидаторами обновятся, когда истечет время жизни записей.
+    """
+    changed = {}
+    for name, counter in counted_fields(model):
+        field = model._meta.get_field(name)
+        amounts = Counter(
+            row[field.attname] if isinstance(row, dict)
+            else getattr(row, field.attname)
+            for row in rows
+        )
+        amounts.pop(None, None)
+        changed[name] = list(amounts)
+        ids_by_amount = defaultdict(list)
+        for pk, amount in amounts.items():
+            ids_by_amount[amount].append(pk)
+        for amount, ids in ids_by_amount.items():
+            if sign > 0:
+                value = models.F(counter) + amount
+            else:
+                value = Greatest(models.F(counter) - amount, 0)
+            field.related_model.objects.filter(pk__in=ids).update(
+                **{counter: value})
+    if any(changed.values()):
+        counters_changed.send(sender=model, ids=changed)
+
+
+def actual_count(model, name):
+    """Фактическое число строк model, ссылающихся на внешний объект."""
+    return Coalesce(
+        models.Subquery(
+            model.objects.filter(
+                **{name: models.OuterRef('pk')}
+            ).order_by().values(name).annotate(
+                count=models.Count('pk')
+            ).values('count')
+        ),
+        0,
+    )
+
+
+def recount(model, ids=None):
+    """Исправление расхождений счетчиков модели с фактическим числом строк.
+
+    ids ограничивает пересчет объектами с перечисленными первичными ключами
+    по каждому внешнему ключу. Возвращает число исправленных строк по
+    каждому счетчику.
+    """
+    fixed = {}
+    catalog.invalidate_on_commit()
+    for name, counter in counted_fields(model):
+        related = model._meta.get_field(name).related_model
+        queryset = related.objects.all()
+        if ids is not None:
+            queryset = queryset.filter(pk__in=ids[name])
+        fixed[f'{related.__name__}.{counter}'] = queryset.annotate(
+            actual=actual_count(model, name)
+        ).exclude(
+            **{counter: models.F('actual')}
+        ).update(**{counter: actual_count(model, name)})
+    if ids is not None:
+        counters_changed.send(sender=model, ids=ids)
+    return fixed
+
+
+class CountedQuerySet(models.QuerySet):
+    """QuerySet, учитывающий счетчики при пакетной вставке и удалении."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if kwargs.get('ignore_conflicts'):
+            # Вставленные строки неизвестны, пересчитываются затронутые.
+            recount(self.model, {
+                name: {
+                    getattr(obj, self.model._meta.get_field(name).attname)
+                    for obj in objs
+                }
+                for name, _ in counted_fields(self.model)
+            })
+        else:
+            change(self.model, objs, 1)
+        return objs
+
+    bulk_create.alters_data = True
+
+    def insert_missing(self, objs):
+        """Вставка строк, которых еще нет, без пересчета счетчиков.
+
+        INSERT ... ON CONFLICT DO NOTHING RETURNING возвращает только
+        вставленные строки, счетчики меняются ровно на них. Возвращает
+        словари с первичным ключом и внешними ключами счетчиков вставленных
+        строк. На других базах строки вставляются
+        bulk_create(ignore_conflicts=True) с пересчетом затронутых
+        счетчиков, и возвращаются все строки objs.
+        """
+        objs = list(objs)
+        opts = self.model._meta
+        keys = [opts.get_field(name) for name, _ in counted_fields(self.model)]
+        connection = connections[self.db]
+        if (connection.vendor not in RETURNING_VENDORS
+                or not connection.features.can_return_rows_from_bulk_insert):
+            self.bulk_create(objs, ignore_conflicts=True)
+            return [
+                {key.attname: getattr(obj, key.attname) for key in keys}
+                for obj in objs
+            ]
+        fields = [
+            field for field in opts.concrete_fields
+            if field is not opts.auto_field
+        ]
+        quote_name = connection.ops.quote_name
+        columns = ', '.join(quote_name(field.column) for field in fields)
+        returning = ', '.join(
+            quote_name(field.column) for field in [opts.pk, *keys])
+        placeholders = f'({", ".join(["%s"] * len(fields))})'
+        batch_size = connection.ops.bulk_batch_size(fields, objs)
+        names = ['pk', *(key.attname for key in keys)]
+        rows = []
+        with connection.cursor() as cursor:
+            for batch in batched(objs, max(batch_size, 1)):
+                cursor.execute(
+                    f'INSERT INTO {quote_name(opts.db_table)} ({columns}) '
+                    f'VALUES {", ".join([placeholders] * len(batch))} '
+                    f'ON CONFLICT DO NOTHING RETURNING {returning}',
+                    [
+                        field.get_db_prep_save(
+                            field.pre_save(obj, add=True), connection)
+                        for obj in batch for field in fields
+                    ],
+                )
+                rows.extend(dict(zip(names, row)) for row in cursor.fetchall())
+        change(self.model, rows, 1)
+        return rows
+
+    insert_missing.alters_data = True
+
+    def delete(self):
+        if not counted_fields(self.model):
+            return super().delete()
+        return self.delete_rows()[0]
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def delete_returning(self, *fields):
+        """Удаление с возвратом значений fields удаленных строк.
+
+        Значения читаются тем же запросом, что и внешние ключи счетчиков.
+        """
+        return self.delete_rows(fields)[1]
+
+    delete_returning.alters_data = True
+    delete_returning.queryset_only = True
+
+    def delete_rows(self, fields=()):
+        attnames = [
+            self.model._meta.get_field(name).attname
+            for name, _ in counted_fields(self.model)
+        ]
+        rows = list(self.order_by().values(
+            'pk', *dict.fromkeys([*attnames, *fields])))
+        if not rows:
+            return (0, {}), rows
+        with suspended(self.model):
+            deleted = self.model._base_manager.filter(
+                pk__in=[row['pk'] for row in rows]
+            ).delete()
+        change(self.model, rows, -1)
+        return deleted, rows
+
+    delete_rows.alters_data = True
+    delete_rows.queryset_only = True
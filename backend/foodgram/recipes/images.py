@@ -0,0 +1,65 @@
+"""Уменьшенные варианты изображений рецептов.
+
+Варианты создаются один раз после сохранения изображения и хранятся рядом с
+оригиналом: recipes/photo.jpg -> recipes/photo_thumbnail.webp. Модуль не
+обращается к базе, поэтому make_variants можно выполнять в дочерних
+процессах.
+"""
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+# Наибольшая сторона варианта в пикселях: карточка и страница рецепта.
+SIZES = {
+    'thumbnail': 320,
+    'detail': 1080,
+}
+# Формат: (расширение, формат Pillow, параметры сохранения).
+FORMATS = {
+    'jpeg': ('jpg', 'JPEG', {'quality': 85, 'optimize': True,
+                             'progressive': True}),
+    'webp': ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+}
+
+
+def variant_name(name, size, fmt):
+    """Имя файла варианта рядом с оригиналом name."""
+    stem = os.path.splitext(name)[0]
+    return f'{stem}_{size}.{FORMATS[fmt][0]}'
+
+
+def make_variants(name, storage=default_storage):
+    """Создание всех вариантов изображения name.
+
+    Возвращает словарь для Recipe.image_variants: исходное имя и имена
+    вариантов по размерам и форматам. Уже существующие файлы вариантов
+    перезаписываются.
+    """
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+    variants = {'source': name}
+    for size, side in SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((side, side), Image.Resampling.LANCZOS)
+        variants[size] = {}
+        for fmt, (_, pillow_format, params) in FORMATS.items():
+            content = BytesIO()
+            resized.save(content, pillow_format, **params)
+            target = variant_name(name, size, fmt)
+            storage.delete(target)
+            variants[size][fmt] = storage.save(
+                target, ContentFile(content.getvalue()))
+    return variants
+
+
+def delete_variants(variants, storage=default_storage):
+    """Удаление файлов вариантов, описанных словарем variants."""
+    for size in SIZES:
+        for name in variants.get(size, {}).values():
+            storage.delete(name)
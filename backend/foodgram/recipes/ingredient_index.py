@@ -0,0 +1,77 @@
+import threading
+from bisect import bisect_left
+
+from .models import Ingredient
+from .versions import INGREDIENTS
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов в памяти процесса для автодополнения.
+
+    Строится лениво при первом запросе и перестраивается, когда меняется
+    версия таблицы ингредиентов versions.INGREDIENTS. Версия читается один
+    раз за запрос вместе с валидаторами HTTP-кеширования, поэтому индекс
+    не добавляет запросов. Префиксы ищутся бинарным поиском по
+    отсортированным названиям, подстроки - по отсортированным суффиксам
+    названий.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.ingredients = []
+        self.names = []
+        self.suffixes = []
+
+    def refresh(self, table_versions):
+        version = table_versions.get(INGREDIENTS, (0, None))
+        if version == self.version:
+            return
+        with self.lock:
+            if version == self.version:
+                return
+            ingredients = sorted(
+                Ingredient.objects.values('id', 'name', 'measurement_unit'),
+                key=lambda item: (item['name'].casefold(), item['id']),
+            )
+            names = [item['name'].casefold() for item in ingredients]
+            self.suffixes = sorted(
+                (name[start:], index)
+                for index, name in enumerate(names)
+                for start in range(1, len(name))
+            )
+            self.ingredients, self.names = ingredients, names
+            self.version = version
+
+    def search(self, table_versions, query, limit):
+        """Ингредиенты с точным совпадением, затем префиксом, затем
+        подстрокой query.
+
+        table_versions - версии таблиц из versions.get_versions().
+        """
+        self.refresh(table_versions)
+        query = query.strip().casefold()
+        names, suffixes = self.names, self.suffixes
+        exact, prefix = [], []
+        position = bisect_left(names, query)
+        while (position < len(names) and names[position].startswith(query)
+               and len(exact) + len(prefix) < limit):
+            if names[position] == query:
+                exact.append(position)
+            else:
+                prefix.append(position)
+            position += 1
+        found = exact + prefix
+        seen = set(found)
+        position = bisect_left(suffixes, (query,))
+        while (position < len(suffixes) and len(found) < limit
+               and suffixes[position][0].startswith(query)):
+            index = suffixes[position][1]
+            if index not in seen:
+                seen.add(index)
+                found.append(index)
+            position += 1
+        return [self.ingredients[index] for index in found]
+
+
+ingredient_index = IngredientIndex()
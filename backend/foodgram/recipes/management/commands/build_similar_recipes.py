@@ -0,0 +1,184 @@
+import time
+from itertools import chain
+
+import numpy as np
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from scipy import sparse
+
+from recipes import similarity
+from recipes.management.utils import batched, can_copy, copy_objects
+from recipes.models import (IngredientInRecipe, Recipe, SimilarRecipe,
+                            SimilarRecipeRefresh)
+
+
+def read_pairs(queryset, *fields):
+    """Значения двух полей строк queryset массивом формы (n, 2)."""
+    values = queryset.order_by().values_list(*fields).iterator(
+        chunk_size=10000)
+    return np.fromiter(
+        chain.from_iterable(values), dtype=np.int64).reshape(-1, 2)
+
+
+def get_matrix(rows, cols, shape):
+    """Разреженная матрица CSR из единиц в позициях (rows, cols)."""
+    return sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=shape)
+
+
+def get_chunks(costs, max_pairs):
+    """Границы пачек строк с суммой costs не больше max_pairs.
+
+    Строка дороже max_pairs образует отдельную пачку.
+    """
+    totals = np.cumsum(costs)
+    start = 0
+    while start < len(costs):
+        base = totals[start - 1] if start else 0
+        stop = max(
+            int(np.searchsorted(totals, base + max_pairs, side='right')),
+            start + 1)
+        yield start, stop
+        start = stop
+
+
+def get_top(rows, keys, limit):
+    """Индексы не более limit наибольших keys в каждой строке rows."""
+    order = np.lexsort((-keys, rows))
+    sorted_rows = rows[order]
+    ranks = np.arange(len(order)) - np.searchsorted(sorted_rows, sorted_rows)
+    return order[ranks < limit]
+
+
+class Command(BaseCommand):
+    """Command for building the similar recipes table."""
+    help = ('Построение таблицы похожих рецептов по общим ингредиентам и '
+            'тегам. Сходство рецептов считается произведением разреженных '
+            'матриц рецептов и ингредиентов пачками строк, память '
+            'ограничена числом пар рецептов в пачке. С --pending '
+            'пересчитываются только рецепты из очереди, измененные после '
+            'построения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-pairs', type=int, default=10_000_000,
+            help='Наибольшее число пар рецептов с общими ингредиентами в '
+                 'одной пачке, около 20 байт памяти на пару.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Число строк, вставляемых одним запросом без COPY, и '
+                 'рецептов, пересчитываемых в одной транзакции с '
+                 '--pending.')
+        parser.add_argument(
+            '--pending', action='store_true',
+            help='Пересчет рецептов из очереди: с измененными ингредиентами '
+                 'или тегами. Запускается по расписанию.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['pending']:
+            refreshed = similarity.refresh_pending(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Похожие рецепты пересчитаны для {refreshed} рецептов из '
+                f'очереди за {time.monotonic() - started:.1f} с.'))
+            return
+        # Изменения, поставленные в очередь до начала построения, им учтены.
+        queued_before = timezone.now()
+        pairs = read_pairs(
+            IngredientInRecipe.objects.all(), 'recipe_id', 'ingredient_id')
+        if not len(pairs):
+            SimilarRecipe.objects.all().delete()
+            SimilarRecipeRefresh.objects.filter(
+                created__lt=queued_before).delete()
+            self.stdout.write('Рецептов с ингредиентами нет.')
+            return
+        self.recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+        ingredient_ids, cols = np.unique(pairs[:, 1], return_inverse=True)
+        del pairs
+        count = len(self.recipe_ids)
+        matrix = get_matrix(rows, cols, (count, len(ingredient_ids)))
+        self.sizes = np.diff(matrix.indptr)
+        df = np.bincount(cols, minlength=len(ingredient_ids))
+        kept = df <= similarity.get_max_df(Recipe.objects.count())
+        self.kept = (matrix @ sparse.diags(kept.astype(np.float32))).tocsr()
+        self.kept.eliminate_zeros()
+        self.kept_t = self.kept.T.tocsr()
+        self.tags, self.tag_sizes = self.get_tags()
+        self.stdout.write(
+            f'Рецептов: {count}, ингредиентов: {len(ingredient_ids)}, '
+            f'слишком частых: {len(kept) - kept.sum()}.')
+        SimilarRecipe.objects.exclude(
+            recipe_id__in=IngredientInRecipe.objects.values('recipe_id')
+        ).delete()
+        processed = 0
+        for start, stop in get_chunks(
+            self.kept @ (df * kept), options['max_pairs']
+        ):
+            self.save(start, stop, *self.get_neighbours(start, stop),
+                      options['batch_size'])
+            processed = stop
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'Обработано {processed} рецептов, '
+                f'{processed / max(elapsed, 1e-6):.1f} в секунду.')
+        SimilarRecipeRefresh.objects.filter(
+            created__lt=queued_before).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Похожие рецепты найдены для {processed} рецептов за '
+            f'{time.monotonic() - started:.1f} с.'))
+
+    def get_tags(self):
+        """Матрица рецептов и тегов и число тегов рецептов."""
+        pairs = read_pairs(
+            Recipe.tags.through.objects.all(), 'recipe_id', 'tag_id')
+        rows = np.searchsorted(self.recipe_ids, pairs[:, 0])
+        known = rows < len(self.recipe_ids)
+        known[known] = self.recipe_ids[rows[known]] == pairs[known, 0]
+        tag_ids, cols = np.unique(pairs[known, 1], return_inverse=True)
+        tags = get_matrix(
+            rows[known], cols, (len(self.recipe_ids), len(tag_ids)))
+        return tags, np.diff(tags.indptr)
+
+    def get_neighbours(self, start, stop):
+        """Строки, соседи и сходство для рецептов пачки."""
+        shared = (self.kept[start:stop] @ self.kept_t).tocoo()
+        rows = shared.row + start
+        cols = shared.col
+        other = rows != cols
+        rows, cols, shared = rows[other], cols[other], shared.data[other]
+        ingredients = shared / (
+            self.sizes[rows] + self.sizes[cols] - shared)
+        top = get_top(rows, ingredients, similarity.get_candidates_count())
+        rows, cols, ingredients = rows[top], cols[top], ingredients[top]
+        shared_tags = np.asarray(
+            self.tags[rows].multiply(self.tags[cols]).sum(axis=1)).ravel()
+        union = self.tag_sizes[rows] + self.tag_sizes[cols] - shared_tags
+        tags = np.divide(
+            shared_tags, union, out=np.zeros(len(union)), where=union > 0)
+        scores = similarity.combine(ingredients, tags)
+        top = get_top(rows, scores, settings.SIMILAR_RECIPES_COUNT)
+        return rows[top], cols[top], scores[top]
+
+    def save(self, start, stop, rows, cols, scores, batch_size):
+        """Замена соседей рецептов пачки."""
+        objs = (
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id,
+                          score=score)
+            for recipe_id, similar_id, score in zip(
+                self.recipe_ids[rows].tolist(),
+                self.recipe_ids[cols].tolist(),
+                scores.tolist(),
+            )
+        )
+        with transaction.atomic():
+            SimilarRecipe.objects.filter(
+                recipe_id__gte=self.recipe_ids[start],
+                recipe_id__lte=self.recipe_ids[stop - 1],
+            ).delete()
+            if can_copy():
+                copy_objects(SimilarRecipe, objs)
+            else:
+                for batch in batched(objs, batch_size):
+                    SimilarRecipe.objects.bulk_create(batch)
@@ -0,0 +1,286 @@
+import random
+import time
+from bisect import bisect
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import BaseCommand, CommandError, call_command
+from django.db import models, transaction
+from django.utils import timezone
+
+from recipes import counters, ranking, versions
+from recipes.management.utils import batched, can_copy, copy_objects
+from recipes.models import (Cart, Favorite, Follow, Ingredient,
+                            IngredientInRecipe, Recipe, Tag)
+from users.models import User
+
+
+def zipf_cum_weights(size, exponent):
+    """Накопленные веса распределения Ципфа для size элементов."""
+    return list(accumulate(
+        1 / rank ** exponent for rank in range(1, size + 1)))
+
+
+def zipf_counts(total, size, exponent):
+    """Распределение total строк по size владельцам по закону Ципфа."""
+    weights = [1 / rank ** exponent for rank in range(1, size + 1)]
+    weights_sum = sum(weights)
+    counts = [int(total * weight / weights_sum) for weight in weights]
+    for index in range(total - sum(counts)):
+        counts[index % size] += 1
+    return counts
+
+
+class Command(BaseCommand):
+    """Command for generating fake data for load and scale testing."""
+    help = ('Генерация пользователей, рецептов, подписок, избранного и '
+            'списков покупок для нагрузочного тестирования. Ингредиенты '
+            'должны быть загружены заранее командой load_csv_data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=10,
+            help='Среднее число ингредиентов в рецепте.')
+        parser.add_argument('--follows', type=int, default=20000)
+        parser.add_argument('--favorites', type=int, default=50000)
+        parser.add_argument('--carts', type=int, default=5000)
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Период, за который распределяются даты рецептов.')
+        parser.add_argument(
+            '--zipf', type=float, default=1.1,
+            help='Показатель распределения Ципфа для популярности.')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--password', default='foodgram',
+            help='Общий пароль сгенерированных пользователей.')
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Не использовать COPY на PostgreSQL.')
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.zipf = options['zipf']
+        self.use_copy = can_copy() and not options['no_copy']
+        self.prefix = f'fake{options["seed"]}_'
+        self.now = timezone.now()
+        ingredient_ids = list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True))
+        if len(ingredient_ids) < 2 * options['ingredients_per_recipe']:
+            raise CommandError(
+                'Недостаточно ингредиентов в базе, выполните load_csv_data.')
+        started = time.monotonic()
+        with transaction.atomic():
+            user_ids = self.create_users(
+                options['users'], make_password(options['password']))
+            tag_ids = self.create_tags(options['tags'])
+            versions.bump(versions.TAGS)
+            recipe_ids = self.create_recipes(
+                options['recipes'], user_ids, options['days'])
+            self.create_recipe_relations(
+                recipe_ids, tag_ids, ingredient_ids,
+                options['ingredients_per_recipe'])
+            if recipe_ids:
+                Recipe.objects.filter(
+                    pk__gte=recipe_ids[0]).update_search_vector()
+            self.create_user_relations(
+                Follow, 'author_id', options['follows'], user_ids, user_ids)
+            self.create_user_relations(
+                Favorite, 'recipe_id', options['favorites'], user_ids,
+                recipe_ids)
+            self.create_user_relations(
+                Cart, 'recipe_id', options['carts'], user_ids, recipe_ids)
+            for model in (Recipe, Follow, Favorite, Cart):
+                counters.recount(model)
+            self.create_scores(recipe_ids)
+        # Строки вставлены без сигналов, производные таблицы строятся
+        # командами после фиксации данных.
+        for command in ('rebuild_feeds', 'build_similar_recipes'):
+            call_command(command, stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.monotonic() - started:.1f} с.'))
+
+    def zipf_choice(self, population, cum_weights):
+        """Выбор элемента population по весам Ципфа."""
+        position = bisect(cum_weights, self.random.random() * cum_weights[-1])
+        return population[min(position, len(population) - 1)]
+
+    def sample_distinct(self, count, population, cum_weights, exclude=None):
+        """Выбор count разных элементов population по весам Ципфа."""
+        count = min(count, len(population) - 1)
+        chosen = set()
+        attempts = 10 * count
+        while len(chosen) < count and attempts:
+            chosen.add(self.zipf_choice(population, cum_weights))
+            chosen.discard(exclude)
+            attempts -= 1
+        while len(chosen) < count:
+            chosen.add(self.random.choice(population))
+            chosen.discard(exclude)
+        return chosen
+
+    def popularity(self, ids):
+        """Случайный порядок популярности ids и накопленные веса."""
+        ranked = list(ids)
+        self.random.shuffle(ranked)
+        return ranked, zipf_cum_weights(len(ranked), self.zipf)
+
+    def random_date(self, days):
+        return self.now - timedelta(seconds=self.random.randint(
+            0, days * 24 * 60 * 60))
+
+    def insert(self, model, rows, return_ids=True):
+        """Вставка строк пачками через COPY или bulk_create."""
+        last_pk = model.objects.aggregate(
+            last_pk=models.Max('pk'))['last_pk'] or 0
+        started = time.monotonic()
+        count = 0
+        for batch in batched(rows, self.batch_size):
+            objs = [model(**row) for row in batch]
+            if self.use_copy:
+                copy_objects(model, objs)
+            else:
+                self.bulk_create(model, objs)
+            count += len(objs)
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f'{model.__name__}: {count} объектов за {elapsed:.1f} с '
+            f'({count / max(elapsed, 1e-6):.0f} в секунду).')
+        if not return_ids:
+            return None
+        return list(model.objects.filter(pk__gt=last_pk).order_by(
+            'pk').values_list('pk', flat=True))
+
+    def bulk_create(self, model, objs):
+        """bulk_create с сохранением сгенерированных дат.
+
+        bulk_create заменяет значения полей auto_now_add текущим временем,
+        поэтому сгенерированные даты записываются следующим запросом.
+        """
+        fields = [
+            field for field in model._meta.concrete_fields
+            if getattr(field, 'auto_now_add', False)
+            and getattr(objs[0], field.attname) is not None
+        ]
+        dates = [
+            [getattr(obj, field.attname) for field in fields] for obj in objs
+        ]
+        model.objects.bulk_create(objs)
+        if not fields:
+            return
+        for obj, values in zip(objs, dates):
+            for field, value in zip(fields, values):
+                setattr(obj, field.attname, value)
+        model.objects.bulk_update(objs, [field.name for field in fields])
+
+    def create_users(self, count, password):
+        rows = (
+            {
+                'username': f'{self.prefix}{index}',
+                'email': f'{self.prefix}{index}@example.com',
+                'first_name': f'Имя{index}',
+                'last_name': f'Фамилия{index}',
+                'password': password,
+                'date_joined': self.now,
+            }
+            for index in range(count)
+        )
+        return self.insert(User, rows)
+
+    def create_tags(self, count):
+        rows = (
+            {
+                'name': f'{self.prefix}тег{index}',
+                'slug': f'{self.prefix}tag{index}',
+                'color': f'#{self.random.randrange(0x1000000):06X}',
+            }
+            for index in range(count)
+        )
+        return self.insert(Tag, rows)
+
+    def create_recipes(self, count, user_ids, days):
+        authors, weights = self.popularity(user_ids)
+        rows = (
+            {
+                'author_id': self.zipf_choice(authors, weights),
+                'name': f'Рецепт {index}',
+                'text': f'Описание рецепта {index}',
+                'image': '',
+                'cooking_time': self.random.randint(5, 180),
+                'date': self.random_date(days),
+            }
+            for index in range(count)
+        )
+        return self.insert(Recipe, rows)
+
+    def create_scores(self, recipe_ids):
+        """Оценки популярности сгенерированных рецептов."""
+        for batch in batched(recipe_ids, self.batch_size):
+            ranking.save_scores(list(Recipe.objects.filter(
+                pk__in=batch).values_list('pk', 'date')))
+        versions.bump(versions.SCORES)
+
+    def create_recipe_relations(self, recipe_ids, tag_ids, ingredient_ids,
+                                ingredients_per_recipe):
+        ingredients, ingredient_weights = self.popularity(ingredient_ids)
+        ingredient_rows = (
+            {
+                'recipe_id': recipe_id,
+                'ingredient_id': ingredient_id,
+                'amount': self.random.randint(1, 1000),
+            }
+            for recipe_id in recipe_ids
+            for ingredient_id in self.sample_distinct(
+                self.random.randint(1, 2 * ingredients_per_recipe - 1),
+                ingredients, ingredient_weights)
+        )
+        self.insert(IngredientInRecipe, ingredient_rows, return_ids=False)
+        if not tag_ids:
+            return
+        tags, tag_weights = self.popularity(tag_ids)
+        tag_rows = (
+            {'recipe_id': recipe_id, 'tag_id': tag_id}
+            for recipe_id in recipe_ids
+            for tag_id in self.sample_distinct(
+                self.random.randint(1, 3), tags, tag_weights)
+        )
+        self.insert(Recipe.tags.through, tag_rows, return_ids=False)
+
+    def create_user_relations(self, model, target_field, total, user_ids,
+                              target_ids):
+        """Подписки, избранное или списки покупок пользователей.
+
+        Активность пользователей и популярность объектов распределены по
+        закону Ципфа, пары пользователь-объект не повторяются.
+        """
+        if not user_ids or len(target_ids) < 2:
+            return
+        users = list(user_ids)
+        self.random.shuffle(users)
+        targets, weights = self.popularity(target_ids)
+        counts = zipf_counts(total, len(users), self.zipf)
+        rows = (
+            {
+                'user_id': user_id,
+                target_field: target_id,
+                **self.relation_dates(model),
+            }
+            for user_id, count in zip(users, counts)
+            for target_id in self.sample_distinct(
+                count, targets, weights,
+                exclude=user_id if model is Follow else None)
+        )
+        self.insert(model, rows, return_ids=False)
+
+    def relation_dates(self, model):
+        if model is Follow:
+            return {'following_date': self.random_date(365)}
+        if model is Favorite:
+            return {'date': self.random_date(365)}
+        return {'date': self.random_date(30)}
@@ -0,0 +1,94 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+import django
+from django.core.management import BaseCommand
+from django.utils import timezone
+
+from recipes import catalog, images
+from recipes.management.utils import batched
+from recipes.models import Recipe
+
+
+def generate(item):
+    """Variants of one recipe image, run in a worker process."""
+    pk, name = item
+    try:
+        return pk, images.make_variants(name), None
+    except (OSError, ValueError) as error:
+        return pk, None, str(error)
+
+
+class Command(BaseCommand):
+    """Command for backfilling recipe image variants."""
+    help = ('Создание уменьшенных вариантов изображений рецептов, у которых '
+            'их нет или они созданы для другого изображения. Изображения '
+            'обрабатываются параллельно в нескольких процессах.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число процессов, по умолчанию число процессоров, 0 - '
+                 'обработка в текущем процессе.')
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Число рецептов, сохраняемых одним запросом.')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересоздать варианты всех изображений.')
+
+    def handle(self, *args, **options):
+        old_variants = {}
+        pending = []
+        for pk, name, variants in Recipe.objects.exclude(
+            image=''
+        ).order_by('pk').values_list('pk', 'image', 'image_variants'):
+            if options['all'] or variants.get('source') != name:
+                old_variants[pk] = variants
+                pending.append((pk, name))
+        self.stdout.write(f'Изображений для обработки: {len(pending)}.')
+        if not pending:
+            return
+        started = time.monotonic()
+        processed = failed = 0
+        with ExitStack() as stack:
+            results = map(generate, pending)
+            if options['workers']:
+                # Spawned workers start clean and never share database
+                # connections with this process.
+                executor = stack.enter_context(ProcessPoolExecutor(
+                    max_workers=options['workers'],
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=django.setup,
+                ))
+                results = executor.map(
+                    generate, pending, chunksize=max(
+                        1, options['batch_size'] // options['workers']))
+            for batch in batched(results, options['batch_size']):
+                failed += self.save(batch, old_variants)
+                processed += len(batch)
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f'Обработано {processed} изображений, '
+                    f'{processed / max(elapsed, 1e-6):.1f} в секунду.')
+        catalog.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Варианты созданы для {processed - failed} изображений, '
+            f'ошибок {failed}, за {time.monotonic() - started:.1f} с.'))
+
+    def save(self, batch, old_variants):
+        """Сохранение вариантов пачки рецептов, возвращает число ошибок."""
+        now = timezone.now()
+        recipes = []
+        for pk, variants, error in batch:
+            if error is not None:
+                self.stderr.write(f'Рецепт {pk}: {error}')
+                continue
+            if old_variants[pk].get('source') != variants['source']:
+                images.delete_variants(old_variants[pk])
+            recipes.append(Recipe(pk=pk, image_variants=variants, updated=now))
+        Recipe.objects.bulk_update(recipes, ['image_variants', 'updated'])
+        return len(batch) - len(recipes)
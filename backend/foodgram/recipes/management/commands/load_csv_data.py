@@ -1,61 +1,196 @@
-import sys
+import json
+import time
 from csv import DictReader
 from os.path import exists
+
 from django.contrib.staticfiles.finders import find
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes import versions
+from recipes.management.utils import batched, can_copy, copy_objects
 from recipes.models import Ingredient
 
 DATA_MODEL = {
-    'ingredients': Ingredient,
+    'ingredients': (Ingredient, ('name', 'measurement_unit')),
+}
+
+
+JSON_CHUNK_SIZE = 64 * 1024
+# Переходы между ожидаемыми символами JSON-массива, None - конец массива.
+JSON_ARRAY_STATES = {
+    ('[', '['): 'first',
+    ('first', ']'): None,
+    (',', ']'): None,
+    (',', ','): 'value',
 }
 
 
-def delete_objects(model):
-    """Удаление существующих элементов в базе."""
-    model = model
+def decode_value(decoder, buffer, eof):
+    """Первое JSON-значение из buffer и позиция его конца или (None, None),
+    если значение продолжается в еще не прочитанной части файла."""
     try:
-        model.objects.all().delete()
-        message = f'Существющие объекты {model.__name__} удалены.'
-        return message
-    except Exception as error:
-        raise Exception(f'Ошибка при удалении объектов: {error}')
-
-
-def check_db(model):
-    """Проверка базы данных и удаление по запросу."""
-    if model.objects.exists():
-        print(f'В базе уже есть объекты {model.__name__}!')
-        result = input('Для удаления введите "Y" или что-нибудь '
-                       'другое для отмены и выхода: ')
-        if result == 'Y' or result == 'y':
-            return delete_objects(model)
-        else:
-            sys.exit(0)
+        value, end = decoder.raw_decode(buffer)
+    except json.JSONDecodeError as error:
+        if eof:
+            raise CommandError(f'Ошибка в JSON файле: {error}.')
+        return None, None
+    # Число в конце прочитанной части может продолжаться.
+    if end == len(buffer) and not eof:
+        return None, None
+    return value, end
+
+
+def read_json_array(file, chunk_size=JSON_CHUNK_SIZE):
+    """Потоковое чтение элементов JSON-массива.
+
+    Файл читается частями по chunk_size символов, в памяти хранится
+    только еще не разобранный остаток и текущий элемент.
+    """
+    decoder = json.JSONDecoder()
+    buffer, eof = '', False
+    expected = '['
+    while True:
+        buffer = buffer.lstrip()
+        if expected == 'value':
+            value, end = decode_value(decoder, buffer, eof)
+            if end is not None:
+                buffer, expected = buffer[end:], ','
+                yield value
+                continue
+        elif buffer:
+            if expected == 'first' and buffer[0] != ']':
+                expected = 'value'
+                continue
+            if (expected, buffer[0]) not in JSON_ARRAY_STATES:
+                raise CommandError(
+                    'JSON файл должен содержать массив объектов.')
+            expected = JSON_ARRAY_STATES[expected, buffer[0]]
+            if expected is None:
+                return
+            buffer = buffer[1:]
+            continue
+        if eof:
+            raise CommandError('JSON файл неожиданно закончился.')
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer += chunk
 
 
-def objects_creator(model, row):
-    if model == Ingredient:
-        Ingredient.objects.create(
-            name=row['name'],
-            measurement_unit=row['measurement_unit'],
-        )
+def read_rows(path):
+    """Потоковое чтение строк из CSV или JSON файла."""
+    if path.endswith('.json'):
+        with open(path, encoding='utf-8') as file:
+            yield from read_json_array(file)
+        return
+    with open(path, encoding='utf-8', newline='') as file:
+        yield from DictReader(file)
+
+
+def clean_row(row, key_fields):
+    """Ключ строки или None, если не заполнено обязательное поле."""
+    try:
+        key = tuple(str(row[field]).strip() for field in key_fields)
+    except (KeyError, TypeError):
+        return None
+    if not all(key):
+        return None
+    return key
 
 
 class Command(BaseCommand):
     """Command for load csv data to database."""
+    help = ('Загрузка ингредиентов из CSV или JSON. По умолчанию добавляет '
+            'отсутствующие записи и сохраняет id существующих.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Путь к CSV или JSON файлу, по умолчанию '
+                 'data/<модель>.csv из статики.')
+        parser.add_argument(
+            '--mode', choices=('upsert', 'replace'), default='upsert',
+            help='upsert - добавить отсутствующие записи, replace - удалить '
+                 'существующие записи (вместе с ингредиентами в рецептах) '
+                 'и загрузить заново.')
+        parser.add_argument(
+            '--noinput', '--no-input', action='store_false',
+            dest='interactive',
+            help='Не запрашивать подтверждение удаления.')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Выполнить загрузку и откатить транзакцию.')
+
     def handle(self, *args, **options):
-        for filename, model in DATA_MODEL.items():
-            check_db(model)
-            csv_file = find(f'data/{filename}.csv')
-            print(csv_file)
-            if exists(csv_file):
-                try:
-                    for row in DictReader(open(csv_file, encoding='utf-8')):
-                        objects_creator(model, row)
-                except Exception as error:
-                    raise Exception(f'Ошибка добавления объекта: {error}')
-            else:
-                print(f'Файл {filename}.csv для заполнения '
-                      f'{model.__name__} отсутвует.')
-
-            print(f'{model.__name__}: новые объекты добавлены.')
+        for filename, (model, key_fields) in DATA_MODEL.items():
+            path = options['path'] or find(f'data/{filename}.csv')
+            if not path or not exists(path):
+                raise CommandError(
+                    f'Файл {filename}.csv для заполнения '
+                    f'{model.__name__} отсутствует.')
+            replace = options['mode'] == 'replace'
+            if replace and options['interactive'] and not self.confirm(model):
+                self.stdout.write('Загрузка отменена.')
+                return
+            with transaction.atomic():
+                if replace:
+                    deleted, _ = model.objects.all().delete()
+                    self.stdout.write(
+                        f'Существующие объекты {model.__name__} удалены: '
+                        f'{deleted}.')
+                self.load(model, key_fields, path, options['batch_size'])
+                versions.bump(versions.INGREDIENTS)
+                if options['dry_run']:
+                    transaction.set_rollback(True)
+                    self.stdout.write('Пробный запуск, изменения отменены.')
+
+    def confirm(self, model):
+        """Подтверждение удаления существующих объектов."""
+        if not model.objects.exists():
+            return True
+        result = input(f'В базе уже есть объекты {model.__name__}! Для '
+                       'удаления введите "Y" или что-нибудь другое для '
+                       'отмены: ')
+        return result in ('Y', 'y')
+
+    def load(self, model, key_fields, path, batch_size):
+        """Загрузка файла пачками с отчетом о скорости."""
+        started = time.monotonic()
+        processed = created = invalid = 0
+        for batch in batched(read_rows(path), batch_size):
+            keys = {}
+            for row in batch:
+                key = clean_row(row, key_fields)
+                if key is None:
+                    invalid += 1
+                else:
+                    keys[key] = None
+            created += self.create_missing(model, key_fields, list(keys))
+            processed += len(batch)
+            elapsed = time.monotonic() - started
+            self.stdout.write(
+                f'{model.__name__}: обработано {processed} строк, '
+                f'{processed / max(elapsed, 1e-6):.0f} строк в секунду.')
+        self.stdout.write(self.style.SUCCESS(
+            f'{model.__name__}: добавлено {created}, уже в базе или '
+            f'повторяются {processed - created - invalid}, пропущено '
+            f'{invalid} '
+            f'за {time.monotonic() - started:.2f} с.'))
+
+    def create_missing(self, model, key_fields, keys):
+        """Создание объектов, ключей которых еще нет в базе."""
+        existing = set(model.objects.filter(**{
+            f'{key_fields[0]}__in': {key[0] for key in keys}
+        }).values_list(*key_fields))
+        objs = [
+            model(**dict(zip(key_fields, key)))
+            for key in keys if key not in existing
+        ]
+        if not objs:
+            return 0
+        if can_copy():
+            copy_objects(model, objs)
+        else:
+            model.objects.bulk_create(objs)
+        return len(objs)
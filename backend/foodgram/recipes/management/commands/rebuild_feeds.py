@@ -0,0 +1,102 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from recipes.management.utils import batched
+from recipes.models import FeedEntry, FeedFanOut, Follow
+from users.models import User
+
+
+class Command(BaseCommand):
+    """Command for rebuilding following feeds."""
+    help = ('Пересоздание лент подписок по подпискам и рецептам, например '
+            'после изменения FEED_FANOUT_MAX_FOLLOWERS. С --pending '
+            'копирует в ленты рецепты из очереди и рецепты авторов, у '
+            'которых стало меньше FEED_FANOUT_MIN_FOLLOWERS подписчиков. '
+            'Команду с --pending нужно запускать по расписанию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Число пользователей или рецептов из очереди, которые '
+                 'обрабатываются в одной транзакции.')
+        parser.add_argument(
+            '--pending', action='store_true',
+            help='Обработка только очереди и авторов, переставших быть '
+                 'популярными.')
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            self.fan_out_pending(options['batch_size'])
+            self.restore_authors()
+        else:
+            self.rebuild(options['batch_size'])
+
+    def fan_out_pending(self, batch_size):
+        """Копирование рецептов из очереди пачками.
+
+        Строки пачки блокируются до конца транзакции, заблокированные
+        другими экземплярами команды пропускаются.
+        """
+        copied = 0
+        while True:
+            with transaction.atomic():
+                pending = list(FeedFanOut.objects.select_for_update(
+                    skip_locked=True, of=('self',)
+                ).select_related('recipe').order_by('created')[:batch_size])
+                if not pending:
+                    break
+                for row in pending:
+                    FeedEntry.objects.fan_out(row.recipe)
+                FeedFanOut.objects.filter(
+                    recipe_id__in=[row.recipe_id for row in pending]).delete()
+            copied += len(pending)
+            self.stdout.write(f'Скопировано рецептов из очереди: {copied}.')
+
+    def restore_authors(self):
+        """Возобновление копирования рецептов авторов, у которых стало
+        меньше FEED_FANOUT_MIN_FOLLOWERS подписчиков, по одному автору в
+        транзакции."""
+        restored = 0
+        while True:
+            with transaction.atomic():
+                author = User.objects.select_for_update(
+                    skip_locked=True
+                ).filter(
+                    feed_pull=True,
+                    followers_count__lt=settings.FEED_FANOUT_MIN_FOLLOWERS,
+                ).order_by('followers_count').first()
+                if author is None:
+                    break
+                FeedEntry.objects.restore(author)
+            restored += 1
+            self.stdout.write(f'Ленты дополнены рецептами автора {author}.')
+        if restored:
+            self.stdout.write(f'Авторов, ставших непопулярными: {restored}.')
+
+    def rebuild(self, batch_size):
+        started = timezone.now()
+        User.objects.filter(
+            feed_pull=False,
+            followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).update(feed_pull=True)
+        User.objects.filter(
+            feed_pull=True,
+            followers_count__lt=settings.FEED_FANOUT_MIN_FOLLOWERS,
+        ).update(feed_pull=False)
+        user_ids = Follow.objects.order_by('user_id').values_list(
+            'user_id', flat=True).distinct()
+        FeedEntry.objects.exclude(user_id__in=user_ids).delete()
+        rebuilt = 0
+        for batch in batched(user_ids.iterator(), batch_size):
+            with transaction.atomic():
+                FeedEntry.objects.filter(user_id__in=batch).delete()
+                FeedEntry.objects.backfill(Follow.objects.filter(
+                    user_id__in=batch).values_list('user_id', 'author_id'))
+            rebuilt += len(batch)
+            self.stdout.write(f'Пересоздано лент: {rebuilt}.')
+        # Рецепты, поставленные в очередь до начала, уже скопированы.
+        FeedFanOut.objects.filter(created__lt=started).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {FeedEntry.objects.count()}.'))
@@ -0,0 +1,27 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes import counters
+from recipes.models import Cart, Favorite, Follow, Recipe
+
+COUNTED_MODELS = (Recipe, Favorite, Cart, Follow)
+
+
+class Command(BaseCommand):
+    """Command for repairing denormalized counters."""
+    help = ('Пересчет счетчиков рецептов, избранного, списков покупок и '
+            'подписок по фактическому числу строк.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Показать расхождения и откатить транзакцию.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for model in COUNTED_MODELS:
+                for counter, fixed in counters.recount(model).items():
+                    self.stdout.write(f'{counter}: исправлено {fixed}.')
+            if options['dry_run']:
+                transaction.set_rollback(True)
+                self.stdout.write('Пробный запуск, изменения отменены.')
@@ -0,0 +1,79 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes import catalog, ranking, versions
+from recipes.models import Recipe, RecipeScore
+
+
+class Command(BaseCommand):
+    """Command for updating recipe popularity scores."""
+    help = ('Пересчет оценок популярности рецептов для сортировки '
+            'ordering=popular и ordering=trending. Пересчитываются оценки, '
+            'помеченные при добавлениях в избранное и списки покупок и их '
+            'удалениях. Помеченные оценки читаются по частичному индексу '
+            'пачками, каждая в своей транзакции.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Число рецептов, читаемых и пересчитываемых в одной '
+                 'транзакции.')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчет всех рецептов по возрастанию id, например после '
+                 'изменения периодов полураспада. Создает недостающие '
+                 'оценки.')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['all']:
+            updated = self.update_all(options['batch_size'])
+        else:
+            updated = self.update_dirty(options['batch_size'])
+        if updated:
+            catalog.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Оценки пересчитаны для {updated} рецептов за '
+            f'{time.monotonic() - started:.1f} с.'))
+
+    def update_dirty(self, batch_size):
+        """Пересчет помеченных оценок.
+
+        Пометка снимается до чтения добавлений: добавление во время расчета
+        помечает оценку снова, и она пересчитывается следующим запуском.
+        Строки, заблокированные другим экземпляром команды, пропускаются.
+        """
+        updated = 0
+        while True:
+            with transaction.atomic():
+                rows = list(RecipeScore.objects.select_for_update(
+                    skip_locked=True, of=('self',)
+                ).filter(dirty=True).order_by('recipe_id').values_list(
+                    'recipe_id', 'recipe__date'
+                )[:batch_size])
+                if not rows:
+                    return updated
+                RecipeScore.objects.filter(
+                    recipe_id__in=[pk for pk, _ in rows]).update(dirty=False)
+                ranking.save_scores(rows)
+                versions.bump(versions.SCORES)
+            updated += len(rows)
+            self.stdout.write(f'Пересчитано {updated} рецептов.')
+
+    def update_all(self, batch_size):
+        """Пересчет оценок всех рецептов пачками по возрастанию id."""
+        updated = 0
+        last_id = 0
+        while True:
+            with transaction.atomic():
+                rows = list(Recipe.objects.filter(pk__gt=last_id).order_by(
+                    'pk').values_list('pk', 'date')[:batch_size])
+                if not rows:
+                    return updated
+                ranking.save_scores(rows)
+                versions.bump(versions.SCORES)
+            last_id = rows[-1][0]
+            updated += len(rows)
+            self.stdout.write(f'Пересчитано {updated} рецептов.')
@@ -0,0 +1,70 @@
+import io
+from itertools import islice
+
+from django.db import connection
+
+COPY_NULL = r'\N'
+# В текстовом формате COPY экранируются обратная косая черта и разделители,
+# поэтому строка '\N' в данных не совпадает с NULL.
+COPY_ESCAPES = str.maketrans({
+    '\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r',
+})
+
+
+def batched(iterable, size):
+    """Разбиение итерируемого объекта на пачки размера size."""
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def can_copy():
+    """Проверка поддержки COPY ... FROM STDIN текущей базой данных."""
+    return connection.vendor == 'postgresql'
+
+
+def copy_value(value):
+    """Значение поля в текстовом формате COPY."""
+    if value is None:
+        return COPY_NULL
+    return str(value).translate(COPY_ESCAPES)
+
+
+def copy_field_value(field, obj):
+    """Значение поля для вставки, заданные значения полей auto_now_add
+    сохраняются."""
+    value = None
+    if getattr(field, 'auto_now_add', False):
+        value = getattr(obj, field.attname)
+    if value is None:
+        value = field.pre_save(obj, add=True)
+    return field.get_db_prep_save(value, connection)
+
+
+def copy_objects(model, objs):
+    """Вставка несохраненных объектов командой COPY (PostgreSQL).
+
+    В отличие от bulk_create явно заданные даты полей auto_now_add не
+    заменяются текущим временем.
+    """
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    buffer = io.StringIO()
+    for obj in objs:
+        buffer.write('\t'.join(
+            copy_value(copy_field_value(field, obj)) for field in fields
+        ))
+        buffer.write('\n')
+    buffer.seek(0)
+    columns = ', '.join(
+        connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.cursor.copy_expert(
+            f'COPY {connection.ops.quote_name(model._meta.db_table)} '
+            f'({columns}) FROM STDIN',
+            buffer,
+        )
@@ -0,0 +1,50 @@
+# Generated by Django 4.1 on 2026-10-18 19:51
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+# Модель, внешний ключ, модель счетчика, поле счетчика.
+COUNTERS = (
+    ('Favorite', 'recipe', ('recipes', 'Recipe'), 'favorites_count'),
+    ('Cart', 'recipe', ('recipes', 'Recipe'), 'in_carts_count'),
+    ('Recipe', 'author', ('users', 'User'), 'recipes_count'),
+    ('Follow', 'author', ('users', 'User'), 'followers_count'),
+    ('Follow', 'user', ('users', 'User'), 'following_count'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for model_name, name, related, counter in COUNTERS:
+        model = apps.get_model('recipes', model_name)
+        apps.get_model(*related).objects.update(**{counter: Coalesce(
+            models.Subquery(
+                model.objects.filter(
+                    **{name: models.OuterRef('pk')}
+                ).order_by().values(name).annotate(
+                    count=models.Count('pk')
+                ).values('count')
+            ),
+            0,
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_shoppinglistjob'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Число добавлений в списки покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
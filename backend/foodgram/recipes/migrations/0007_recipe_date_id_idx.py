@@ -0,0 +1,33 @@
+# Generated by Django 4.1 on 2026-10-18 20:12
+
+from django.db import migrations, models
+from django.db.models.functions import Now
+
+
+def fill_date(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.filter(date__isnull=True).update(date=Now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_date, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='recipe',
+            options={'ordering': ('date', 'id'), 'verbose_name': 'Рецепт', 'verbose_name_plural': 'Рецепты'},
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='date',
+            field=models.DateTimeField(auto_now_add=True, verbose_name='Дата создания рецепта'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['date', 'id'], name='recipe_date_id_idx'),
+        ),
+    ]
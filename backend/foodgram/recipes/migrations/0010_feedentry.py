@@ -0,0 +1,82 @@
+# Generated by Django 4.1 on 2026-10-18 20:26
+
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+BATCH_SIZE = 1000
+
+
+def fill_feeds(apps, schema_editor):
+    follow_model = apps.get_model('recipes', 'Follow')
+    recipe_model = apps.get_model('recipes', 'Recipe')
+    entry_model = apps.get_model('recipes', 'FeedEntry')
+    followers = {}
+    for user_id, author_id in follow_model.objects.filter(
+        author__followers_count__lt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('user_id', 'author_id').iterator():
+        followers.setdefault(author_id, []).append(user_id)
+    entries = iter(
+        entry_model(user_id=user_id, recipe_id=pk, author_id=author_id,
+                    date=date)
+        for pk, author_id, date in recipe_model.objects.filter(
+            author__isnull=False
+        ).values_list('pk', 'author_id', 'date').iterator()
+        for user_id in followers.get(author_id, ())
+    )
+    batch = list(islice(entries, BATCH_SIZE))
+    while batch:
+        entry_model.objects.bulk_create(batch)
+        batch = list(islice(entries, BATCH_SIZE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField(verbose_name='Дата создания рецепта')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'date', 'id'], name='recipe_author_date_id_idx'),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AddField(
+            model_name='feedentry',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to=settings.AUTH_USER_MODEL, verbose_name='Подписчик'),
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', 'date', 'recipe'], name='feed_user_date_recipe_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='user_feed_recipe_unique'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
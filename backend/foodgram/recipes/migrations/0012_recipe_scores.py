@@ -0,0 +1,91 @@
+# Generated by Django 4.1 on 2026-10-18 20:37
+
+import math
+from datetime import datetime, timezone
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+BATCH_SIZE = 1000
+# Constants of recipes.ranking at the time of this migration.
+EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+RECIPE_WEIGHT = 0.1
+
+
+# Favorites of unknown date are dated by their recipes, so that they do not
+# count as recent.
+def fill_favorite_dates(apps, schema_editor):
+    favorite_model = apps.get_model('recipes', 'Favorite')
+    recipe_model = apps.get_model('recipes', 'Recipe')
+    favorite_model.objects.update(date=models.Subquery(
+        recipe_model.objects.filter(
+            pk=models.OuterRef('recipe_id')).values('date')[:1]))
+
+
+# Scores of recipe creation only. Empty recipe_updated makes
+# update_recipe_scores add favorites and carts on its first run.
+def fill_scores(apps, schema_editor):
+    recipe_model = apps.get_model('recipes', 'Recipe')
+    score_model = apps.get_model('recipes', 'RecipeScore')
+    rates = {
+        name: math.log(2) / (getattr(settings, setting) * 24 * 60 * 60)
+        for name, setting in (
+            ('popular', 'RECIPE_POPULAR_HALF_LIFE_DAYS'),
+            ('trending', 'RECIPE_TRENDING_HALF_LIFE_DAYS'),
+        )
+    }
+    scores = iter(
+        score_model(recipe_id=pk, **{
+            name: math.log(RECIPE_WEIGHT)
+            + rate * (date - EPOCH).total_seconds()
+            for name, rate in rates.items()
+        })
+        for pk, date in recipe_model.objects.values_list(
+            'pk', 'date').iterator()
+    )
+    batch = list(islice(scores, BATCH_SIZE))
+    while batch:
+        score_model.objects.bulk_create(batch)
+        batch = list(islice(scores, BATCH_SIZE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('popular', models.FloatField(verbose_name='Популярность')),
+                ('trending', models.FloatField(verbose_name='Популярность за последнее время')),
+                ('recipe_updated', models.DateTimeField(null=True, verbose_name='Дата изменения рецепта при расчете')),
+            ],
+            options={
+                'verbose_name': 'Оценка рецепта',
+                'verbose_name_plural': 'Оценки рецептов',
+            },
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='date',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления в избранное'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_favorite_dates, migrations.RunPython.noop),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-popular', '-recipe'], name='recipe_score_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(fields=['-trending', '-recipe'], name='recipe_score_trending_idx'),
+        ),
+    ]
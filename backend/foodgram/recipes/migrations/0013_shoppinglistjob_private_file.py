@@ -0,0 +1,19 @@
+# Generated by Django 4.1 on 2026-10-18 20:57
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_scores'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shoppinglistjob',
+            name='file',
+            field=models.FileField(blank=True, storage=recipes.storage.PrivateStorage(), upload_to='shopping_lists/', verbose_name='Файл'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1 on 2026-10-18 21:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_shoppinglistjob_private_file'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarRecipeRefresh',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата добавления в очередь')),
+            ],
+            options={
+                'verbose_name': 'Рецепт в очереди пересчета похожих',
+                'verbose_name_plural': 'Очередь пересчета похожих рецептов',
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 4.1.13 on 2026-10-18 21:26
+
+import math
+from datetime import datetime, timezone
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+# Constants of recipes.ranking at the time of this migration.
+EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+RECIPE_WEIGHT = 0.1
+
+
+# Recipes inserted in bulk before this migration have no scores. They get
+# creation-only scores marked dirty, so update_recipe_scores adds favorites
+# and carts on its next run.
+def fill_missing_scores(apps, schema_editor):
+    recipe_model = apps.get_model('recipes', 'Recipe')
+    score_model = apps.get_model('recipes', 'RecipeScore')
+    rates = {
+        name: math.log(2) / (getattr(settings, setting) * 24 * 60 * 60)
+        for name, setting in (
+            ('popular', 'RECIPE_POPULAR_HALF_LIFE_DAYS'),
+            ('trending', 'RECIPE_TRENDING_HALF_LIFE_DAYS'),
+        )
+    }
+    scores = iter(
+        score_model(recipe_id=pk, dirty=True, **{
+            name: math.log(RECIPE_WEIGHT)
+            + rate * (date - EPOCH).total_seconds()
+            for name, rate in rates.items()
+        })
+        for pk, date in recipe_model.objects.filter(
+            score__isnull=True).values_list('pk', 'date').iterator()
+    )
+    batch = list(islice(scores, BATCH_SIZE))
+    while batch:
+        score_model.objects.bulk_create(batch)
+        batch = list(islice(scores, BATCH_SIZE))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_similarreciperefresh'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='recipescore',
+            name='recipe_updated',
+        ),
+        # Existing scores may miss favorites and carts since the last run of
+        # update_recipe_scores, they are recomputed once.
+        migrations.AddField(
+            model_name='recipescore',
+            name='dirty',
+            field=models.BooleanField(default=True, verbose_name='Требует пересчета'),
+        ),
+        migrations.AlterField(
+            model_name='recipescore',
+            name='dirty',
+            field=models.BooleanField(default=False, verbose_name='Требует пересчета'),
+        ),
+        migrations.RunPython(fill_missing_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipescore',
+            index=models.Index(condition=models.Q(('dirty', True)), fields=['recipe'], name='recipe_score_dirty_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.1.13 on 2026-10-18 21:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipescore_dirty'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedFanOut',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='recipes.recipe', verbose_name='Рецепт')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Дата добавления в очередь')),
+            ],
+            options={
+                'verbose_name': 'Рецепт в очереди копирования в ленты',
+                'verbose_name_plural': 'Очередь копирования рецептов в ленты',
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.1.13 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+# Duplicated ingredients are merged into the one with the smallest id.
+# Their amounts in recipes are added to the kept ingredient.
+def merge_duplicates(apps, schema_editor):
+    ingredient_model = apps.get_model('recipes', 'Ingredient')
+    amount_model = apps.get_model('recipes', 'IngredientInRecipe')
+    duplicates = ingredient_model.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        count=models.Count('id'), kept_id=models.Min('id')
+    ).filter(count__gt=1)
+    for group in duplicates.iterator():
+        kept_id = group['kept_id']
+        duplicate_ids = list(ingredient_model.objects.filter(
+            name=group['name'], measurement_unit=group['measurement_unit'],
+        ).exclude(pk=kept_id).values_list('pk', flat=True))
+        for amount in amount_model.objects.filter(
+                ingredient_id__in=duplicate_ids).order_by('pk'):
+            kept = amount_model.objects.filter(
+                recipe_id=amount.recipe_id, ingredient_id=kept_id).first()
+            if kept is None:
+                amount.ingredient_id = kept_id
+                amount.save(update_fields=['ingredient'])
+            else:
+                kept.amount += amount.amount
+                kept.save(update_fields=['amount'])
+                amount.delete()
+        ingredient_model.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_feedfanout'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
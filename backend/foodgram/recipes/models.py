@@ -1,7 +1,36 @@
-from django.db import models
+import uuid
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
+from django.db import connection, models
+from django.db.models.functions import Coalesce
+from django.dispatch import Signal
 
 from users.models import User
 
+from .counters import CountedQuerySet
+from .management.utils import batched
+from .storage import PrivateStorage
+
+SEARCH_CONFIG = 'russian'
+
+
+class UnicodeLower(models.Func):
+    """Приведение строки к нижнему регистру с учетом Unicode.
+
+    LOWER в SQLite меняет только латиницу, поэтому на SQLite вызывается
+    функция Python, которую регистрирует сигнал connection_created.
+    """
+    function = 'LOWER'
+    output_field = models.TextField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, function='UNICODE_LOWER', **extra_context)
+
 
 class Tag(models.Model):
     """Модель тегов."""
@@ -47,11 +76,115 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='ingredient_name_unit_unique',
+            )
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(CountedQuerySet):
+    """Набор рецептов с пользовательскими аннотациями."""
+
+    def with_user_flags(self, user):
+        """Аннотация is_favorited и is_in_shopping_cart для пользователя."""
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(Cart.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+        )
+
+    def with_related(self, user):
+        """Предзагрузка автора, тегов и ингредиентов рецептов."""
+        return self.prefetch_related(
+            models.Prefetch(
+                'author',
+                queryset=with_is_subscribed(User.objects.all(), user),
+            ),
+            'tags',
+            models.Prefetch(
+                'ingredientinrecipe_set',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'),
+            ),
+        )
+
+    def order_by_score(self, name):
+        """Сортировка по оценке RecipeScore name.
+
+        Оценка есть у каждого рецепта, поэтому соединение внутреннее, а
+        сортировка по столбцам таблицы оценок совпадает с ее индексом.
+        """
+        return self.filter(score__isnull=False).order_by(
+            models.F(f'score__{name}').desc(),
+            models.F('score__recipe').desc(),
+        )
+
+    def search(self, text):
+        """Полнотекстовый поиск по названию, описанию и ингредиентам.
+
+        На PostgreSQL использует search_vector, на остальных базах - поиск
+        подстроки без учета регистра. Совпадения в названии ранжируются
+        выше совпадений в описании, а те - выше совпадений в ингредиентах.
+        """
+        if connection.vendor != 'postgresql':
+            text = text.lower()
+            in_ingredients = models.Exists(IngredientInRecipe.objects.alias(
+                ingredient_name=UnicodeLower('ingredient__name'),
+            ).filter(
+                recipe=models.OuterRef('pk'), ingredient_name__contains=text))
+            return self.alias(
+                name_lower=UnicodeLower('name'),
+                text_lower=UnicodeLower('text'),
+            ).annotate(rank=models.Case(
+                models.When(name_lower__contains=text, then=3),
+                models.When(text_lower__contains=text, then=2),
+                models.When(in_ingredients, then=1),
+                default=0,
+                output_field=models.FloatField(),
+            )).filter(rank__gt=0).order_by('-rank', 'date', 'id')
+        query = SearchQuery(
+            text, config=SEARCH_CONFIG, search_type='websearch')
+        return self.filter(search_vector=query).annotate(
+            rank=SearchRank(models.F('search_vector'), query)
+        ).order_by('-rank', 'date', 'id')
+
+    def update_search_vector(self):
+        """Пересчет search_vector рецептов (только PostgreSQL)."""
+        if connection.vendor != 'postgresql':
+            return 0
+        ingredient_names = IngredientInRecipe.objects.filter(
+            recipe=models.OuterRef('pk')
+        ).values('recipe').annotate(
+            names=StringAgg('ingredient__name', delimiter=' ')
+        ).values('names')
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=SEARCH_CONFIG)
+            + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+            + SearchVector(
+                Coalesce(
+                    models.Subquery(ingredient_names),
+                    models.Value(''),
+                    output_field=models.TextField(),
+                ),
+                weight='C',
+                config=SEARCH_CONFIG,
+            )
+        ))
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
     author = models.ForeignKey(
@@ -70,6 +203,11 @@ class Recipe(models.Model):
     image = models.ImageField(
         verbose_name='Изображение',
     )
+    image_variants = models.JSONField(
+        verbose_name='Варианты изображения',
+        default=dict,
+        editable=False,
+    )
     text = models.TextField(
         verbose_name='Описание',
         help_text='Введите описание рецепта',
@@ -93,18 +231,68 @@ class Recipe(models.Model):
     date = models.DateTimeField(
         'Дата создания рецепта',
         auto_now_add=True,
+    )
+    updated = models.DateTimeField(
+        'Дата изменения рецепта',
+        auto_now=True,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
         null=True,
+        editable=False,
     )
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Число добавлений в избранное',
+        default=0,
+        editable=False,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Число добавлений в списки покупок',
+        default=0,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+    counters = (('author', 'recipes_count'),)
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ('date',)
+        ordering = ('date', 'id')
+        indexes = [
+            models.Index(fields=['date', 'id'], name='recipe_date_id_idx'),
+            models.Index(
+                fields=['author', 'date', 'id'],
+                name='recipe_author_date_id_idx',
+            ),
+            GinIndex(
+                fields=['search_vector'],
+                name='recipe_search_vector_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+# Пакетная вставка ингредиентов рецептов, post_save для нее не отправляется.
+ingredients_added = Signal()
+
+
+class IngredientInRecipeQuerySet(models.QuerySet):
+    """Ингредиенты рецептов, сообщающие о пакетной вставке."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            ingredients_added.send(
+                sender=self.model,
+                recipe_ids={obj.recipe_id for obj in objs})
+        return objs
+
+    bulk_create.alters_data = True
+
+
 class IngredientInRecipe(models.Model):
     """Модель ингредиентов в рецепте."""
     ingredient = models.ForeignKey(
@@ -123,6 +311,8 @@ class IngredientInRecipe(models.Model):
         help_text='Введите количество ингридиента'
     )
 
+    objects = IngredientInRecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = ("Ингредиент в рецепте")
         verbose_name_plural = ("Ингредиенты в рецепте")
@@ -137,6 +327,99 @@ class IngredientInRecipe(models.Model):
         return f'{self.ingredient} в {self.recipe}'
 
 
+class FollowQuerySet(CountedQuerySet):
+    """Подписки, обновляющие ленты подписчиков при пакетной вставке и
+    удалении."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        FeedEntry.objects.backfill(
+            (follow.user_id, follow.author_id) for follow in objs)
+        return objs
+
+    bulk_create.alters_data = True
+
+    def insert_missing(self, objs):
+        rows = super().insert_missing(objs)
+        FeedEntry.objects.backfill(
+            (row['user_id'], row['author_id']) for row in rows)
+        return rows
+
+    insert_missing.alters_data = True
+
+    def delete_rows(self, fields=()):
+        deleted, rows = super().delete_rows(fields)
+        FeedEntry.objects.prune(
+            (row['user_id'], row['author_id']) for row in rows)
+        return deleted, rows
+
+    delete_rows.alters_data = True
+    delete_rows.queryset_only = True
+
+
+class SimilarRecipe(models.Model):
+    """Модель похожих рецептов.
+
+    Строки создаются командой build_similar_recipes и обновляются при
+    изменении ингредиентов и тегов рецепта.
+    """
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт',
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт',
+    )
+    score = models.FloatField(
+        'Сходство',
+    )
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='recipe_similar_unique',
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+
+class SimilarRecipeRefresh(models.Model):
+    """Модель очереди пересчета похожих рецептов.
+
+    Строка добавляется при изменении ингредиентов или тегов рецепта и
+    удаляется командой build_similar_recipes после пересчета.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Рецепт',
+    )
+    created = models.DateTimeField(
+        'Дата добавления в очередь',
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Рецепт в очереди пересчета похожих'
+        verbose_name_plural = 'Очередь пересчета похожих рецептов'
+
+    def __str__(self):
+        return f'Пересчет похожих рецептов для {self.recipe}'
+
+
 class Follow(models.Model):
     """Модель подписок."""
     user = models.ForeignKey(
@@ -156,6 +439,9 @@ class Follow(models.Model):
         auto_now_add=True,
     )
 
+    objects = FollowQuerySet.as_manager()
+    counters = (('author', 'followers_count'), ('user', 'following_count'))
+
     class Meta:
         verbose_name = ("Подписка")
         verbose_name_plural = ("Подписки")
@@ -170,6 +456,213 @@ class Follow(models.Model):
         return f'{self.user} подписан на {self.author}'
 
 
+class FeedEntryQuerySet(models.QuerySet):
+    """Ленты подписок: копии рецептов авторов в лентах их подписчиков.
+
+    Рецепт копируется в ленты после создания (fan-out on write) командой
+    rebuild_feeds --pending, до этого лента читает его из очереди FeedFanOut.
+    Рецепты популярных авторов, у которых установлен feed_pull, не
+    копируются, лента читает их из таблицы рецептов (fan-out on read).
+    """
+
+    def fan_out(self, recipe):
+        """Добавление рецепта в ленты подписчиков автора пачками."""
+        followers = Follow.objects.filter(
+            author_id=recipe.author_id, author__feed_pull=False,
+        ).order_by('pk').values_list('user_id', flat=True)
+        for batch in batched(
+            followers.iterator(chunk_size=settings.FEED_BATCH_SIZE),
+            settings.FEED_BATCH_SIZE,
+        ):
+            self.bulk_create(
+                [
+                    FeedEntry(user_id=user_id, recipe_id=recipe.pk,
+                              author_id=recipe.author_id, date=recipe.date)
+                    for user_id in batch
+                ],
+                ignore_conflicts=True,
+            )
+
+    def backfill(self, follows):
+        """Добавление рецептов авторов в ленты новых подписчиков.
+
+        follows - пары (подписчик, автор). Рецепты читаются одним запросом
+        и вставляются пачками.
+        """
+        followers = {}
+        for user_id, author_id in follows:
+            followers.setdefault(author_id, []).append(user_id)
+        if not followers:
+            return
+        recipes = Recipe.objects.filter(
+            author_id__in=followers, author__feed_pull=False,
+        ).order_by().values_list('pk', 'author_id', 'date')
+        entries = (
+            FeedEntry(user_id=user_id, recipe_id=pk, author_id=author_id,
+                      date=date)
+            for pk, author_id, date in recipes.iterator(
+                chunk_size=settings.FEED_BATCH_SIZE)
+            for user_id in followers[author_id]
+        )
+        for batch in batched(entries, settings.FEED_BATCH_SIZE):
+            self.bulk_create(batch, ignore_conflicts=True)
+
+    def restore(self, author):
+        """Копирование рецептов автора, переставшего быть популярным, в
+        ленты его подписчиков.
+
+        Пока автор был популярным, его рецепты не копировались. Пометка
+        feed_pull снимается в той же транзакции, поэтому до ее фиксации
+        лента продолжает читать рецепты автора из таблицы рецептов.
+        """
+        User.objects.filter(pk=author.pk).update(feed_pull=False)
+        self.backfill(Follow.objects.filter(
+            author=author
+        ).values_list('user_id', 'author_id').iterator(
+            chunk_size=settings.FEED_BATCH_SIZE))
+
+    def prune(self, follows):
+        """Удаление рецептов авторов из лент отписавшихся пользователей.
+
+        follows - пары (подписчик, автор), удаляются одним запросом.
+        """
+        authors = {}
+        for user_id, author_id in follows:
+            authors.setdefault(user_id, []).append(author_id)
+        if not authors:
+            return 0
+        condition = models.Q()
+        for user_id, author_ids in authors.items():
+            condition |= models.Q(user_id=user_id, author_id__in=author_ids)
+        return self.filter(condition).delete()[0]
+
+    def get_page_keys(self, user, size, key=None, newer=False):
+        """Ключи (date, id) не более size рецептов ленты user.
+
+        Рецепты идут от новых к старым после key или, если newer, от старых
+        к новым. Копии в ленте читаются по индексу (user, date, recipe),
+        рецепты популярных авторов - по индексу (author, date, id), еще не
+        скопированные рецепты - из короткой очереди FeedFanOut. Все
+        выборки ограничены size, поэтому стоимость страницы не зависит от
+        ее глубины и числа подписок.
+        """
+        popular = list(Follow.objects.filter(
+            user=user, author__feed_pull=True,
+        ).values_list('author_id', flat=True))
+        lookup = 'gt' if newer else 'lt'
+
+        def get_recipe_keys(recipes):
+            if key is not None:
+                recipes = recipes.filter(
+                    models.Q(**{f'date__{lookup}': key[0]})
+                    | models.Q(date=key[0], **{f'id__{lookup}': key[1]}))
+            order = ('date', 'id') if newer else ('-date', '-id')
+            return list(recipes.order_by(*order).values_list(
+                'date', 'id')[:size])
+
+        entries = self.filter(user=user)
+        if popular:
+            entries = entries.exclude(author_id__in=popular)
+        if key is not None:
+            entries = entries.filter(
+                models.Q(**{f'date__{lookup}': key[0]})
+                | models.Q(date=key[0], **{f'recipe_id__{lookup}': key[1]}))
+        order = ('date', 'recipe_id') if newer else ('-date', '-recipe_id')
+        keys = list(entries.order_by(*order).values_list(
+            'date', 'recipe_id')[:size])
+        if popular:
+            keys += get_recipe_keys(
+                Recipe.objects.filter(author_id__in=popular))
+        keys += get_recipe_keys(Recipe.objects.filter(
+            pk__in=FeedFanOut.objects.values('recipe_id'),
+            author_id__in=Follow.objects.filter(user=user).values(
+                'author_id'),
+        ))
+        return sorted(set(keys), reverse=not newer)[:size]
+
+
+class FeedEntry(models.Model):
+    """Модель записей лент подписок."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    date = models.DateTimeField(
+        'Дата создания рецепта',
+    )
+
+    objects = FeedEntryQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='user_feed_recipe_unique',
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'date', 'recipe'],
+                name='feed_user_date_recipe_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'Рецепт {self.recipe} в ленте {self.user}'
+
+
+class FeedFanOut(models.Model):
+    """Модель очереди копирования новых рецептов в ленты подписчиков.
+
+    Строка добавляется при создании рецепта и удаляется командой
+    rebuild_feeds --pending после копирования.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Рецепт',
+    )
+    created = models.DateTimeField(
+        'Дата добавления в очередь',
+        auto_now_add=True,
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Рецепт в очереди копирования в ленты'
+        verbose_name_plural = 'Очередь копирования рецептов в ленты'
+
+    def __str__(self):
+        return f'Копирование рецепта {self.recipe} в ленты'
+
+
+def with_is_subscribed(queryset, user):
+    """Аннотация is_subscribed пользователей queryset на подписку user."""
+    if user.is_anonymous:
+        return queryset.annotate(is_subscribed=models.Value(
+            False, output_field=models.BooleanField()))
+    return queryset.annotate(is_subscribed=models.Exists(
+        Follow.objects.filter(user=user, author=models.OuterRef('pk'))))
+
+
 class Favorite(models.Model):
     """Модель избранных."""
     user = models.ForeignKey(
@@ -184,6 +677,13 @@ class Favorite(models.Model):
         verbose_name='Рецепт',
         related_name='favorites',
     )
+    date = models.DateTimeField(
+        'Дата добавления в избранное',
+        auto_now_add=True,
+    )
+
+    objects = CountedQuerySet.as_manager()
+    counters = (('recipe', 'favorites_count'),)
 
     class Meta:
         verbose_name = ("Избранное")
@@ -217,6 +717,9 @@ class Cart(models.Model):
         auto_now_add=True,
     )
 
+    objects = CountedQuerySet.as_manager()
+    counters = (('recipe', 'in_carts_count'),)
+
     class Meta:
         verbose_name = ("Список покупок")
         verbose_name_plural = ("Списки покупок")
@@ -229,3 +732,144 @@ class Cart(models.Model):
 
     def __str__(self):
         return f'Список покупок пользователя {self.user}'
+
+
+class RecipeScore(models.Model):
+    """Модель оценок популярности рецептов для сортировки.
+
+    Оценки рассчитываются модулем ranking по добавлениям в избранное и
+    списки покупок с экспоненциальным затуханием. Оценка создается вместе с
+    рецептом, в том числе при пакетной загрузке, и помечается dirty при
+    изменении его добавлений.
+    """
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='score',
+        verbose_name='Рецепт',
+    )
+    popular = models.FloatField(
+        'Популярность',
+    )
+    trending = models.FloatField(
+        'Популярность за последнее время',
+    )
+    dirty = models.BooleanField(
+        'Требует пересчета',
+        default=False,
+    )
+
+    class Meta:
+        verbose_name = 'Оценка рецепта'
+        verbose_name_plural = 'Оценки рецептов'
+        indexes = [
+            models.Index(
+                fields=['-popular', '-recipe'],
+                name='recipe_score_popular_idx',
+            ),
+            models.Index(
+                fields=['-trending', '-recipe'],
+                name='recipe_score_trending_idx',
+            ),
+            models.Index(
+                fields=['recipe'],
+                condition=models.Q(dirty=True),
+                name='recipe_score_dirty_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'Оценка рецепта {self.recipe}'
+
+
+class ShoppingListJob(models.Model):
+    """Модель задач формирования PDF списка покупок."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(
+        primary_key=True,
+        default=uuid.uuid4,
+        editable=False,
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_jobs',
+        verbose_name='Пользователь',
+    )
+    digest = models.CharField(
+        'Хеш содержимого списка',
+        max_length=64,
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=16,
+        choices=STATUSES,
+        default=PENDING,
+    )
+    file = models.FileField(
+        'Файл',
+        upload_to='shopping_lists/',
+        storage=PrivateStorage(),
+        blank=True,
+    )
+    error = models.TextField(
+        'Ошибка',
+        blank=True,
+    )
+    created = models.DateTimeField(
+        'Дата создания задачи',
+        auto_now_add=True,
+    )
+    updated = models.DateTimeField(
+        'Дата изменения задачи',
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = 'Задача формирования списка покупок'
+        verbose_name_plural = 'Задачи формирования списков покупок'
+        ordering = ('created',)
+        indexes = [
+            models.Index(
+                fields=['status', 'created'],
+                name='shopping_list_job_queue_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f'Список покупок {self.user}: {self.get_status_display()}'
+
+
+class TableVersion(models.Model):
+    """Модель версий таблиц для валидаторов HTTP-кеширования."""
+    name = models.CharField(
+        'Таблица',
+        max_length=64,
+        unique=True,
+    )
+    version = models.PositiveBigIntegerField(
+        'Версия',
+        default=0,
+    )
+    updated = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = 'Версия таблицы'
+        verbose_name_plural = 'Версии таблиц'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
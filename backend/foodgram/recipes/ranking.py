@@ -0,0 +1,113 @@
+"""Оценки популярности рецептов с экспоненциальным затуханием.
+
+Оценка - сумма весов событий рецепта: создания, добавлений в избранное и
+списки покупок, каждое из которых затухает вдвое за период полураспада.
+Затухание отсчитывается от общей даты EPOCH: хранится логарифм суммы
+w * exp(rate * (t - EPOCH)), который отличается от логарифма текущей
+оценки на одно и то же для всех рецептов число. Поэтому порядок рецептов
+со временем не меняется, а пересчитывать нужно только рецепты с новыми
+событиями.
+
+Популярность затухает медленно, популярность за последнее время - быстро.
+Создание рецепта - событие с малым весом, поэтому рецепты без добавлений
+упорядочены по дате создания.
+"""
+import math
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+from .models import Cart, Favorite, RecipeScore
+
+EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+RECIPE_WEIGHT = 0.1
+FAVORITE_WEIGHT = 1
+CART_WEIGHT = 2
+HALF_LIVES = {
+    'popular': 'RECIPE_POPULAR_HALF_LIFE_DAYS',
+    'trending': 'RECIPE_TRENDING_HALF_LIFE_DAYS',
+}
+
+
+def get_rates():
+    """Скорости затухания оценок в секунду."""
+    return {
+        name: math.log(2) / (getattr(settings, setting) * 24 * 60 * 60)
+        for name, setting in HALF_LIVES.items()
+    }
+
+
+def get_exponents(date, weight, rates=None):
+    """Логарифмы вкладов события с весом weight в оценки."""
+    seconds = (date - EPOCH).total_seconds()
+    return {
+        name: math.log(weight) + rate * seconds
+        for name, rate in (rates or get_rates()).items()
+    }
+
+
+def get_created_scores(date):
+    """Оценки нового рецепта без добавлений."""
+    return get_exponents(date, RECIPE_WEIGHT)
+
+
+class LogSum:
+    """Логарифм суммы экспонент, накапливаемый без переполнения."""
+
+    def __init__(self):
+        self.top = -math.inf
+        self.total = 0.0
+
+    def add(self, exponent):
+        if exponent > self.top:
+            self.total = self.total * math.exp(self.top - exponent) + 1
+            self.top = exponent
+        else:
+            self.total += math.exp(exponent - self.top)
+
+    @property
+    def value(self):
+        return self.top + math.log(self.total)
+
+
+def get_scores(recipes):
+    """Оценки рецептов по всем их событиям.
+
+    recipes - пары (id, дата создания). События читаются одним запросом
+    на модель и не хранятся в памяти.
+    """
+    rates = get_rates()
+    sums = {pk: {name: LogSum() for name in rates} for pk, _ in recipes}
+
+    def add(pk, date, weight):
+        for name, exponent in get_exponents(date, weight, rates).items():
+            sums[pk][name].add(exponent)
+
+    for pk, date in recipes:
+        add(pk, date, RECIPE_WEIGHT)
+    for model, weight in ((Favorite, FAVORITE_WEIGHT), (Cart, CART_WEIGHT)):
+        for pk, date in model.objects.filter(
+            recipe_id__in=list(sums)
+        ).order_by().values_list('recipe_id', 'date').iterator():
+            add(pk, date, weight)
+    return {
+        pk: {name: value.value for name, value in scores.items()}
+        for pk, scores in sums.items()
+    }
+
+
+def save_scores(recipes):
+    """Пересчет и сохранение оценок рецептов одним запросом.
+
+    recipes - пары (id, дата создания). Отсутствующие оценки создаются,
+    пометка dirty у существующих не меняется.
+    """
+    RecipeScore.objects.bulk_create(
+        [
+            RecipeScore(recipe_id=pk, **scores)
+            for pk, scores in get_scores(recipes).items()
+        ],
+        update_conflicts=True,
+        unique_fields=['recipe_id'],
+        update_fields=[*HALF_LIVES],
+    )
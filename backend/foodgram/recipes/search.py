@@ -0,0 +1,37 @@
+"""Пересчет поисковых векторов рецептов.
+
+Сигналы сохранения рецептов и их ингредиентов пересчитывают вектор сразу.
+Внутри deferred() пересчет откладывается до выхода из блока и выполняется
+одним запросом для всех затронутых рецептов.
+"""
+import threading
+from contextlib import contextmanager
+
+from .models import Recipe
+
+_state = threading.local()
+
+
+def update(recipe_ids):
+    """Пересчет поисковых векторов рецептов recipe_ids."""
+    pending = getattr(_state, 'pending', None)
+    if pending is not None:
+        pending.update(recipe_ids)
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).update_search_vector()
+
+
+@contextmanager
+def deferred():
+    """Один пересчет векторов на все изменения рецептов внутри блока."""
+    if getattr(_state, 'pending', None) is not None:
+        yield
+        return
+    _state.pending = set()
+    try:
+        yield
+        pending = _state.pending
+    finally:
+        _state.pending = None
+    if pending:
+        Recipe.objects.filter(pk__in=pending).update_search_vector()
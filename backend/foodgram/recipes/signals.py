@@ -0,0 +1,268 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import User
+
+from . import (catalog, counters, images, ranking, search, similarity,
+               versions)
+from .models import (Cart, Favorite, FeedEntry, FeedFanOut, Follow,
+                     Ingredient, IngredientInRecipe, Recipe, RecipeScore, Tag,
+                     ingredients_added)
+
+# Поля пользователя в представлении рецептов.
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+
+
+@receiver(connection_created)
+def register_sqlite_functions(connection, **kwargs):
+    """Функция UNICODE_LOWER для поиска рецептов на SQLite."""
+    if connection.vendor == 'sqlite':
+        connection.connection.create_function(
+            'UNICODE_LOWER', 1,
+            lambda value: None if value is None else value.lower(),
+            deterministic=True,
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(instance, raw=False, **kwargs):
+    """Пересчет поискового вектора после сохранения рецепта."""
+    if not raw:
+        search.update([instance.pk])
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def update_ingredient_in_recipe_search_vector(instance, raw=False,
+                                              **kwargs):
+    """Пересчет поискового вектора после изменения ингредиента рецепта."""
+    if not raw:
+        search.update([instance.recipe_id])
+
+
+def is_recipe_deletion(origin):
+    """Удаление вызвано удалением рецепта или набора рецептов."""
+    return isinstance(origin, Recipe) or (
+        getattr(origin, 'model', None) is Recipe)
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+def update_removed_ingredient_search_vector(instance, origin=None, **kwargs):
+    """Пересчет поискового вектора после удаления ингредиента рецепта.
+
+    При удалении самого рецепта вектор не пересчитывается.
+    """
+    if not is_recipe_deletion(origin):
+        search.update([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_search_vector(instance, created, raw=False, **kwargs):
+    """Пересчет поисковых векторов рецептов с переименованным
+    ингредиентом."""
+    if not raw and not created:
+        Recipe.objects.filter(ingredients=instance).update_search_vector()
+
+
+@receiver(post_save, sender=IngredientInRecipe)
+def schedule_similar_on_ingredient_save(instance, raw=False, **kwargs):
+    """Постановка рецепта в очередь пересчета похожих рецептов после
+    изменения его ингредиента."""
+    if not raw:
+        similarity.schedule([instance.recipe_id])
+
+
+@receiver(ingredients_added, sender=IngredientInRecipe)
+def schedule_similar_on_ingredients_added(recipe_ids, **kwargs):
+    """Постановка в очередь рецептов с ингредиентами, вставленными
+    пакетно."""
+    similarity.schedule(recipe_ids)
+
+
+@receiver(post_delete, sender=IngredientInRecipe)
+def schedule_similar_on_ingredient_delete(instance, origin=None, **kwargs):
+    """Постановка рецепта в очередь после удаления его ингредиента.
+
+    Строка очереди удаленного рецепта удаляется вместе с ним.
+    """
+    if not is_recipe_deletion(origin):
+        similarity.schedule([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def schedule_similar_on_tags_change(instance, action, reverse, pk_set,
+                                    **kwargs):
+    """Постановка в очередь рецептов с измененными тегами.
+
+    Рецепты тега, у которого удаляются все рецепты, известны только до
+    удаления.
+    """
+    if reverse and action == 'pre_clear':
+        similarity.schedule(
+            instance.recipes.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove') and pk_set:
+        similarity.schedule(pk_set if reverse else [instance.pk])
+    elif not reverse and action == 'post_clear':
+        similarity.schedule([instance.pk])
+
+
+def generate_image_variants(recipe, name, old_variants):
+    """Создание вариантов изображения name рецепта.
+
+    Если изображение не удалось прочитать или за это время его заменили,
+    варианты создает команда generate_image_variants.
+    """
+    storage = recipe.image.storage
+    try:
+        variants = images.make_variants(name, storage)
+    except (OSError, ValueError):
+        return
+    touched = counters.touch(Recipe)
+    if not Recipe.objects.filter(pk=recipe.pk, image=name).update(
+            image_variants=variants, **touched):
+        images.delete_variants(variants, storage)
+        return
+    images.delete_variants(old_variants, storage)
+    recipe.image_variants = variants
+    for field, value in touched.items():
+        setattr(recipe, field, value)
+
+
+@receiver(post_save, sender=Recipe)
+def update_image_variants(instance, raw=False, **kwargs):
+    """Создание вариантов нового изображения рецепта после фиксации
+    транзакции, чтобы обработка изображения не удерживала ее открытой."""
+    variants = instance.image_variants
+    if raw or not instance.image or variants.get('source') == (
+            instance.image.name):
+        return
+    transaction.on_commit(partial(
+        generate_image_variants, instance, instance.image.name, variants))
+
+
+@receiver(post_save, sender=Recipe)
+def queue_fan_out(instance, created, raw=False, **kwargs):
+    """Постановка нового рецепта в очередь копирования в ленты подписчиков.
+
+    Рецепты из очереди копирует команда rebuild_feeds --pending.
+    """
+    if created and not raw:
+        FeedFanOut.objects.create(recipe=instance)
+
+
+@receiver(post_save, sender=Recipe)
+def create_recipe_score(instance, created, raw=False, **kwargs):
+    """Оценки нового рецепта для сортировки по популярности.
+
+    Добавления в избранное и списки покупок учитывает команда
+    update_recipe_scores.
+    """
+    if created and not raw:
+        RecipeScore.objects.create(
+            recipe=instance, **ranking.get_created_scores(instance.date))
+
+
+@receiver(counters.counters_changed, sender=Favorite)
+@receiver(counters.counters_changed, sender=Cart)
+def mark_recipe_scores(ids, **kwargs):
+    """Пометка оценок рецептов с новыми добавлениями для пересчета."""
+    RecipeScore.objects.filter(
+        recipe_id__in=ids['recipe'], dirty=False).update(dirty=True)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(instance, created, raw=False, **kwargs):
+    """Добавление рецептов автора в ленту нового подписчика."""
+    if created and not raw:
+        FeedEntry.objects.backfill([(instance.user_id, instance.author_id)])
+
+
+@receiver(post_delete, sender=Follow)
+def prune_feed(instance, **kwargs):
+    """Удаление рецептов автора из ленты отписавшегося пользователя.
+
+    Пакетные удаления подписок очищают ленты одним запросом.
+    """
+    if not counters.is_suspended(Follow):
+        FeedEntry.objects.prune([(instance.user_id, instance.author_id)])
+
+
+def increment_counters(sender, instance, created, raw=False, **kwargs):
+    """Увеличение счетчиков связанных объектов при создании строки."""
+    if created and not raw and not counters.is_suspended(sender):
+        counters.change(sender, [instance], 1)
+
+
+def decrement_counters(sender, instance, **kwargs):
+    """Уменьшение счетчиков связанных объектов при удалении строки."""
+    if not counters.is_suspended(sender):
+        counters.change(sender, [instance], -1)
+
+
+for model in (Recipe, Favorite, Cart, Follow):
+    post_save.connect(increment_counters, sender=model)
+    post_delete.connect(decrement_counters, sender=model)
+
+
+@receiver(counters.counters_changed, sender=Follow)
+def mark_popular_authors(ids, **kwargs):
+    """Прекращение копирования рецептов авторов, набравших
+    FEED_FANOUT_MAX_FOLLOWERS подписчиков.
+
+    Обратное переключение выполняет команда rebuild_feeds.
+    """
+    User.objects.filter(
+        pk__in=ids['author'],
+        feed_pull=False,
+        followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).update(feed_pull=True)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def bump_tags_version(**kwargs):
+    """Новая версия тегов для валидаторов HTTP-кеширования."""
+    versions.bump(versions.TAGS)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def bump_ingredients_version(**kwargs):
+    """Новая версия ингредиентов для валидаторов HTTP-кеширования."""
+    versions.bump(versions.INGREDIENTS)
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=IngredientInRecipe)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_catalog(**kwargs):
+    """Сброс кеша ответов после изменения данных каталога.
+
+    Изменения счетчиков избранного, списков покупок и подписок кеш не
+    сбрасывают.
+    """
+    catalog.invalidate_on_commit()
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_catalog_on_author_change(created=False, update_fields=None,
+                                        **kwargs):
+    """Сброс кеша ответов после изменения полей автора в рецептах.
+
+    Новый пользователь еще не автор, а сохранение других полей, например
+    last_login при входе или пароля, представление рецептов не меняет.
+    """
+    if created:
+        return
+    if update_fields is None or AUTHOR_FIELDS & set(update_fields):
+        catalog.invalidate_on_commit()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_catalog_on_tags_change(action, **kwargs):
+    """Сброс кеша ответов после изменения тегов рецепта."""
+    if action.startswith('post_'):
+        catalog.invalidate_on_commit()
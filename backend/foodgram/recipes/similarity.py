@@ -0,0 +1,223 @@
+"""Похожие рецепты по общим ингредиентам и тегам.
+
+Сходство - взвешенная сумма коэффициентов Жаккара множеств ингредиентов и
+тегов. Общими считаются только ингредиенты, которые есть не более чем в
+доле SIMILAR_RECIPES_MAX_DF рецептов: соль не делает рецепты похожими,
+но входит в размер множества ингредиентов рецепта.
+Кандидаты - рецепты хотя бы с одним общим ингредиентом. Лучшие из них по
+ингредиентам, в CANDIDATES_FACTOR раз больше нужного числа, ранжируются
+с учетом тегов.
+
+Для всех рецептов таблица строится командой build_similar_recipes. Рецепт
+с измененными ингредиентами или тегами ставится в очередь сигналами,
+команда build_similar_recipes --pending пересчитывает его функцией refresh.
+Внутри deferred() постановка в очередь откладывается до выхода из блока и
+выполняется одним запросом для всех затронутых рецептов.
+"""
+import heapq
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, OuterRef, Subquery
+
+from .models import (IngredientInRecipe, Recipe, SimilarRecipe,
+                     SimilarRecipeRefresh)
+
+CANDIDATES_FACTOR = 4
+
+_state = threading.local()
+
+
+def get_candidates_count():
+    """Число кандидатов, ранжируемых с учетом тегов."""
+    return settings.SIMILAR_RECIPES_COUNT * CANDIDATES_FACTOR
+
+
+def get_max_df(recipes_count):
+    """Наибольшее число рецептов с ингредиентом, учитываемым в сходстве."""
+    return settings.SIMILAR_RECIPES_MAX_DF * recipes_count
+
+
+def combine(ingredients, tags):
+    """Сходство по коэффициентам Жаккара ингредиентов и тегов.
+
+    Работает и с числами, и с массивами NumPy.
+    """
+    weight = settings.SIMILAR_RECIPES_TAGS_WEIGHT
+    return (1 - weight) * ingredients + weight * tags
+
+
+def jaccard(shared, size, other_size):
+    """Коэффициент Жаккара по размерам множеств и их пересечения."""
+    union = size + other_size - shared
+    return shared / union if union else 0.0
+
+
+def get_ingredient_scores(recipe_id):
+    """Сходство по ингредиентам рецептов с общими ингредиентами."""
+    ingredient_ids = list(IngredientInRecipe.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', flat=True))
+    max_df = get_max_df(Recipe.objects.count())
+    kept = [
+        pk for pk, df in IngredientInRecipe.objects.filter(
+            ingredient_id__in=ingredient_ids
+        ).order_by().values('ingredient_id').annotate(
+            df=Count('id')
+        ).values_list('ingredient_id', 'df')
+        if df <= max_df
+    ]
+    if not kept:
+        return {}
+    sizes = IngredientInRecipe.objects.filter(
+        recipe_id=OuterRef('recipe_id')
+    ).order_by().values('recipe_id').annotate(
+        count=Count('id')).values('count')
+    return {
+        pk: jaccard(shared, len(ingredient_ids), size)
+        for pk, shared, size in IngredientInRecipe.objects.filter(
+            ingredient_id__in=kept
+        ).exclude(
+            recipe_id=recipe_id
+        ).order_by().values('recipe_id').annotate(
+            shared=Count('id'), size=Subquery(sizes)
+        ).values_list('recipe_id', 'shared', 'size')
+    }
+
+
+def get_tags(recipe_ids):
+    """Множества тегов рецептов."""
+    tags = {pk: set() for pk in recipe_ids}
+    for pk, tag_id in Recipe.tags.through.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('recipe_id', 'tag_id'):
+        tags[pk].add(tag_id)
+    return tags
+
+
+@transaction.atomic
+def refresh(recipe_id):
+    """Пересчет похожих рецептов после изменения ингредиентов или тегов.
+
+    Заменяет соседей рецепта, обновляет сходство в списках рецептов, где
+    он уже есть, и добавляет его в списки новых соседей, если он лучше
+    худшего из них. Число запросов не зависит от числа рецептов.
+    """
+    count = settings.SIMILAR_RECIPES_COUNT
+    ingredient_scores = get_ingredient_scores(recipe_id)
+    reverse = list(SimilarRecipe.objects.filter(similar_id=recipe_id))
+    candidates = heapq.nlargest(
+        get_candidates_count(), ingredient_scores,
+        key=ingredient_scores.get)
+    tags = get_tags(
+        {recipe_id, *candidates, *(row.recipe_id for row in reverse)})
+    scores = {
+        pk: combine(ingredient_scores[pk], jaccard(
+            len(tags[recipe_id] & tags[pk]),
+            len(tags[recipe_id]), len(tags[pk])))
+        for pk in {*candidates, *(row.recipe_id for row in reverse)}
+        if pk in ingredient_scores
+    }
+    neighbours = heapq.nlargest(count, candidates, key=scores.get)
+    SimilarRecipe.objects.filter(recipe_id=recipe_id).delete()
+    SimilarRecipe.objects.bulk_create(
+        SimilarRecipe(recipe_id=recipe_id, similar_id=pk, score=scores[pk])
+        for pk in neighbours
+    )
+    SimilarRecipe.objects.filter(pk__in=[
+        row.pk for row in reverse if row.recipe_id not in scores]).delete()
+    reverse = [row for row in reverse if row.recipe_id in scores]
+    for row in reverse:
+        row.score = scores[row.recipe_id]
+    SimilarRecipe.objects.bulk_update(reverse, ['score'])
+    present = {row.recipe_id for row in reverse}
+    lists = {
+        pk: (size, lowest)
+        for pk, size, lowest in SimilarRecipe.objects.filter(
+            recipe_id__in=[pk for pk in neighbours if pk not in present]
+        ).order_by().values('recipe_id').annotate(
+            size=Count('id'), lowest=Min('score')
+        ).values_list('recipe_id', 'size', 'lowest')
+    }
+    added = [
+        pk for pk in neighbours if pk not in present
+        and (pk not in lists or lists[pk][0] < count
+             or lists[pk][1] < scores[pk])
+    ]
+    SimilarRecipe.objects.bulk_create(
+        SimilarRecipe(recipe_id=pk, similar_id=recipe_id, score=scores[pk])
+        for pk in added
+    )
+    full = [pk for pk in added if pk in lists and lists[pk][0] >= count]
+    if full:
+        rows = {}
+        for pk, list_id in SimilarRecipe.objects.filter(
+            recipe_id__in=full
+        ).order_by('score', 'pk').values_list('pk', 'recipe_id'):
+            rows.setdefault(list_id, []).append(pk)
+        SimilarRecipe.objects.filter(pk__in=[
+            pk for ids in rows.values() for pk in ids[:len(ids) - count]
+        ]).delete()
+
+
+def enqueue(recipe_ids):
+    """Постановка рецептов recipe_ids в очередь пересчета похожих рецептов.
+
+    Повторная постановка сдвигает дату в очереди, чтобы полное построение,
+    начатое раньше, не удалило строку.
+    """
+    SimilarRecipeRefresh.objects.bulk_create(
+        [SimilarRecipeRefresh(recipe_id=pk) for pk in recipe_ids],
+        update_conflicts=True,
+        unique_fields=['recipe_id'],
+        update_fields=['created'],
+    )
+
+
+def schedule(recipe_ids):
+    """Постановка рецептов recipe_ids в очередь или в отложенные внутри
+    deferred()."""
+    pending = getattr(_state, 'pending', None)
+    if pending is not None:
+        pending.update(recipe_ids)
+        return
+    enqueue(recipe_ids)
+
+
+@contextmanager
+def deferred():
+    """Одна постановка в очередь на все изменения рецептов внутри блока."""
+    if getattr(_state, 'pending', None) is not None:
+        yield
+        return
+    _state.pending = set()
+    try:
+        yield
+        pending = _state.pending
+    finally:
+        _state.pending = None
+    if pending:
+        enqueue(pending)
+
+
+def refresh_pending(batch_size):
+    """Пересчет похожих рецептов из очереди пачками, возвращает их число.
+
+    Строки пачки блокируются до конца транзакции, заблокированные другими
+    экземплярами команды пропускаются.
+    """
+    refreshed = 0
+    while True:
+        with transaction.atomic():
+            queue = SimilarRecipeRefresh.objects.select_for_update(
+                skip_locked=True).order_by('created')
+            pending = list(
+                queue.values_list('recipe_id', flat=True)[:batch_size])
+            if not pending:
+                return refreshed
+            for recipe_id in pending:
+                refresh(recipe_id)
+            SimilarRecipeRefresh.objects.filter(
+                recipe_id__in=pending).delete()
+        refreshed += len(pending)
@@ -0,0 +1,24 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+
+class PrivateStorage(FileSystemStorage):
+    """Storage in PRIVATE_MEDIA_ROOT for files served only by API views.
+
+    The directory is outside MEDIA_ROOT, so the web server does not serve
+    it, and files have no public URL.
+    """
+
+    @property
+    def base_location(self):
+        return settings.PRIVATE_MEDIA_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    @property
+    def base_url(self):
+        return None
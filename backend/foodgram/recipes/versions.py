@@ -0,0 +1,30 @@
+"""Версии таблиц без столбца даты изменения.
+
+Версия увеличивается в той же транзакции, что и изменение данных, и вместе
+с датой изменения служит валидатором HTTP-кеширования.
+"""
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TableVersion
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+SCORES = 'scores'
+
+
+def bump(name):
+    """Увеличение версии таблицы name."""
+    if not TableVersion.objects.filter(name=name).update(
+        version=F('version') + 1, updated=timezone.now()
+    ):
+        TableVersion.objects.get_or_create(name=name, defaults={'version': 1})
+
+
+def get_versions():
+    """Словарь версий таблиц: имя -> (версия, дата изменения)."""
+    return {
+        name: (version, updated)
+        for name, version, updated in TableVersion.objects.values_list(
+            'name', 'version', 'updated')
+    }
@@ -1,14 +1,17 @@
 from django.contrib import admin
 
+from recipes.admin import LargeTableAdmin
+
 from .models import User
 
 
 @admin.register(User)
-class UserAdmin(admin.ModelAdmin):
+class UserAdmin(LargeTableAdmin):
     """User admin class."""
     list_display = ('pk', 'username', 'first_name', 'last_name', 'email',
-                    'is_superuser', 'is_staff',)
-    search_fields = ('username',)
-    list_filter = ('first_name', 'email',)
+                    'is_superuser', 'is_staff', 'recipes_count',
+                    'followers_count',)
+    search_fields = ('username', 'email',)
+    list_filter = ('is_staff', 'is_superuser', 'is_active',)
     list_editable = ('is_superuser', 'is_staff')
     empty_value_display = '-пусто-'
@@ -0,0 +1,32 @@
+# Generated by Django 4.1.13 on 2026-10-18 21:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Recipes of authors above the threshold were not copied to the feeds.
+def mark_popular_authors(apps, schema_editor):
+    user_model = apps.get_model('users', 'User')
+    user_model.objects.filter(
+        followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).update(feed_pull=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_user_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_pull',
+            field=models.BooleanField(default=False, editable=False, help_text='Устанавливается, когда число подписчиков достигает FEED_FANOUT_MAX_FOLLOWERS, и снимается командой rebuild_feeds, когда оно меньше FEED_FANOUT_MIN_FOLLOWERS', verbose_name='Рецепты читаются лентами из таблицы рецептов'),
+        ),
+        migrations.RunPython(mark_popular_authors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('feed_pull', True)), fields=['followers_count'], name='user_feed_pull_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.13 on 2026-10-18 21:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_user_feed_pull'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='first_name',
+            field=models.CharField(db_index=True, help_text='Введите имя', max_length=50, verbose_name='Имя'),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='last_name',
+            field=models.CharField(blank=True, db_index=True, help_text='Введите фамилию', max_length=50, verbose_name='Фамилия'),
+        ),
+    ]
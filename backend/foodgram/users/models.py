@@ -30,6 +30,7 @@ class User(AbstractUser):
         verbose_name='Имя',
         max_length=50,
         help_text='Введите имя',
+        db_index=True,
         blank=False,
         null=False,
     )
@@ -37,14 +38,50 @@ class User(AbstractUser):
         verbose_name='Фамилия',
         max_length=50,
         help_text='Введите фамилию',
+        db_index=True,
         blank=True,
         null=False,
     )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Число рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков',
+        default=0,
+        editable=False,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок',
+        default=0,
+        editable=False,
+    )
+    feed_pull = models.BooleanField(
+        verbose_name='Рецепты читаются лентами из таблицы рецептов',
+        help_text='Устанавливается, когда число подписчиков достигает '
+                  'FEED_FANOUT_MAX_FOLLOWERS, и снимается командой '
+                  'rebuild_feeds, когда оно меньше '
+                  'FEED_FANOUT_MIN_FOLLOWERS',
+        default=False,
+        editable=False,
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
 
     class Meta:
         ordering = ('id',)
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        indexes = [
+            models.Index(
+                fields=['followers_count'],
+                condition=models.Q(feed_pull=True),
+                name='user_feed_pull_idx',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.first_name} {self.username} {self.last_name}'